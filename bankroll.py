@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bankroll Simulator
+
+Simulates how a starting balance plays out over repeated openings of a case.
+Each opening costs the case price and credits the value of the drop. A path
+stops when it can no longer afford the case (ruin), when it falls to the
+stop-loss balance (stop-loss) or when it reaches the take-profit balance. A
+balance that cannot afford the case counts as ruin even below the stop-loss.
+
+All live paths advance together: each block of openings is drawn as a 2-D
+(paths x openings) array and accumulated with a cumulative sum. Paths that
+stop are dropped from the live set, so finished paths cost nothing.
+"""
+
+import numpy as np
+import pandas as pd
+
+from case_sampling import sample_item_indices
+
+# Maximum number of openings drawn per path in one block
+DEFAULT_BLOCK_SIZE = 64
+
+# Maximum number of openings drawn across all live paths in one block
+DEFAULT_BATCH_SIZE = 4_000_000
+
+# Outcome codes of a path
+RUINED = 0
+TAKE_PROFIT = 1
+STILL_PLAYING = 2
+STOP_LOSS = 3
+
+
+def simulate_bankroll(distribution, starting_balance, num_paths=100000, max_openings=1000,
+                      stop_loss=None, take_profit=None, rng=None,
+                      block_size=DEFAULT_BLOCK_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Simulate balance paths of repeated openings of a case.
+
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        starting_balance (float): Balance each path starts with
+        num_paths (int): Number of paths to simulate
+        max_openings (int): Maximum number of openings per path
+        stop_loss (float, optional): Stop once the balance falls to this level or below
+        take_profit (float, optional): Stop once the balance reaches this level or above
+        rng (Generator, optional): NumPy random generator
+        block_size (int): Maximum number of openings drawn per path in one block
+        batch_size (int): Maximum number of draws held in memory at once
+
+    Returns:
+        dict: Per-path outcome (RUINED, STOP_LOSS, TAKE_PROFIT or STILL_PLAYING), number of
+            openings made and final balance
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    case_price = distribution['case_price']
+    profits = distribution['prices'] - case_price
+
+    take_profit = np.inf if take_profit is None else take_profit
+
+    balances = np.full(num_paths, float(starting_balance))
+    openings = np.zeros(num_paths, dtype=np.int64)
+
+    def outcome(balance):
+        # Outcome of a path stopping at each balance; not affording another case is ruin
+        # even at the stop-loss
+        result = np.where(balance >= take_profit, TAKE_PROFIT, STILL_PLAYING).astype(np.int8)
+        if stop_loss is not None:
+            result[balance <= stop_loss] = STOP_LOSS
+        result[balance < case_price] = RUINED
+        return result
+
+    # Paths may already be stopped before the first opening
+    outcomes = outcome(balances)
+    live = np.flatnonzero(outcomes == STILL_PLAYING)
+
+    step = 0
+    while live.size and step < max_openings:
+        block = max(1, min(block_size, max_openings - step, batch_size // live.size))
+
+        # Balance of every live path after each opening of the block
+        paths = balances[live, None] + np.cumsum(profits[sample_item_indices(distribution, (live.size, block), rng)], axis=1)
+
+        path_outcomes = outcome(paths)
+        stopped = path_outcomes != STILL_PLAYING
+        has_stopped = stopped.any(axis=1)
+        first_stop = np.argmax(stopped, axis=1)
+
+        # Record the paths that stopped during the block
+        done = live[has_stopped]
+        done_at = first_stop[has_stopped]
+        rows = np.flatnonzero(has_stopped)
+        balances[done] = paths[rows, done_at]
+        openings[done] = step + done_at + 1
+        outcomes[done] = path_outcomes[rows, done_at]
+
+        # Carry the others over to the next block
+        still_live = live[~has_stopped]
+        balances[still_live] = paths[~has_stopped, -1]
+        openings[still_live] = step + block
+        live = still_live
+        step += block
+
+    return {
+        'outcomes': outcomes,
+        'openings': openings,
+        'final_balances': balances
+    }
+
+
+def summarize_bankroll(case_name, paths, starting_balance):
+    """
+    Summarize simulated balance paths.
+
+    Args:
+        case_name (str): Name of the case
+        paths (dict): Output of simulate_bankroll
+        starting_balance (float): Balance each path started with
+
+    Returns:
+        dict: Share of each outcome, time to ruin and final balance statistics
+    """
+    outcomes = paths['outcomes']
+    final_balances = paths['final_balances']
+    ruin_times = paths['openings'][outcomes == RUINED]
+
+    def percentile(values, q):
+        return float(np.percentile(values, q)) if len(values) else float('nan')
+
+    return {
+        'Case Name': case_name,
+        'Starting Balance': starting_balance,
+        'Risk of Ruin (%)': float(np.mean(outcomes == RUINED) * 100),
+        'Stop-Loss (%)': float(np.mean(outcomes == STOP_LOSS) * 100),
+        'Take Profit (%)': float(np.mean(outcomes == TAKE_PROFIT) * 100),
+        'Still Playing (%)': float(np.mean(outcomes == STILL_PLAYING) * 100),
+        'Ruin Time P10': percentile(ruin_times, 10),
+        'Ruin Time Median': percentile(ruin_times, 50),
+        'Ruin Time P90': percentile(ruin_times, 90),
+        'Mean Final Balance': float(final_balances.mean()),
+        'Final Balance P5': percentile(final_balances, 5),
+        'Final Balance Median': percentile(final_balances, 50),
+        'Final Balance P95': percentile(final_balances, 95)
+    }
+
+
+def time_to_ruin_histogram(paths, bins=20):
+    """
+    Build the histogram of the number of openings before ruin.
+
+    Args:
+        paths (dict): Output of simulate_bankroll
+        bins (int): Number of histogram bins
+
+    Returns:
+        tuple: (counts, bin_edges) - Number of ruined paths in each bin and the bin edges
+    """
+    ruin_times = paths['openings'][paths['outcomes'] == RUINED]
+    if not len(ruin_times):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.histogram(ruin_times, bins=bins)
+
+
+def bankroll_report(distributions, starting_balance, num_paths=100000, max_openings=1000,
+                    stop_loss=None, take_profit=None, seed=None):
+    """
+    Simulate balance paths for several cases and summarize them.
+
+    Each case gets its own random stream spawned from the seed.
+
+    Args:
+        distributions (list): Distributions of the cases (see case_sampling)
+        starting_balance (float): Balance each path starts with
+        num_paths (int): Number of paths per case
+        max_openings (int): Maximum number of openings per path
+        stop_loss (float, optional): Stop once the balance falls to this level or below
+        take_profit (float, optional): Stop once the balance reaches this level or above
+        seed (int, optional): Seed for the random number generator
+
+    Returns:
+        tuple: (summary_df, histograms) - Summary for each case and the time to ruin
+            histogram of each case (see time_to_ruin_histogram), keyed by case name
+    """
+    summary = []
+    histograms = {}
+    for distribution, case_seed in zip(distributions, np.random.SeedSequence(seed).spawn(len(distributions))):
+        paths = simulate_bankroll(distribution, starting_balance, num_paths, max_openings,
+                                  stop_loss, take_profit, np.random.default_rng(case_seed))
+        summary.append(summarize_bankroll(distribution['case_name'], paths, starting_balance))
+        histograms[distribution['case_name']] = time_to_ruin_histogram(paths)
+
+    return pd.DataFrame(summary), histograms
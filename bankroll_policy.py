@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bankroll Policy Solver
+
+Exact probabilities of reaching a target balance before ruin, by dynamic
+programming over a regular balance grid instead of simulation. Each opening
+costs the case price and credits the value of the drop; a balance that can no
+longer afford the case to open is ruined, and a balance at or above the target
+has won.
+
+The net profit of an opening is discretized on the grid, splitting the
+probability of each item between the two grid points around it so the mean
+is preserved (see payout_distribution). The transition of a case is then the
+same shift kernel at every balance, so one step of the dynamic program for
+every case of the catalog is a batched FFT correlation of the value grid
+with the kernel of each case.
+
+The reach probabilities of a policy solve the linear system x = b + T x,
+where T is the transition between grid points below the target and b the
+probability of jumping to the target. Iterating it one opening at a time
+needs as many steps as the longest games, thousands for cheap cases, so it
+is solved by GMRES with the FFT step as the matrix product instead, which
+converges in a few hundred steps. The optimal policy, the case to open at
+each balance to maximize the chance of reaching the target, is found by
+policy iteration: each evaluated policy is improved by a Bellman step over
+the whole catalog until no balance finds a better case.
+"""
+
+import numpy as np
+import pandas as pd
+
+from payout_distribution import discretize_distribution
+
+# Default number of grid points between a balance of 0 and the target
+DEFAULT_GRID_POINTS = 10000
+
+# Default tolerance of the residual of the reach probabilities
+DEFAULT_TOLERANCE = 1e-10
+
+# Default maximum number of GMRES steps per evaluated policy
+DEFAULT_MAX_ITERATIONS = 10000
+
+# Number of GMRES steps between restarts
+GMRES_RESTART = 100
+
+# Maximum number of improvements of the optimal policy
+MAX_POLICY_ITERATIONS = 100
+
+# Policy of balances that cannot afford any case
+NO_CASE = -1
+
+
+def fft_size(size):
+    """
+    Get the smallest FFT length of at least a given size with only factors 2, 3 and 5.
+
+    Args:
+        size (int): Minimum length
+
+    Returns:
+        int: FFT length
+    """
+    best = 1 << (size - 1).bit_length()
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            best = min(best, power35 << (-(-size // power35) - 1).bit_length())
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def gmres(matvec, b, tolerance=DEFAULT_TOLERANCE, max_iterations=DEFAULT_MAX_ITERATIONS, restart=GMRES_RESTART,
+          initial=None):
+    """
+    Solve a linear system A x = b with restarted GMRES.
+
+    Args:
+        matvec (callable): Function computing A x
+        b (ndarray): Right-hand side
+        tolerance (float): Stop once the norm of the residual b - A x is below this
+        max_iterations (int): Maximum number of products with A
+        restart (int): Number of steps between restarts
+        initial (ndarray, optional): Initial guess of the solution. Defaults to zeros
+
+    Returns:
+        tuple: (x, residual, iterations) - The solution, the norm of its residual and the
+            number of products with A
+    """
+    x = np.zeros_like(b) if initial is None else initial.copy()
+    iterations = 0
+    while True:
+        r = b - matvec(x) if iterations or initial is not None else b.copy()
+        beta = float(np.linalg.norm(r))
+        if beta <= tolerance or iterations >= max_iterations:
+            return x, beta, iterations
+
+        # Arnoldi basis, with the Hessenberg matrix reduced to triangular by Givens rotations
+        basis = [r / beta]
+        hessenberg = np.zeros((restart + 1, restart))
+        cosines = np.zeros(restart)
+        sines = np.zeros(restart)
+        residuals = np.zeros(restart + 1)
+        residuals[0] = beta
+        steps = 0
+        for k in range(min(restart, max_iterations - iterations)):
+            w = matvec(basis[k])
+            iterations += 1
+            for i, vector in enumerate(basis):
+                hessenberg[i, k] = vector @ w
+                w -= hessenberg[i, k] * vector
+            subdiagonal = float(np.linalg.norm(w))
+            hessenberg[k + 1, k] = subdiagonal
+
+            for i in range(k):
+                hessenberg[i, k], hessenberg[i + 1, k] = (
+                    cosines[i] * hessenberg[i, k] + sines[i] * hessenberg[i + 1, k],
+                    -sines[i] * hessenberg[i, k] + cosines[i] * hessenberg[i + 1, k])
+            norm = np.hypot(hessenberg[k, k], hessenberg[k + 1, k])
+            cosines[k], sines[k] = hessenberg[k, k] / norm, hessenberg[k + 1, k] / norm
+            hessenberg[k, k] = norm
+            hessenberg[k + 1, k] = 0.0
+            residuals[k + 1] = -sines[k] * residuals[k]
+            residuals[k] *= cosines[k]
+
+            steps = k + 1
+            # A zero subdiagonal means the basis spans the solution
+            if abs(residuals[k + 1]) <= tolerance or subdiagonal == 0:
+                break
+            basis.append(w / subdiagonal)
+
+        y = np.linalg.solve(hessenberg[:steps, :steps], residuals[:steps])
+        x += np.array(basis[:steps]).T @ y
+
+
+class BankrollSolver:
+    """
+    Reach-target and ruin probabilities over a balance grid for a catalog of cases.
+
+    Cases priced at or above the target can never be opened and are left out.
+
+    Args:
+        distributions (list): Distributions of the cases (see case_sampling)
+        target (float): Target balance
+        grid_points (int): Number of grid points between a balance of 0 and the target
+    """
+
+    def __init__(self, distributions, target, grid_points=DEFAULT_GRID_POINTS):
+        self.target = float(target)
+        self.grid_points = int(grid_points)
+        self.step = self.target / self.grid_points
+        self.balances = np.arange(self.grid_points) * self.step
+        self.distributions = [distribution for distribution in distributions
+                              if 0 < distribution['case_price'] < self.target and len(distribution['prices'])]
+        self.case_names = [distribution['case_name'] for distribution in self.distributions]
+
+        # First grid point that can afford each case (the tolerance absorbs rounding of the step)
+        prices = np.array([distribution['case_price'] for distribution in self.distributions], dtype=np.float64)
+        self.first_states = np.ceil(prices / self.step - 1e-9).astype(np.int64)
+
+        # Kernel of each case: probability of moving by each number of grid points, from
+        # -max(first_states) up to grid_points, where any larger move also reaches the target
+        self.low = -int(self.first_states.max()) if len(self.first_states) else 0
+        length = self.grid_points - self.low + 1
+        kernels = np.zeros((len(self.distributions), length))
+        for row, (distribution, offset) in enumerate(zip(self.distributions, self.first_states)):
+            # Shift the net profits by the case offset so they are non-negative
+            pmf = discretize_distribution({
+                'prices': distribution['prices'] - distribution['case_price'] + offset * self.step,
+                'odds': distribution['odds']
+            }, self.step)
+            positions = np.minimum(np.arange(len(pmf)) - offset - self.low, length - 1)
+            np.add.at(kernels[row], positions, pmf)
+
+        # Values are correlated with the kernels over the grid extended by the kernel length
+        self.extended_size = self.grid_points + length - 1
+        self.fft_size = fft_size(self.extended_size)
+        self.kernel_ffts = np.conj(np.fft.rfft(kernels, self.fft_size))
+
+    def _step(self, values, cases, above=0.0):
+        # Expected value after one opening of each case from every grid point, with the
+        # given value above the target and 0 below a balance of 0
+        extended = np.zeros(values.shape[:-1] + (self.extended_size,))
+        extended[..., -self.low:-self.low + self.grid_points] = values
+        extended[..., -self.low + self.grid_points:] = above
+        transformed = np.fft.rfft(extended, self.fft_size)
+        return np.fft.irfft(self.kernel_ffts[cases] * transformed, self.fft_size)[..., :self.grid_points]
+
+    def affordable(self, cases=None):
+        """
+        Get whether each grid point can afford each case.
+
+        Args:
+            cases (ndarray, optional): Indices of the cases. Defaults to all cases
+
+        Returns:
+            ndarray: (cases x grid points) boolean array
+        """
+        cases = np.arange(len(self.distributions)) if cases is None else cases
+        return np.arange(self.grid_points) >= self.first_states[cases][:, None]
+
+    def transition(self, policy):
+        """
+        Build the opening of the case chosen by a policy at each grid point.
+
+        Args:
+            policy (ndarray): Index of the case to open at each grid point, or NO_CASE to stop
+
+        Returns:
+            callable: Function of the value of each grid point and the value of reaching the
+                target, giving the expected value after one opening (0 where the policy stops)
+        """
+        playing = policy != NO_CASE
+        columns = np.flatnonzero(playing)
+        cases, rows = np.unique(policy[playing], return_inverse=True)
+
+        def step(values, above=0.0):
+            result = np.zeros(self.grid_points)
+            if len(cases):
+                result[playing] = self._step(values, cases, above)[rows, columns]
+            return result
+
+        return step
+
+    def bellman(self, values):
+        """
+        Take one step of the dynamic program over the whole catalog.
+
+        Args:
+            values (ndarray): Probability of reaching the target from each grid point
+
+        Returns:
+            tuple: (step_values, best) - Probability of reaching the target after opening
+                each case from each grid point (-inf where it is not affordable), and the
+                index of the best case at each grid point (NO_CASE if no case is affordable)
+        """
+        step_values = np.where(self.affordable(), self._step(values, np.arange(len(self.distributions)), 1.0),
+                               -np.inf)
+        if not len(step_values):
+            return step_values, np.full(self.grid_points, NO_CASE)
+        best = np.argmax(step_values, axis=0)
+        best[np.isneginf(step_values.max(axis=0))] = NO_CASE
+        return step_values, best
+
+    def evaluate(self, policy, tolerance=DEFAULT_TOLERANCE, max_iterations=DEFAULT_MAX_ITERATIONS, initial=None):
+        """
+        Compute the reach-target and ruin probabilities of a policy.
+
+        Args:
+            policy (ndarray): Index of the case to open at each grid point, or NO_CASE to stop (ruin)
+            tolerance (float): Tolerance of the residual of the reach probabilities
+            max_iterations (int): Maximum number of GMRES steps
+            initial (ndarray, optional): Initial guess of the reach probabilities
+
+        Returns:
+            dict: Probability of reaching the target and of ruin from each grid point, the
+                residual of the solution and the number of GMRES steps
+        """
+        step = self.transition(policy)
+        jump = step(np.zeros(self.grid_points), 1.0)
+        reach, residual, iterations = gmres(lambda x: x - step(x), jump, tolerance, max_iterations,
+                                            initial=initial)
+        reach = np.clip(reach, 0, 1)
+
+        return {
+            'reach': reach,
+            'ruin': 1 - reach,
+            'residual': residual,
+            'iterations': iterations
+        }
+
+    def solve(self, tolerance=DEFAULT_TOLERANCE, max_iterations=DEFAULT_MAX_ITERATIONS):
+        """
+        Find the case to open at each balance that maximizes the chance of reaching the target.
+
+        Args:
+            tolerance (float): Tolerance of the residual of the reach probabilities
+            max_iterations (int): Maximum number of GMRES steps per evaluated policy
+
+        Returns:
+            tuple: (policy, evaluation) - Index of the case to open at each grid point (NO_CASE
+                if no case is affordable) and its evaluation (see evaluate)
+        """
+        # Start from the case most likely to reach the target in one opening
+        policy = self.bellman(np.zeros(self.grid_points))[1]
+        grid = np.arange(self.grid_points)
+        evaluation = None
+        for _ in range(MAX_POLICY_ITERATIONS):
+            # Each policy differs little from the previous one, whose values are a close guess
+            evaluation = self.evaluate(policy, tolerance, max_iterations,
+                                       evaluation['reach'] if evaluation is not None else None)
+            step_values, best = self.bellman(evaluation['reach'])
+
+            # Only switch case where another one is better by more than the tolerance
+            playing = policy != NO_CASE
+            current = np.where(playing, step_values[np.where(playing, policy, 0), grid], -np.inf)
+            improved = (best != NO_CASE) & (step_values.max(axis=0, initial=-np.inf) > current + tolerance * 10)
+            if not improved.any():
+                break
+            policy = np.where(improved, best, policy)
+
+        return policy, evaluation
+
+    def evaluate_cases(self, tolerance=DEFAULT_TOLERANCE, max_iterations=DEFAULT_MAX_ITERATIONS):
+        """
+        Compute the reach-target and ruin probabilities of always opening the same case, for every case.
+
+        Args:
+            tolerance (float): Tolerance of the residual of the reach probabilities
+            max_iterations (int): Maximum number of GMRES steps per case
+
+        Returns:
+            dict: Probabilities of reaching the target and of ruin as (cases x grid points) arrays,
+                and the largest residual
+        """
+        evaluations = [self.evaluate(np.where(affordable, case, NO_CASE), tolerance, max_iterations)
+                       for case, affordable in enumerate(self.affordable())]
+
+        return {
+            'reach': np.array([evaluation['reach'] for evaluation in evaluations]).reshape(-1, self.grid_points),
+            'ruin': np.array([evaluation['ruin'] for evaluation in evaluations]).reshape(-1, self.grid_points),
+            'residual': max((evaluation['residual'] for evaluation in evaluations), default=0.0)
+        }
+
+    def grid_index(self, balance):
+        """
+        Get the grid point of a balance.
+
+        Args:
+            balance (float): Balance
+
+        Returns:
+            int: Index of the nearest grid point below the target
+        """
+        return min(max(int(round(balance / self.step)), 0), self.grid_points - 1)
+
+
+def policy_table(solver, policy, evaluation):
+    """
+    Summarize a policy as the balance ranges over which each case is opened.
+
+    Args:
+        solver (BankrollSolver): The solver of the policy
+        policy (ndarray): Index of the case to open at each grid point
+        evaluation (dict): Output of BankrollSolver.evaluate for the policy
+
+    Returns:
+        DataFrame: Case to open, balance range and reach probability at both ends of each range
+    """
+    changes = np.flatnonzero(np.diff(policy)) + 1
+    starts = np.concatenate([[0], changes])
+    ends = np.concatenate([changes, [len(policy)]]) - 1
+
+    return pd.DataFrame({
+        'From Balance': solver.balances[starts],
+        'To Balance': solver.balances[ends],
+        'Case': [solver.case_names[case] if case != NO_CASE else '(ruined)' for case in policy[starts]],
+        'Reach Target From (%)': evaluation['reach'][starts] * 100,
+        'Reach Target To (%)': evaluation['reach'][ends] * 100
+    })
+
+
+def target_report(distributions, starting_balance, target, grid_points=DEFAULT_GRID_POINTS,
+                  tolerance=DEFAULT_TOLERANCE, max_iterations=DEFAULT_MAX_ITERATIONS, compare_cases=False):
+    """
+    Compute the chance of reaching a target balance before ruin under the optimal policy, and
+    optionally for each case opened on its own.
+
+    The per-case comparison solves one system per case, which takes most of the time on a
+    full catalog, so it is only computed on request.
+
+    Args:
+        distributions (list): Distributions of the cases (see case_sampling)
+        starting_balance (float): Balance to start from
+        target (float): Target balance
+        grid_points (int): Number of grid points between a balance of 0 and the target
+        tolerance (float): Tolerance of the residual of the reach probabilities
+        max_iterations (int): Maximum number of GMRES steps per evaluated policy
+        compare_cases (bool): Also compute the probabilities of always opening each case
+
+    Returns:
+        tuple: (cases_df, policy_df, optimal) - Reach and ruin probabilities of always opening
+            each case (None unless compare_cases), the balance ranges of the optimal policy and
+            the probabilities of the optimal policy from the starting balance, with the number
+            of cases priced below the target
+    """
+    solver = BankrollSolver(distributions, target, grid_points)
+    start = solver.grid_index(starting_balance)
+
+    cases_df = None
+    residual = 0.0
+    if compare_cases:
+        single = solver.evaluate_cases(tolerance, max_iterations)
+        cases_df = pd.DataFrame({
+            'Case Name': solver.case_names,
+            'Case Price': [distribution['case_price'] for distribution in solver.distributions],
+            'Reach Target (%)': single['reach'][:, start] * 100,
+            'Ruin (%)': single['ruin'][:, start] * 100
+        }).sort_values('Reach Target (%)', ascending=False)
+        residual = single['residual']
+
+    policy, evaluation = solver.solve(tolerance, max_iterations)
+    optimal = {
+        'Starting Balance': starting_balance,
+        'Target': target,
+        'Grid Step': solver.step,
+        'Cases': len(solver.case_names),
+        'First Case': solver.case_names[policy[start]] if policy[start] != NO_CASE else None,
+        'Reach Target (%)': float(evaluation['reach'][start] * 100),
+        'Ruin (%)': float(evaluation['ruin'][start] * 100),
+        'Residual': max(residual, evaluation['residual'])
+    }
+
+    return cases_df, policy_table(solver, policy, evaluation), optimal
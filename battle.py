@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Case Battle Simulator
+
+Simulates case battles: every player (seat) opens the same lineup of cases,
+paying the price of every case, and the winner takes all the items dropped in
+the battle. Rule variants:
+- highest: the seat with the highest total value wins
+- lowest: the seat with the lowest total value wins
+Seats tied for the win split the items' value equally.
+
+Battles are simulated in blocks: each case of the lineup is drawn for every
+seat of every battle of the block at once, as a (battles x seats) array, and
+added to the seat totals, so millions of battles cost a few array operations
+per case. Some cases (casebattle_only) can only be opened in battles.
+"""
+
+import numpy as np
+import pandas as pd
+
+from case_sampling import sample_item_indices
+
+# Rule variants
+BATTLE_RULES = ('highest', 'lowest')
+
+# Default number of battles to simulate
+DEFAULT_NUM_BATTLES = 1_000_000
+
+# Maximum number of openings drawn across all battles of a block
+DEFAULT_BATCH_SIZE = 4_000_000
+
+
+def simulate_battles(distributions, num_players=2, num_battles=DEFAULT_NUM_BATTLES, rule='highest', rng=None,
+                     batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Simulate battles over a lineup of cases.
+
+    Args:
+        distributions (list): Distribution of each case of the lineup, in order (see case_sampling)
+        num_players (int): Number of seats of the battle
+        num_battles (int): Number of battles to simulate
+        rule (str): Rule variant deciding the winner (see BATTLE_RULES)
+        rng (Generator, optional): NumPy random generator
+        batch_size (int): Maximum number of openings drawn at once
+
+    Returns:
+        dict: Cost of a seat, and whether each seat of each battle won and its payout,
+            as (battles x seats) arrays (payouts in float32)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    cost = float(sum(distribution['case_price'] for distribution in distributions))
+    winners = np.empty((num_battles, num_players), dtype=bool)
+    payouts = np.empty((num_battles, num_players), dtype=np.float32)
+
+    block = max(1, batch_size // max(num_players * len(distributions), 1))
+    for start in range(0, num_battles, block):
+        size = min(block, num_battles - start)
+
+        # Total value of the drops of every seat, one case of the lineup at a time
+        block_totals = np.zeros((size, num_players))
+        for distribution in distributions:
+            block_totals += np.take(distribution['prices'], sample_item_indices(distribution, (size, num_players), rng))
+
+        # The winning seats share everything dropped in the battle
+        best = block_totals.max(axis=1) if rule == 'highest' else block_totals.min(axis=1)
+        block_winners = block_totals == best[:, None]
+        pot = block_totals.sum(axis=1)
+        winners[start:start + size] = block_winners
+        payouts[start:start + size] = block_winners * (pot / block_winners.sum(axis=1))[:, None]
+
+    return {
+        'cost': cost,
+        'winners': winners,
+        'payouts': payouts
+    }
+
+
+def summarize_battles(lineup, battles, rule):
+    """
+    Summarize simulated battles over all seats, which are interchangeable.
+
+    Args:
+        lineup (list): Names of the cases of the lineup
+        battles (dict): Output of simulate_battles
+        rule (str): Rule variant of the battles
+
+    Returns:
+        dict: Win probability, expected net return and payout statistics of a seat
+    """
+    payouts = battles['payouts']
+    cost = battles['cost']
+    num_players = payouts.shape[1]
+    net = payouts.astype(np.float64) - cost
+
+    # A seat tied for the win counts as the matching fraction of a win
+    wins = battles['winners']
+    win_share = (wins / wins.sum(axis=1, keepdims=True)).mean()
+
+    return {
+        'Lineup': ' + '.join(lineup),
+        'Players': num_players,
+        'Rule': rule,
+        'Seat Cost': cost,
+        'Win Probability (%)': float(win_share * 100),
+        'Mean Payout': float(payouts.mean(dtype=np.float64)),
+        'Expected Net Return': float(net.mean()),
+        'ROI (%)': float(net.mean() / cost * 100) if cost else float('nan'),
+        'Profit Probability (%)': float((net > 0).mean() * 100),
+        'Net Return Std': float(net.std()),
+        'Winning Payout Median': float(np.median(payouts[wins])) if wins.any() else float('nan'),
+        'Winning Payout P95': float(np.percentile(payouts[wins], 95)) if wins.any() else float('nan')
+    }
+
+
+def seat_summary(battles):
+    """
+    Summarize simulated battles seat by seat.
+
+    Args:
+        battles (dict): Output of simulate_battles
+
+    Returns:
+        DataFrame: Win probability and expected net return of each seat
+    """
+    payouts = battles['payouts']
+    wins = battles['winners']
+    win_share = wins / wins.sum(axis=1, keepdims=True)
+    net = payouts.astype(np.float64) - battles['cost']
+
+    return pd.DataFrame({
+        'Seat': np.arange(1, payouts.shape[1] + 1),
+        'Win Probability (%)': win_share.mean(axis=0) * 100,
+        'Expected Net Return': net.mean(axis=0),
+        'Profit Probability (%)': (net > 0).mean(axis=0) * 100
+    })
+
+
+def payout_histogram(battles, bins=20):
+    """
+    Build the histogram of the payouts of the winning seats.
+
+    Args:
+        battles (dict): Output of simulate_battles
+        bins (int): Number of histogram bins
+
+    Returns:
+        tuple: (counts, bin_edges, losing) - Number of winning payouts in each bin, the bin
+            edges and the number of losing seats, whose payout is 0
+    """
+    payouts = battles['payouts']
+    won = payouts[battles['winners']]
+    losing = int(payouts.size - won.size)
+    if not won.size:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), losing
+    counts, edges = np.histogram(won, bins=bins)
+    return counts, edges, losing
+
+
+def battle_report(lineups, num_players=2, num_battles=DEFAULT_NUM_BATTLES, rule='highest', seed=None):
+    """
+    Simulate battles over several lineups and summarize them.
+
+    Each lineup gets its own random stream spawned from the seed, and is summarized as soon
+    as it is simulated so memory does not grow with the number of lineups.
+
+    Args:
+        lineups (list): Each lineup as a list of case distributions (see case_sampling)
+        num_players (int): Number of seats of the battles
+        num_battles (int): Number of battles per lineup
+        rule (str): Rule variant deciding the winner (see BATTLE_RULES)
+        seed (int, optional): Seed for the random number generator
+
+    Returns:
+        tuple: (summary_df, battles) - Summary of each lineup, and the output of simulate_battles
+            when a single lineup is given (None otherwise)
+    """
+    summary = []
+    results = None
+    for distributions, lineup_seed in zip(lineups, np.random.SeedSequence(seed).spawn(len(lineups))):
+        battles = simulate_battles(distributions, num_players, num_battles, rule, np.random.default_rng(lineup_seed))
+        summary.append(summarize_battles([distribution['case_name'] for distribution in distributions],
+                                         battles, rule))
+        if len(lineups) == 1:
+            results = battles
+
+    return pd.DataFrame(summary), results
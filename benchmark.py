@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Suite
+
+Runs each stage of the pipeline against a synthetic dataset (see
+synthetic_data.py) and records its run time and peak memory:
+- create_case_contents_csv: flatten the combined JSON into the CSV dataset
+- load_data: read both CSVs
+- calculate_ev_metrics and calculate_risk_metrics: metrics of every case
+- simulate_case_opening: openings of the most expensive case
+
+Run times are the best of several repeats. Peak memory is measured in a
+separate run with tracemalloc, which tracks Python and NumPy allocations.
+Each stage also returns a fingerprint of its result (row count, sum of a
+metric, ...), so a change in results is reported next to a change in speed.
+
+Results are compared with a stored baseline of the same scale. A stage is
+flagged when it is slower or uses more memory than the baseline by more than
+the tolerance, or when its fingerprint differs.
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from case_simulator import calculate_ev_metrics, calculate_risk_metrics, load_data, simulate_case_opening
+from create_case_contents_csv import create_case_contents_csv
+from synthetic_data import generate_dataset
+
+# Default location of the synthetic datasets, one directory per scale
+BENCHMARK_DIR = 'data/benchmark'
+
+# Default location of the stored baselines
+BASELINE_FILE = 'data/benchmark_baseline.json'
+
+# Default settings
+DEFAULT_NUM_CASES = 1000
+DEFAULT_REPEAT = 3
+DEFAULT_OPENINGS = 1_000_000
+DEFAULT_TOLERANCE = 0.2
+
+# Relative tolerance of result fingerprints
+FINGERPRINT_RTOL = 1e-9
+
+
+def measure(func, repeat=DEFAULT_REPEAT):
+    """
+    Measure the run time and peak memory of a function.
+
+    Output printed by the function is discarded.
+
+    Args:
+        func (callable): Function to measure, returning a fingerprint of its result
+        repeat (int): Number of timed runs
+
+    Returns:
+        dict: Best run time in seconds, peak traced memory in bytes and fingerprint
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        times = []
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            fingerprint = func()
+            times.append(time.perf_counter() - start)
+
+        # Tracing slows allocations down, so memory is measured in its own run
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {'seconds': min(times), 'peak_bytes': peak, 'fingerprint': fingerprint}
+
+
+def run_benchmarks(num_cases=DEFAULT_NUM_CASES, repeat=DEFAULT_REPEAT, num_openings=DEFAULT_OPENINGS,
+                   data_dir=BENCHMARK_DIR, seed=0, regenerate=False):
+    """
+    Run every stage of the pipeline against a synthetic dataset.
+
+    The dataset is generated on first use and reused afterwards.
+
+    Args:
+        num_cases (int): Number of cases of the synthetic dataset
+        repeat (int): Number of timed runs per stage
+        num_openings (int): Number of openings simulated
+        data_dir (str): Directory of the synthetic datasets
+        seed (int): Seed of the synthetic dataset and of the simulation
+        regenerate (bool): Generate the dataset again even if it exists
+
+    Returns:
+        dict: Measurements of each stage (see measure), keyed by stage name
+    """
+    output_dir = os.path.join(data_dir, f'{num_cases}-{seed}')
+    paths = {
+        'cases_csv': os.path.join(output_dir, 'cases.csv'),
+        'case_contents_json': os.path.join(output_dir, 'case_contents.json')
+    }
+    if regenerate or not all(os.path.exists(path) for path in paths.values()):
+        print(f"Generating a synthetic dataset of {num_cases} cases in {output_dir}...")
+        paths = generate_dataset(num_cases, output_dir, seed, flatten=False)
+    case_contents_csv = os.path.join(output_dir, 'case_contents_dataset.csv')
+
+    results = {}
+
+    def run(stage, func):
+        print(f"Running {stage}...")
+        results[stage] = measure(func, repeat)
+
+    def flatten():
+        create_case_contents_csv(paths['case_contents_json'], case_contents_csv)
+        return os.path.getsize(case_contents_csv)
+
+    run('create_case_contents_csv', flatten)
+
+    def load():
+        cases_df, case_contents_df = load_data(paths['cases_csv'], case_contents_csv)
+        return len(case_contents_df)
+
+    run('load_data', load)
+
+    cases_df, case_contents_df = load_data(paths['cases_csv'], case_contents_csv)
+    run('calculate_ev_metrics',
+        lambda: float(calculate_ev_metrics(cases_df, case_contents_df)['Expected Value'].sum()))
+    run('calculate_risk_metrics',
+        lambda: float(calculate_risk_metrics(cases_df, case_contents_df)['Standard Deviation'].sum()))
+
+    case_name = cases_df.loc[cases_df['price'].idxmax(), 'name']
+    run('simulate_case_opening',
+        lambda: simulate_case_opening(case_name, cases_df, case_contents_df, num_openings, seed=seed)['total_value'])
+
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare benchmark results with a baseline.
+
+    Args:
+        results (dict): Output of run_benchmarks
+        baseline (dict): Stored results of the same scale, or None
+        tolerance (float): Allowed relative increase of run time and peak memory
+
+    Returns:
+        tuple: (report_df, regressions) - One row per stage, and the names of the
+            stages that regressed or whose result changed
+    """
+    rows = []
+    regressions = []
+    for stage, result in results.items():
+        row = {
+            'Stage': stage,
+            'Seconds': result['seconds'],
+            'Peak MB': result['peak_bytes'] / 2**20
+        }
+        status = 'ok'
+        previous = (baseline or {}).get(stage)
+        if previous:
+            time_change = result['seconds'] / previous['seconds'] - 1
+            memory_change = result['peak_bytes'] / previous['peak_bytes'] - 1 if previous['peak_bytes'] else 0.0
+            row.update({
+                'Baseline Seconds': previous['seconds'],
+                'Time Change (%)': time_change * 100,
+                'Baseline Peak MB': previous['peak_bytes'] / 2**20,
+                'Memory Change (%)': memory_change * 100
+            })
+            if not np.isclose(result['fingerprint'], previous['fingerprint'], rtol=FINGERPRINT_RTOL, atol=0):
+                status = 'RESULT CHANGED'
+            elif time_change > tolerance or memory_change > tolerance:
+                status = 'REGRESSION'
+        else:
+            status = 'no baseline'
+        row['Status'] = status
+        if status in ('RESULT CHANGED', 'REGRESSION'):
+            regressions.append(stage)
+        rows.append(row)
+
+    return pd.DataFrame(rows), regressions
+
+
+def load_baselines(baseline_file=BASELINE_FILE):
+    """
+    Load the stored baselines.
+
+    Args:
+        baseline_file (str): Path of the baseline file
+
+    Returns:
+        dict: Baselines keyed by scale ('{num_cases}-{seed}'), empty if there are none
+    """
+    try:
+        with open(baseline_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_baseline(results, scale, baseline_file=BASELINE_FILE, num_openings=DEFAULT_OPENINGS):
+    """
+    Store benchmark results as the baseline of their scale.
+
+    Args:
+        results (dict): Output of run_benchmarks
+        scale (str): Scale of the results ('{num_cases}-{seed}')
+        baseline_file (str): Path of the baseline file
+        num_openings (int): Number of openings simulated
+    """
+    baselines = load_baselines(baseline_file)
+    baselines[scale] = {
+        'stages': results,
+        'num_openings': num_openings,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'saved_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    os.makedirs(os.path.dirname(baseline_file) or '.', exist_ok=True)
+    with open(baseline_file, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline against a synthetic dataset')
+    parser.add_argument('--cases', type=int, default=DEFAULT_NUM_CASES, help='Number of cases (e.g. 100 to 100000)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Number of timed runs per stage')
+    parser.add_argument('--openings', type=int, default=DEFAULT_OPENINGS, help='Number of openings simulated')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic dataset and of the simulation')
+    parser.add_argument('--data-dir', default=BENCHMARK_DIR, help='Directory of the synthetic datasets')
+    parser.add_argument('--regenerate', action='store_true', help='Generate the synthetic dataset again')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative increase of run time and peak memory (0.2 = 20%%)')
+    parser.add_argument('--output', help='Save the results to a JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.cases, args.repeat, args.openings, args.data_dir, args.seed, args.regenerate)
+    scale = f'{args.cases}-{args.seed}'
+
+    baseline = load_baselines(args.baseline).get(scale)
+    if baseline and baseline.get('num_openings') != args.openings:
+        print(f"Warning: the baseline simulated {baseline.get('num_openings')} openings, not {args.openings}")
+        baseline = None
+    report_df, regressions = compare_with_baseline(results, baseline['stages'] if baseline else None, args.tolerance)
+
+    print(f"\n=== Benchmark ({args.cases} cases, seed {args.seed}) ===")
+    print(tabulate(report_df, headers='keys', tablefmt='grid', floatfmt='.3f', showindex=False))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.save_baseline:
+        save_baseline(results, scale, args.baseline, args.openings)
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Case Sampling Engine
+
+NumPy-backed sampling of case openings. Each case's drop distribution is built
+once as an alias table (Vose's method), so every opening costs one random
+integer, one uniform draw and one comparison, whatever the number of items.
+Openings are drawn in fixed-size batches to keep memory use flat.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Number of openings drawn per batch
+DEFAULT_BATCH_SIZE = 1_000_000
+
+
+def build_case_distribution(case_name, cases_df, case_contents_df):
+    """
+    Build the drop distribution of a case.
+
+    Args:
+        case_name (str): Name of the case
+        cases_df (DataFrame): DataFrame containing case data
+        case_contents_df (DataFrame): DataFrame containing case contents data
+
+    Returns:
+        dict: Distribution of the case (item names, prices, normalized odds,
+            alias table and case price), or None if the case is not found
+    """
+    case_items = case_contents_df[case_contents_df['case_name'] == case_name]
+
+    if case_items.empty:
+        return None
+
+    # Get case price
+    case_price = cases_df[cases_df['name'] == case_name]['price'].values[0] if case_name in cases_df['name'].values else 0
+
+    # Only keep items with both odds and price
+    case_items = case_items[case_items['odds'].notna() & case_items['sub_steam_price_en'].notna()]
+
+    items = (case_items['weapon_name'].astype(str) + ' | ' + case_items['skin_name'].astype(str)
+             + ' (' + case_items['sub_steam_short_exterior'].astype(str) + ')').tolist()
+
+    return make_distribution(case_name, case_price, items,
+                             case_items['odds'].to_numpy(dtype=np.float64),
+                             case_items['sub_steam_price_en'].to_numpy(dtype=np.float64))
+
+
+def make_distribution(case_name, case_price, items, odds, prices):
+    """
+    Create a distribution from raw item odds and prices.
+
+    Args:
+        case_name (str): Name of the case
+        case_price (float): Price of the case
+        items (list): Display names of the items
+        odds (ndarray): Odds of each item (any scale, normalized here)
+        prices (ndarray): Price of each item
+
+    Returns:
+        dict: Distribution of the case
+    """
+    odds = np.asarray(odds, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+
+    # Normalize the odds so they sum to 1
+    odds_sum = odds.sum()
+    if odds_sum > 0:
+        odds = odds / odds_sum
+
+    alias_prob, alias_index = build_alias_table(odds)
+
+    return {
+        'case_name': case_name,
+        'case_price': float(case_price) if pd.notna(case_price) else 0.0,
+        'items': list(items),
+        'odds': odds,
+        'prices': prices,
+        'alias_prob': alias_prob,
+        'alias_index': alias_index
+    }
+
+
+def build_alias_table(odds):
+    """
+    Build an alias table for a discrete distribution using Vose's method.
+
+    Args:
+        odds (ndarray): Normalized odds of each item
+
+    Returns:
+        tuple: (alias_prob, alias_index) - Probability of keeping each column
+            and the item each column falls back to
+    """
+    n = len(odds)
+    alias_prob = np.ones(n, dtype=np.float64)
+    alias_index = np.arange(n, dtype=np.min_scalar_type(max(n - 1, 0)))
+
+    scaled = odds * n
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        alias_prob[s] = scaled[s]
+        alias_index[s] = l
+        scaled[l] = (scaled[l] + scaled[s]) - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+
+    # Anything left over is 1 up to floating-point error
+    return alias_prob, alias_index
+
+
+def index_dtype(distribution):
+    """
+    Get the smallest integer dtype able to hold the item indices of a distribution.
+
+    Args:
+        distribution (dict): Distribution of the case
+
+    Returns:
+        dtype: NumPy integer dtype
+    """
+    return np.min_scalar_type(max(len(distribution['items']) - 1, 0))
+
+
+def iter_sample_batches(distribution, num_openings, batch_size=DEFAULT_BATCH_SIZE, rng=None):
+    """
+    Draw case openings in fixed-size batches.
+
+    Args:
+        distribution (dict): Distribution of the case
+        num_openings (int): Number of openings to draw
+        batch_size (int): Maximum number of openings per batch
+        rng (Generator, optional): NumPy random generator
+
+    Yields:
+        ndarray: Item indices drawn for each batch
+
+    Raises:
+        ValueError: If the batch size is not positive
+    """
+    if batch_size <= 0:
+        raise ValueError(f"The batch size must be positive, got {batch_size}")
+    if rng is None:
+        rng = np.random.default_rng()
+
+    remaining = num_openings
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        yield sample_item_indices(distribution, size, rng)
+        remaining -= size
+
+
+def sample_item_indices(distribution, size, rng):
+    """
+    Draw item indices from the alias table of a distribution.
+
+    Args:
+        distribution (dict): Distribution of the case
+        size (int or tuple): Shape of the array of draws
+        rng (Generator): NumPy random generator
+
+    Returns:
+        ndarray: Item indices drawn
+    """
+    alias_prob = distribution['alias_prob']
+
+    # Pick a column uniformly, then keep it or take its alias
+    columns = rng.integers(0, len(alias_prob), size, dtype=index_dtype(distribution))
+    keep = rng.random(size) < alias_prob[columns]
+    return np.where(keep, columns, distribution['alias_index'][columns])
+
+
+def sample_case_openings(distribution, num_openings, batch_size=DEFAULT_BATCH_SIZE, rng=None):
+    """
+    Draw case openings and return the results as arrays.
+
+    Args:
+        distribution (dict): Distribution of the case
+        num_openings (int): Number of openings to draw
+        batch_size (int): Maximum number of openings per batch
+        rng (Generator, optional): NumPy random generator
+
+    Returns:
+        tuple: (item_indices, values) - Arrays with the index and value of each drop
+    """
+    item_indices = np.empty(num_openings, dtype=index_dtype(distribution))
+
+    start = 0
+    for batch in iter_sample_batches(distribution, num_openings, batch_size, rng):
+        item_indices[start:start + len(batch)] = batch
+        start += len(batch)
+
+    return item_indices, distribution['prices'][item_indices]
+
+
+def build_all_distributions(cases_df, case_contents_df):
+    """
+    Build the drop distribution of every case in a single grouped pass.
+
+    Args:
+        cases_df (DataFrame): DataFrame containing case data
+        case_contents_df (DataFrame): DataFrame containing case contents data
+
+    Returns:
+        list: Distributions in the order cases first appear in case_contents_df
+    """
+    case_prices = cases_df.drop_duplicates('name').set_index('name')['price']
+
+    # Only keep items with both odds and price
+    valid = case_contents_df[case_contents_df['odds'].notna() & case_contents_df['sub_steam_price_en'].notna()]
+    labels = (valid['weapon_name'].astype(str) + ' | ' + valid['skin_name'].astype(str)
+              + ' (' + valid['sub_steam_short_exterior'].astype(str) + ')')
+
+    distributions = []
+    for case_name, case_items in valid.groupby('case_name', sort=False):
+        distributions.append(make_distribution(case_name, case_prices.get(case_name, 0),
+                                               labels.loc[case_items.index].tolist(),
+                                               case_items['odds'].to_numpy(dtype=np.float64),
+                                               case_items['sub_steam_price_en'].to_numpy(dtype=np.float64)))
+
+    return distributions
+
+
+def count_case_openings(distribution, num_openings, batch_size=DEFAULT_BATCH_SIZE, rng=None):
+    """
+    Draw case openings and only keep how many times each item dropped.
+
+    Args:
+        distribution (dict): Distribution of the case
+        num_openings (int): Number of openings to draw
+        batch_size (int): Maximum number of openings per batch
+        rng (Generator, optional): NumPy random generator
+
+    Returns:
+        ndarray: Number of drops of each item
+    """
+    counts = np.zeros(len(distribution['items']), dtype=np.int64)
+    for batch in iter_sample_batches(distribution, num_openings, batch_size, rng):
+        counts += np.bincount(batch, minlength=len(counts))
+    return counts
+
+
+def count_openings_worker(tasks):
+    """
+    Process pool worker running a list of counting tasks.
+
+    Args:
+        tasks (list): List of (task_id, distribution, num_openings, seed_sequence, batch_size) tuples
+
+    Returns:
+        list: List of (task_id, counts) tuples
+    """
+    return [(task_id, count_case_openings(distribution, num_openings, batch_size,
+                                          np.random.default_rng(seed_sequence)))
+            for task_id, distribution, num_openings, seed_sequence, batch_size in tasks]
@@ -13,70 +13,166 @@ import pandas as pd
 import numpy as np
 import json
 import os
-import random
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
 from tabulate import tabulate
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-def load_data():
+from case_store import CASE_CONTENTS_CSV, CASES_CSV, load_case_distribution, load_case_frames, open_case_store
+from bankroll import bankroll_report
+from bankroll_policy import DEFAULT_GRID_POINTS, DEFAULT_TOLERANCE, target_report
+from battle import BATTLE_RULES, DEFAULT_NUM_BATTLES, battle_report, payout_histogram, seat_summary
+from instrumentation import add_profile_arguments, increment, report_profiling, stage, start_profiling
+from metrics_cache import open_metrics_cache
+from payout_distribution import n_opening_risk
+from price_scenarios import (DEFAULT_NOISE_SIGMA, DEFAULT_NUM_SCENARIOS, DEFAULT_RARITY_SIGMA, DEFAULT_TOP_K,
+                             SCENARIO_KINDS, bootstrap_price_changes, build_scenario_inputs, scenario_ev_ratios,
+                             summarize_scenarios)
+from streaming_stats import RunningStats, quantiles_from_counts
+from simulation_plots import DEFAULT_CURVE_POINTS, CumulativeCurve, binned_kde, profit_histogram
+from wear_simulation import DEFAULT_PREMIUM_POWER, WearStats, build_wear_model, make_price_curve
+from upgrade_analysis import (DEFAULT_CHANCES, DEFAULT_HOUSE_EDGE, DIRECTIONS, UPGRADE_RANKINGS,
+                              build_item_price_table, chain_case_upgrade, sweep_upgrades)
+from case_sampling import (DEFAULT_BATCH_SIZE, build_all_distributions, build_case_distribution,
+                           count_openings_worker, index_dtype, iter_sample_batches)
+
+# Maximum number of openings of a single case simulated by one worker task
+SIMULATION_TASK_SIZE = 10_000_000
+
+# Recommendation lists of each player type
+RECOMMENDATION_TYPES = {
+    'profit': 'Profit-Focused',
+    'risk-averse': 'Risk-Averse',
+    'high-risk': 'High-Risk',
+    'budget': 'Budget'
+}
+
+def load_cases(cases_csv=CASES_CSV):
+    """
+    Load the cases data file.
+    
+    Args:
+        cases_csv (str): Path of the cases CSV
+    
+    Returns:
+        DataFrame: DataFrame containing case data, or None if the file is missing
+    """
+    if not os.path.exists(cases_csv):
+        print(f"Error: {cases_csv} not found. Please run hellcase_api.py first.")
+        return None
+    
+    with stage('load_data'):
+        cases_df = pd.read_csv(cases_csv)
+    increment('rows_loaded', len(cases_df))
+    return cases_df
+
+def load_data(cases_csv=CASES_CSV, case_contents_csv=CASE_CONTENTS_CSV):
     """
     Load the necessary data files for analysis and simulation.
     
+    Args:
+        cases_csv (str): Path of the cases CSV
+        case_contents_csv (str): Path of the case contents CSV
+    
     Returns:
         tuple: (cases_df, case_contents_df) - DataFrames containing case data and case contents
     """
     # Check if data files exist
-    if not os.path.exists('data/cases.csv'):
-        print("Error: data/cases.csv not found. Please run hellcase_api.py first.")
+    if not os.path.exists(cases_csv):
+        print(f"Error: {cases_csv} not found. Please run hellcase_api.py first.")
         return None, None
     
-    if not os.path.exists('data/case_contents_dataset.csv'):
-        print("Error: data/case_contents_dataset.csv not found. Please run create_case_contents_csv.py first.")
+    if not os.path.exists(case_contents_csv):
+        print(f"Error: {case_contents_csv} not found. Please run create_case_contents_csv.py first.")
         return None, None
     
     # Load data
-    cases_df = pd.read_csv('data/cases.csv')
-    case_contents_df = pd.read_csv('data/case_contents_dataset.csv')
+    with stage('load_data'):
+        cases_df = pd.read_csv(cases_csv)
+        case_contents_df = pd.read_csv(case_contents_csv)
+    increment('rows_loaded', len(cases_df) + len(case_contents_df))
     
     return cases_df, case_contents_df
 
-def calculate_ev_metrics(cases_df, case_contents_df):
+def compute_case_metrics(cases_df, case_contents_df):
     """
-    Calculate expected value metrics for all cases.
+    Calculate the expected value and risk metrics of every case in one grouped pass.
+    
+    Case prices are joined once through an index, and every metric is computed
+    from the same per-row arrays grouped by case name.
     
     Args:
         cases_df (DataFrame): DataFrame containing case data
         case_contents_df (DataFrame): DataFrame containing case contents data
     
     Returns:
-        DataFrame: DataFrame with expected value metrics for each case
+        DataFrame: Metrics indexed by case name, in the order cases first appear in case_contents_df
     """
-    case_ev = []
-    
-    for case_name in case_contents_df['case_name'].unique():
-        case_items = case_contents_df[case_contents_df['case_name'] == case_name]
+    with stage('compute_metrics'):
+        case_names = case_contents_df['case_name']
+        odds = case_contents_df['odds']
+        prices = case_contents_df['sub_steam_price_en']
         
-        # Calculate expected value (sum of item price * probability)
-        ev = 0
-        if 'odds' in case_items.columns and 'sub_steam_price_en' in case_items.columns:
-            ev = (case_items['odds'] * case_items['sub_steam_price_en']).sum()
+        # Join case prices once; cases missing from cases_df count as free when computing profit
+        case_prices = cases_df.drop_duplicates('name').set_index('name')['price']
+        row_case_price = case_names.map(case_prices)
+        row_case_price = row_case_price.where(case_names.isin(case_prices.index), 0)
         
-        # Get case price from the cases dataframe
-        case_price = cases_df[cases_df['name'] == case_name]['price'].values[0] if case_name in cases_df['name'].values else None
+        def group(values):
+            return values.groupby(case_names, sort=False, dropna=False)
         
-        case_ev.append({
-            'Case Name': case_name,
-            'Expected Value': ev,
-            'Case Price': case_price,
-            'EV Ratio': ev / case_price if case_price else None
+        # Expected value (sum of item price * probability) and variance around it
+        expected_value = group(odds * prices).sum()
+        row_expected_value = case_names.map(expected_value)
+        variance = group(odds * (prices - row_expected_value)**2).sum()
+        
+        # Probability of profit, normalizing the odds when they sum to more than 1
+        row_total_odds = group(odds).transform('sum')
+        normalized_odds = odds.where(row_total_odds <= 1, odds / row_total_odds)
+        prob_profit = group(normalized_odds.where(prices > row_case_price, 0)).sum() * 100
+        
+        metrics_df = pd.DataFrame({
+            'Expected Value': expected_value,
+            'Case Price': case_prices.reindex(expected_value.index),
+            'Variance': variance,
+            'Probability of Profit (%)': prob_profit,
+            'Max Item Value': group(prices).max(),
+            'Profit Case Price': group(row_case_price).first()
         })
+        metrics_df.index.name = 'Case Name'
+        
+        return metrics_df
+
+def calculate_ev_metrics(cases_df, case_contents_df, metrics_df=None):
+    """
+    Calculate expected value metrics for all cases.
+    
+    Args:
+        cases_df (DataFrame): DataFrame containing case data
+        case_contents_df (DataFrame): DataFrame containing case contents data
+        metrics_df (DataFrame, optional): Precomputed output of compute_case_metrics
     
-    ev_df = pd.DataFrame(case_ev)
+    Returns:
+        DataFrame: DataFrame with expected value metrics for each case
+    """
+    if 'odds' not in case_contents_df.columns or 'sub_steam_price_en' not in case_contents_df.columns:
+        # Without odds or prices every case has an expected value of 0
+        metrics_df = pd.DataFrame({'Expected Value': 0.0}, index=pd.Index(case_contents_df['case_name'].unique()))
+        metrics_df['Case Price'] = cases_df.drop_duplicates('name').set_index('name')['price'].reindex(metrics_df.index)
+    elif metrics_df is None:
+        metrics_df = compute_case_metrics(cases_df, case_contents_df)
+    
+    case_price = metrics_df['Case Price']
+    ev_df = pd.DataFrame({
+        'Case Name': metrics_df.index,
+        'Expected Value': metrics_df['Expected Value'].to_numpy(),
+        'Case Price': case_price.to_numpy(),
+        'EV Ratio': (metrics_df['Expected Value'] / case_price.where(case_price != 0)).to_numpy()
+    })
     ev_df = ev_df.dropna().sort_values('EV Ratio', ascending=False)
     
     return ev_df
 
-def calculate_risk_metrics(cases_df, case_contents_df, top_cases=None):
+def calculate_risk_metrics(cases_df, case_contents_df, top_cases=None, metrics_df=None):
     """
     Calculate risk metrics for cases.
     
@@ -84,56 +180,101 @@ def calculate_risk_metrics(cases_df, case_contents_df, top_cases=None):
         cases_df (DataFrame): DataFrame containing case data
         case_contents_df (DataFrame): DataFrame containing case contents data
         top_cases (list, optional): List of case names to calculate metrics for. If None, calculate for all cases.
+        metrics_df (DataFrame, optional): Precomputed output of compute_case_metrics
     
     Returns:
         DataFrame: DataFrame with risk metrics for each case
     """
-    risk_metrics = []
+    if 'odds' not in case_contents_df.columns or 'sub_steam_price_en' not in case_contents_df.columns:
+        return pd.DataFrame()
+    
+    if metrics_df is None:
+        metrics_df = compute_case_metrics(cases_df, case_contents_df)
     
     # If top_cases is None, use all cases
     if top_cases is None:
-        top_cases = case_contents_df['case_name'].unique()
+        top_cases = metrics_df.index
     
-    for case_name in top_cases:
-        case_items = case_contents_df[case_contents_df['case_name'] == case_name]
-        
-        if 'odds' in case_items.columns and 'sub_steam_price_en' in case_items.columns:
-            # Calculate variance and standard deviation
-            expected_value = (case_items['odds'] * case_items['sub_steam_price_en']).sum()
-            variance = (case_items['odds'] * (case_items['sub_steam_price_en'] - expected_value)**2).sum()
-            std_dev = np.sqrt(variance)
-            
-            # Calculate probability of profit
-            case_price = cases_df[cases_df['name'] == case_name]['price'].values[0] if case_name in cases_df['name'].values else 0
-            
-            # Check if odds need normalization (if sum of all odds > 1)
-            total_odds = case_items['odds'].sum()
-            if total_odds > 1:
-                # Normalize the odds so they sum to 1
-                normalized_odds = case_items['odds'] / total_odds
-                # Calculate probability using normalized odds
-                prob_profit = normalized_odds[case_items['sub_steam_price_en'] > case_price].sum() * 100
-            else:
-                # If odds are already normalized or sum to less than 1, use them directly
-                prob_profit = case_items[case_items['sub_steam_price_en'] > case_price]['odds'].sum() * 100
-            
-            # Calculate max potential profit
-            max_item_value = case_items['sub_steam_price_en'].max()
-            max_profit = max_item_value - case_price
-            
-            risk_metrics.append({
-                'Case Name': case_name,
-                'Expected Value': expected_value,
-                'Standard Deviation': std_dev,
-                'Coefficient of Variation': std_dev / expected_value if expected_value else float('inf'),
-                'Probability of Profit (%)': prob_profit,
-                'Max Potential Profit': max_profit
-            })
+    # Cases without any items have no value and no chance of profit
+    metrics_df = metrics_df.reindex(top_cases)
+    missing = metrics_df['Max Item Value'].isna() & metrics_df['Expected Value'].isna()
+    metrics_df.loc[missing, ['Expected Value', 'Variance', 'Probability of Profit (%)']] = 0.0
+    
+    expected_value = metrics_df['Expected Value'].to_numpy()
+    std_dev = np.sqrt(metrics_df['Variance'].to_numpy())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coefficient_of_variation = np.where(expected_value != 0, std_dev / expected_value, float('inf'))
     
-    risk_df = pd.DataFrame(risk_metrics)
+    risk_df = pd.DataFrame({
+        'Case Name': list(top_cases),
+        'Expected Value': expected_value,
+        'Standard Deviation': std_dev,
+        'Coefficient of Variation': coefficient_of_variation,
+        'Probability of Profit (%)': metrics_df['Probability of Profit (%)'].to_numpy(),
+        'Max Potential Profit': (metrics_df['Max Item Value'] - metrics_df['Profit Case Price']).to_numpy()
+    })
     
     return risk_df
 
+def load_metric_tables(cache=None):
+    """
+    Load the EV and risk tables of every case and the recommendation lists.
+    
+    With a cache, tables computed for the same version of the dataset are reused
+    and the case contents are only read when a table is missing.
+    
+    Args:
+        cache (MetricsCache, optional): Metrics cache of the dataset
+    
+    Returns:
+        dict: cases_df, ev_df, risk_df and recommendations (by player type, see
+            get_recommendations), or None if the data files are missing
+    """
+    cases_df = load_cases()
+    if cases_df is None:
+        return None
+    
+    data = {}
+    
+    def load_frames():
+        if 'case_contents_df' not in data:
+            data['case_contents_df'] = load_data()[1]
+            # Compute the per-case metrics once, shared by the EV and risk tables
+            case_contents_df = data['case_contents_df']
+            data['metrics_df'] = None
+            if case_contents_df is not None and {'odds', 'sub_steam_price_en'} <= set(case_contents_df.columns):
+                data['metrics_df'] = compute_case_metrics(cases_df, case_contents_df)
+        return data['case_contents_df'], data['metrics_df']
+    
+    def compute_ev():
+        case_contents_df, metrics_df = load_frames()
+        return calculate_ev_metrics(cases_df, case_contents_df, metrics_df)
+    
+    def compute_risk():
+        case_contents_df, metrics_df = load_frames()
+        return calculate_risk_metrics(cases_df, case_contents_df, ev_df['Case Name'].tolist(), metrics_df)
+    
+    def compute_recommendations():
+        return get_recommendations(ev_df, risk_df, cases_df, 'all')
+    
+    if cache is None:
+        if load_frames()[0] is None:
+            return None
+        ev_df = compute_ev()
+        risk_df = compute_risk()
+        recommendations = compute_recommendations()
+    else:
+        ev_df = cache.get('ev', compute_ev)
+        risk_df = cache.get('risk', compute_risk)
+        recommendations = cache.get('recommendations', compute_recommendations)
+    
+    return {
+        'cases_df': cases_df,
+        'ev_df': ev_df,
+        'risk_df': risk_df,
+        'recommendations': recommendations
+    }
+
 def get_recommendations(ev_df, risk_df, cases_df, player_type='profit'):
     """
     Get case recommendations based on player type.
@@ -182,7 +323,8 @@ def get_recommendations(ev_df, risk_df, cases_df, player_type='profit'):
         print(f"Unknown player type: {player_type}")
         return None
 
-def simulate_case_opening(case_name, cases_df, case_contents_df, num_openings=1):
+def simulate_case_opening(case_name, cases_df, case_contents_df, num_openings=1, seed=None,
+                          batch_size=DEFAULT_BATCH_SIZE, curve_points=None, summary_only=False, price_curve=None):
     """
     Simulate opening a specific case a number of times.
     
@@ -191,79 +333,187 @@ def simulate_case_opening(case_name, cases_df, case_contents_df, num_openings=1)
         cases_df (DataFrame): DataFrame containing case data
         case_contents_df (DataFrame): DataFrame containing case contents data
         num_openings (int): Number of case openings to simulate
+        seed (int, optional): Seed for the random number generator
+        batch_size (int): Number of openings drawn per batch
+        curve_points (int, optional): Record the cumulative profit curve, downsampled to this many points
+        summary_only (bool): Only keep running statistics, not the item of every opening
+        price_curve (dict, optional): Draw a float for every drop and price it with this curve (see wear_simulation)
     
     Returns:
         dict: Results of the simulation
     """
-    # Get case items and their odds
-    case_items = case_contents_df[case_contents_df['case_name'] == case_name]
+    # Build the case distribution once
+    distribution = build_case_distribution(case_name, cases_df, case_contents_df)
     
-    if case_items.empty:
+    if distribution is None or not distribution['items']:
         print(f"Error: Case '{case_name}' not found in the dataset.")
         return None
     
-    # Get case price
-    case_price = cases_df[cases_df['name'] == case_name]['price'].values[0] if case_name in cases_df['name'].values else 0
-    
-    # Check if odds need normalization
-    total_odds = case_items['odds'].sum()
-    if total_odds > 1:
-        # Normalize the odds so they sum to 1
-        case_items = case_items.copy()
-        case_items['odds'] = case_items['odds'] / total_odds
-    
-    # Prepare for simulation
-    items = []
-    odds = []
-    prices = []
-    
-    for _, item in case_items.iterrows():
-        if pd.notna(item['odds']) and pd.notna(item['sub_steam_price_en']):
-            items.append(f"{item['weapon_name']} | {item['skin_name']} ({item['sub_steam_short_exterior']})")
-            odds.append(item['odds'])
-            prices.append(item['sub_steam_price_en'])
-    
-    # Normalize odds if they don't sum to 1
-    odds_sum = sum(odds)
-    if abs(odds_sum - 1) > 0.01:  # Allow for small floating-point errors
-        odds = [o / odds_sum for o in odds]
-    
-    # Simulate openings
-    results = []
-    total_cost = case_price * num_openings
-    total_value = 0
+    return simulate_distribution(distribution, num_openings, seed, batch_size, curve_points, summary_only,
+                                 price_curve)
+
+def simulate_distribution(distribution, num_openings=1, seed=None, batch_size=DEFAULT_BATCH_SIZE,
+                          curve_points=None, summary_only=False, price_curve=None):
+    """
+    Simulate opening a case from its prebuilt distribution.
     
-    for _ in range(num_openings):
-        # Randomly select an item based on odds
-        item_index = random.choices(range(len(items)), weights=odds, k=1)[0]
-        item_name = items[item_index]
-        item_price = prices[item_index]
-        
-        results.append({
-            'Item': item_name,
-            'Value': item_price,
-            'Profit': item_price - case_price
-        })
-        
-        total_value += item_price
+    Statistics are updated batch by batch. With summary_only, the item of each
+    opening is not kept, so memory only depends on the number of items in the case.
+    
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        num_openings (int): Number of case openings to simulate
+        seed (int, optional): Seed for the random number generator
+        batch_size (int): Number of openings drawn per batch
+        curve_points (int, optional): Record the cumulative profit curve, downsampled to this many points
+        summary_only (bool): Only keep running statistics, not the item of every opening
+        price_curve (dict, optional): Draw a float for every drop and price it with this curve (see wear_simulation)
+    
+    Returns:
+        dict: Results of the simulation. With summary_only, item_indices and values are None.
+            With a price curve, wear holds the float statistics (see WearStats.summary)
+    """
+    case_name = distribution['case_name']
+    
+    # Simulate openings, updating the statistics as the batches come in
+    case_price = distribution['case_price']
+    item_profits = distribution['prices'] - case_price
+    rng = np.random.default_rng(seed)
+    item_indices = None if summary_only else np.empty(num_openings, dtype=index_dtype(distribution))
+    item_counts = np.zeros(len(distribution['items']), dtype=np.int64)
+    stats = RunningStats()
+    curve = CumulativeCurve(num_openings, curve_points) if curve_points else None
+    wear = WearStats(distribution, build_wear_model(distribution, price_curve)) if price_curve else None
+    # Floats get their own stream so the drops do not depend on whether floats are drawn
+    wear_rng = rng.spawn(1)[0] if wear is not None else None
+    
+    start = 0
+    with stage('simulate'):
+        for batch in iter_sample_batches(distribution, num_openings, batch_size, rng):
+            if item_indices is not None:
+                item_indices[start:start + len(batch)] = batch
+            item_counts += np.bincount(batch, minlength=len(item_counts))
+            profits = item_profits[batch]
+            stats.update(profits)
+            if curve is not None:
+                curve.update(profits)
+            if wear is not None:
+                wear.update(batch, wear_rng)
+            start += len(batch)
+    increment('openings', num_openings)
+    values = None if summary_only else distribution['prices'][item_indices]
     
     # Calculate summary statistics
+    total_cost = case_price * num_openings
+    total_value = float(values.sum()) if values is not None else float(item_counts @ distribution['prices'])
     total_profit = total_value - total_cost
-    profit_items = sum(1 for r in results if r['Profit'] > 0)
+    profit_items = int(item_counts[distribution['prices'] > case_price].sum())
     profit_percentage = (profit_items / num_openings) * 100 if num_openings > 0 else 0
+    if num_openings > 0:
+        quantiles = quantiles_from_counts(item_profits, item_counts, [0.05, 0.5, 0.95])
+    else:
+        quantiles = [0.0, 0.0, 0.0]
     
     # Return simulation results
     return {
         'case_name': case_name,
+        'case_price': case_price,
         'num_openings': num_openings,
         'total_cost': total_cost,
         'total_value': total_value,
         'total_profit': total_profit,
         'profit_percentage': profit_percentage,
         'roi': (total_profit / total_cost) * 100 if total_cost > 0 else 0,
-        'items': results
+        'mean_profit': stats.mean,
+        'std_profit': float(np.sqrt(stats.variance)),
+        'profit_quantiles': dict(zip(['P5', 'Median', 'P95'], (float(q) for q in quantiles))),
+        'max_drawdown': stats.max_drawdown,
+        'item_names': distribution['items'],
+        'item_values': distribution['prices'],
+        'item_counts': item_counts,
+        'item_indices': item_indices,
+        'values': values,
+        'cumulative_profit': curve.points() if curve is not None else None,
+        'wear': wear.summary() if wear is not None else None
     }
 
+def simulate_all_cases(cases_df, case_contents_df, num_openings=1, seed=None, workers=None,
+                       batch_size=DEFAULT_BATCH_SIZE, confidence=0.95):
+    """
+    Simulate opening every case in the dataset on a process pool.
+    
+    The openings of each case are split into fixed-size tasks, and every task
+    gets its own random stream spawned from the seed. The split does not depend
+    on the number of workers, so the same seed always gives the same results.
+    
+    Args:
+        cases_df (DataFrame): DataFrame containing case data
+        case_contents_df (DataFrame): DataFrame containing case contents data
+        num_openings (int): Number of openings to simulate for each case
+        seed (int, optional): Seed for the random number generator
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs
+        batch_size (int): Number of openings drawn per batch
+        confidence (float): Confidence level of the reported intervals
+    
+    Returns:
+        DataFrame: Simulation results for each case, sorted by ROI
+    """
+    distributions = [d for d in build_all_distributions(cases_df, case_contents_df) if d['items']]
+    case_seeds = np.random.SeedSequence(seed).spawn(len(distributions))
+    
+    # Split each case into tasks of at most SIMULATION_TASK_SIZE openings
+    tasks = []
+    for case_index, (distribution, case_seed) in enumerate(zip(distributions, case_seeds)):
+        num_tasks = max(1, -(-num_openings // SIMULATION_TASK_SIZE))
+        for task_seed, start in zip(case_seed.spawn(num_tasks), range(0, max(num_openings, 1), SIMULATION_TASK_SIZE)):
+            tasks.append((case_index, distribution, min(SIMULATION_TASK_SIZE, num_openings - start), task_seed, batch_size))
+    
+    # Run the tasks, grouped in chunks to limit inter-process overhead
+    workers = workers or os.cpu_count() or 1
+    counts = [np.zeros(len(d['items']), dtype=np.int64) for d in distributions]
+    with stage('simulate'):
+        if workers == 1:
+            task_results = count_openings_worker(tasks)
+        else:
+            chunk_size = max(1, len(tasks) // (workers * 4))
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                task_results = [result for chunk in executor.map(count_openings_worker, chunks) for result in chunk]
+    increment('openings', num_openings * len(distributions))
+    for case_index, task_counts in task_results:
+        counts[case_index] += task_counts
+    
+    # Summarize each case from its item counts
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    summary = []
+    for distribution, case_counts in zip(distributions, counts):
+        case_price = distribution['case_price']
+        prices = distribution['prices']
+        total_cost = case_price * num_openings
+        total_value = float(case_counts @ prices)
+        mean_value = total_value / num_openings if num_openings else 0
+        variance = float(case_counts @ prices**2) / num_openings - mean_value**2 if num_openings else 0
+        value_margin = z * np.sqrt(max(variance, 0) / num_openings) if num_openings else 0
+        profit_ratio = case_counts[prices > case_price].sum() / num_openings if num_openings else 0
+        profit_margin = z * np.sqrt(profit_ratio * (1 - profit_ratio) / num_openings) if num_openings else 0
+        
+        summary.append({
+            'Case Name': distribution['case_name'],
+            'Case Price': case_price,
+            'Openings': num_openings,
+            'Total Cost': total_cost,
+            'Total Value': total_value,
+            'Total Profit': total_value - total_cost,
+            'ROI (%)': (mean_value - case_price) / case_price * 100 if case_price else None,
+            'ROI CI Low (%)': (mean_value - value_margin - case_price) / case_price * 100 if case_price else None,
+            'ROI CI High (%)': (mean_value + value_margin - case_price) / case_price * 100 if case_price else None,
+            'Profit Percentage (%)': profit_ratio * 100,
+            'Profit % CI Low': max(profit_ratio - profit_margin, 0) * 100,
+            'Profit % CI High': min(profit_ratio + profit_margin, 1) * 100
+        })
+    
+    return pd.DataFrame(summary).sort_values('ROI (%)', ascending=False)
+
 def display_simulation_results(results):
     """
     Display the results of a case opening simulation.
@@ -282,19 +532,24 @@ def display_simulation_results(results):
     print(f"ROI: {results['roi']:.2f}%")
     print(f"Profitable items: {results['profit_percentage']:.2f}%")
     
+    if results['num_openings'] > 1:
+        quantiles = results['profit_quantiles']
+        print(f"Profit per opening: mean ${results['mean_profit']:.2f}, std dev ${results['std_profit']:.2f}, "
+              f"P5 ${quantiles['P5']:.2f}, median ${quantiles['Median']:.2f}, P95 ${quantiles['P95']:.2f}")
+        print(f"Max drawdown: ${results['max_drawdown']:.2f}")
+    
+    item_names = results['item_names']
+    
     # Display item distribution if there are multiple openings
     if results['num_openings'] > 1:
-        # Count item occurrences
-        item_counts = {}
-        for item in results['items']:
-            item_name = item['Item']
-            if item_name in item_counts:
-                item_counts[item_name] += 1
-            else:
-                item_counts[item_name] = 1
+        # Drops with the same display name are counted together
+        counts_by_name = {}
+        for item_name, count in zip(item_names, results['item_counts']):
+            if count:
+                counts_by_name[item_name] = counts_by_name.get(item_name, 0) + int(count)
         
         # Sort by count (descending)
-        sorted_items = sorted(item_counts.items(), key=lambda x: x[1], reverse=True)
+        sorted_items = sorted(counts_by_name.items(), key=lambda x: x[1], reverse=True)
         
         print("\nItem Distribution:")
         table_data = []
@@ -305,35 +560,53 @@ def display_simulation_results(results):
         print(tabulate(table_data, headers=["Item", "Count", "Percentage"], tablefmt="grid"))
     
     # Display all items if requested or if there are few openings
-    if results['num_openings'] <= 10:
+    if results['num_openings'] <= 10 and results['item_indices'] is not None:
         print("\nItems Received:")
         table_data = []
-        for i, item in enumerate(results['items'], 1):
-            table_data.append([i, item['Item'], f"${item['Value']:.2f}", f"${item['Profit']:.2f}"])
+        for i, (item_index, value) in enumerate(zip(results['item_indices'], results['values']), 1):
+            table_data.append([i, item_names[item_index], f"${value:.2f}", f"${value - results['case_price']:.2f}"])
         
         print(tabulate(table_data, headers=["#", "Item", "Value", "Profit/Loss"], tablefmt="grid"))
+    
+    if results.get('wear'):
+        display_wear_results(results['wear'])
 
-def plot_simulation_results(results):
+def plot_simulation_results(results, output=None):
     """
     Plot the results of a case opening simulation.
     
+    The profit distribution is drawn from the per-item drop counts and the
+    cumulative profit from its downsampled curve, so the cost of plotting does
+    not grow with the number of openings.
+    
     Args:
         results (dict): Results of the simulation
+        output (str, optional): Save the figure to this file instead of showing it
     """
     if not results or results['num_openings'] <= 1:
         return
     
+    # Plotting libraries are slow to import, so only load them when plotting
+    import matplotlib
+    if output:
+        # Render without a display
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    
     # Set up the figure
     plt.figure(figsize=(12, 8))
     
-    # Extract profit/loss values
-    profits = [item['Profit'] for item in results['items']]
+    # Profit/loss distribution, binned from the drop count of each item
+    counts, edges = profit_histogram(results['item_values'] - results['case_price'], results['item_counts'])
+    kde_x, kde_y = binned_kde(counts, edges)
+    mean_profit = results['total_profit'] / results['num_openings']
     
     # Plot profit/loss distribution
     plt.subplot(2, 1, 1)
-    sns.histplot(profits, kde=True)
+    plt.stairs(counts, edges, fill=True, alpha=0.5)
+    plt.plot(kde_x, kde_y)
     plt.axvline(x=0, color='r', linestyle='--', label='Break-even')
-    plt.axvline(x=np.mean(profits), color='g', linestyle='-', label=f'Mean: ${np.mean(profits):.2f}')
+    plt.axvline(x=mean_profit, color='g', linestyle='-', label=f'Mean: ${mean_profit:.2f}')
     plt.title(f'Profit/Loss Distribution for {results["case_name"]} ({results["num_openings"]} openings)')
     plt.xlabel('Profit/Loss ($)')
     plt.ylabel('Frequency')
@@ -341,8 +614,13 @@ def plot_simulation_results(results):
     
     # Plot cumulative profit/loss
     plt.subplot(2, 1, 2)
-    cumulative_profit = np.cumsum(profits)
-    plt.plot(range(1, len(cumulative_profit) + 1), cumulative_profit)
+    if results.get('cumulative_profit') is not None:
+        x, cumulative_profit = results['cumulative_profit']
+    else:
+        curve = CumulativeCurve(results['num_openings'])
+        curve.update(results['values'] - results['case_price'])
+        x, cumulative_profit = curve.points()
+    plt.plot(x, cumulative_profit)
     plt.axhline(y=0, color='r', linestyle='--', label='Break-even')
     plt.title('Cumulative Profit/Loss Over Time')
     plt.xlabel('Number of Openings')
@@ -350,20 +628,192 @@ def plot_simulation_results(results):
     plt.legend()
     
     plt.tight_layout()
-    plt.show()
+    if output:
+        plt.savefig(output)
+        plt.close()
+        print(f"Saved plot to {output}")
+    else:
+        plt.show()
+
+def display_case_analysis(case_name, ev_df, risk_df):
+    """
+    Display the expected value and risk metrics of a single case.
+    
+    Args:
+        case_name (str): Name of the case
+        ev_df (DataFrame): DataFrame with expected value metrics
+        risk_df (DataFrame): DataFrame with risk metrics
+    """
+    case_ev = ev_df[ev_df['Case Name'] == case_name]
+    if case_ev.empty:
+        print(f"Error: Case '{case_name}' not found in the dataset.")
+        return
+    
+    print(f"\n=== Analysis for {case_name} ===")
+    print(f"Case Price: ${case_ev['Case Price'].values[0]:.2f}")
+    print(f"Expected Value: ${case_ev['Expected Value'].values[0]:.2f}")
+    print(f"EV Ratio: {case_ev['EV Ratio'].values[0]:.2f}")
+    
+    if not risk_df.empty:
+        print(f"Standard Deviation: ${risk_df['Standard Deviation'].values[0]:.2f}")
+        print(f"Coefficient of Variation: {risk_df['Coefficient of Variation'].values[0]:.2f}")
+        print(f"Probability of Profit: {risk_df['Probability of Profit (%)'].values[0]:.2f}%")
+        print(f"Max Potential Profit: ${risk_df['Max Potential Profit'].values[0]:.2f}")
+
+def display_n_opening_analysis(distribution, openings, alpha=0.05):
+    """
+    Display the exact profit distribution metrics after N openings of a case.
+    
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        openings (list): Numbers of openings to analyze
+        alpha (float): Tail probability of the value at risk
+    """
+    if distribution is None or not distribution['items']:
+        return
+    
+    risk_df = pd.DataFrame([n_opening_risk(distribution, n, alpha) for n in openings])
+    
+    print(f"\n=== Profit After N Openings (exact, VaR/CVaR at {1 - alpha:.0%}) ===")
+    print(tabulate(risk_df, headers='keys', tablefmt='grid', showindex=False,
+                   floatfmt=['g'] + ['.2f'] * (len(risk_df.columns) - 1)))
+
+def price_curve_from_args(args):
+    """
+    Build the float price curve requested by the simulate command.
+    
+    Args:
+        args (Namespace): Parsed command-line arguments
+    
+    Returns:
+        dict: The price curve (see wear_simulation), or None without float simulation
+    """
+    if args.float_curve:
+        return make_price_curve(points=pd.read_csv(args.float_curve))
+    if args.floats or args.float_premium:
+        return make_price_curve(args.float_premium, args.float_power)
+    return None
+
+def display_wear_results(wear):
+    """
+    Display the float statistics of a case opening simulation.
+    
+    Args:
+        wear (dict): Float statistics of the simulation (see WearStats.summary)
+    """
+    print("\nFloat Values:")
+    if not wear['drops_with_float']:
+        print("No drop has an exterior.")
+        return
+    
+    quantiles = wear['float_quantiles']
+    print(f"Drops with a float: {wear['drops_with_float']}")
+    print(f"Float: P5 {quantiles['P5']:.4f}, median {quantiles['Median']:.4f}, P95 {quantiles['P95']:.4f}")
+    print(tabulate(wear['exteriors'], headers='keys', tablefmt='grid', showindex=False,
+                   floatfmt=['', 'g', '.2f', '.4f']))
+    print(f"Expected value: ${wear['base_ev']:.2f} at listed prices, ${wear['float_adjusted_ev']:.2f} float-adjusted "
+          f"(simulated ${wear['simulated_mean_value']:.2f})")
+    print(f"Float-adjusted ROI: {wear['float_adjusted_roi']:.2f}% (simulated {wear['simulated_roi']:.2f}%)")
+
+def run_single_case_command(args, store):
+    """
+    Answer a single-case simulate or analyze command from the compiled case store.
+    
+    Args:
+        args (Namespace): Parsed command-line arguments
+        store (dict): The opened case store
+    """
+    if args.command == 'simulate':
+        distribution = load_case_distribution(store, args.case_name)
+        if distribution is None or not distribution['items']:
+            print(f"Error: Case '{args.case_name}' not found in the dataset.")
+            return
+        
+        plot = (args.plot or args.plot_out) and args.num > 1
+        results = simulate_distribution(distribution, args.num, seed=args.seed, batch_size=args.batch_size,
+                                        curve_points=DEFAULT_CURVE_POINTS if plot else None,
+                                        summary_only=args.summary_only, price_curve=price_curve_from_args(args))
+        display_simulation_results(results)
+        if plot:
+            plot_simulation_results(results, args.plot_out)
+    
+    elif args.command == 'analyze':
+        cases_df, case_contents_df = load_case_frames(store, args.case_name)
+        if case_contents_df is None:
+            print(f"Error: Case '{args.case_name}' not found in the dataset.")
+            return
+        
+        metrics_df = compute_case_metrics(cases_df, case_contents_df)
+        ev_df = calculate_ev_metrics(cases_df, case_contents_df, metrics_df)
+        risk_df = calculate_risk_metrics(cases_df, case_contents_df, [args.case_name], metrics_df)
+        display_case_analysis(args.case_name, ev_df, risk_df)
+        if args.openings and not ev_df.empty:
+            display_n_opening_analysis(load_case_distribution(store, args.case_name), args.openings, args.alpha)
+
+def non_negative_int(value):
+    """
+    Parse a command-line integer that must not be negative.
+
+    Args:
+        value (str): Value of the argument
+
+    Returns:
+        int: The parsed value
+    """
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be non-negative, got {number}")
+    return number
+
+def positive_int(value):
+    """
+    Parse a command-line integer that must be positive.
+
+    Args:
+        value (str): Value of the argument
+
+    Returns:
+        int: The parsed value
+    """
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be positive, got {number}")
+    return number
 
 def main():
     """Main function to handle command-line arguments and execute the appropriate action."""
+    # The query server builds on this module, so it is only imported once this module is loaded
+    from query_server import add_serve_arguments, serve
+    
     parser = argparse.ArgumentParser(description='Case Simulator CLI Tool')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute the metric tables instead of using the cache')
+    parser.add_argument('--cache-stats', action='store_true', help='Report the metrics cache hit and miss rates')
+    add_profile_arguments(parser)
     
     # Create subparsers for different commands
     subparsers = parser.add_subparsers(dest='command', help='Command to execute')
     
     # Simulate command
     simulate_parser = subparsers.add_parser('simulate', help='Simulate case openings')
-    simulate_parser.add_argument('case_name', help='Name of the case to simulate')
+    simulate_parser.add_argument('case_name', nargs='?', help='Name of the case to simulate')
+    simulate_parser.add_argument('--all', action='store_true', help='Simulate every case in the dataset')
+    simulate_parser.add_argument('--workers', type=int, help='Number of worker processes for --all (default: all CPUs)')
+    simulate_parser.add_argument('--output', help='Save the --all results to a CSV file')
     simulate_parser.add_argument('-n', '--num', type=int, default=1, help='Number of case openings to simulate')
     simulate_parser.add_argument('--plot', action='store_true', help='Plot the simulation results')
+    simulate_parser.add_argument('--summary-only', action='store_true',
+                                 help='Only keep running statistics (memory independent of the number of openings)')
+    simulate_parser.add_argument('--plot-out', help='Save the plot to this file (e.g. report.png) without a display')
+    simulate_parser.add_argument('--seed', type=int, help='Seed for the random number generator')
+    simulate_parser.add_argument('--batch-size', type=positive_int, default=DEFAULT_BATCH_SIZE,
+                                 help='Number of openings drawn per batch')
+    simulate_parser.add_argument('--floats', action='store_true', help='Draw a float value for every drop')
+    simulate_parser.add_argument('--float-premium', type=float, default=0.0,
+                                 help='Price premium at the best float of each exterior (0.5 = +50%%); implies --floats')
+    simulate_parser.add_argument('--float-power', type=float, default=DEFAULT_PREMIUM_POWER,
+                                 help='Exponent of the float premium (higher fades faster from the best float)')
+    simulate_parser.add_argument('--float-curve',
+                                 help='CSV of float,multiplier points pricing every float; implies --floats')
     
     # Analyze command
     analyze_parser = subparsers.add_parser('analyze', help='Analyze case metrics')
@@ -371,12 +821,89 @@ def main():
     analyze_parser.add_argument('--top', type=int, default=10, help='Number of top cases to display')
     analyze_parser.add_argument('--sort', choices=['ev', 'ev-ratio', 'profit-prob', 'max-profit', 'price'], 
                                default='ev-ratio', help='Sort metric')
+    analyze_parser.add_argument('--openings', type=non_negative_int, nargs='+',
+                               help='Exact profit distribution after N openings of the case (e.g. --openings 50 200)')
+    analyze_parser.add_argument('--alpha', type=float, default=0.05, help='Tail probability for VaR and CVaR')
     
     # Recommend command
     recommend_parser = subparsers.add_parser('recommend', help='Get case recommendations')
     recommend_parser.add_argument('--type', choices=['profit', 'risk-averse', 'high-risk', 'budget', 'all'], 
                                  default='all', help='Player type for recommendations')
     
+    # Bankroll command
+    bankroll_parser = subparsers.add_parser('bankroll', help='Simulate a balance over repeated openings (risk of ruin)')
+    bankroll_parser.add_argument('case_names', nargs='*', help='Names of the cases to simulate')
+    bankroll_parser.add_argument('--all', action='store_true', help='Simulate every case in the dataset')
+    bankroll_parser.add_argument('--balance', type=float, required=True, help='Starting balance')
+    bankroll_parser.add_argument('--paths', type=int, default=100000, help='Number of balance paths per case')
+    bankroll_parser.add_argument('--max-openings', type=int, default=1000, help='Maximum number of openings per path')
+    bankroll_parser.add_argument('--stop-loss', type=float, help='Stop once the balance falls to this level')
+    bankroll_parser.add_argument('--take-profit', type=float, help='Stop once the balance reaches this level')
+    bankroll_parser.add_argument('--seed', type=int, help='Seed for the random number generator')
+    
+    # Target command
+    target_parser = subparsers.add_parser('target', help='Exact chance of reaching a target balance before ruin')
+    target_parser.add_argument('case_names', nargs='*', help='Cases to choose from (default: every case in the dataset)')
+    target_parser.add_argument('--balance', type=float, required=True, help='Starting balance')
+    target_parser.add_argument('--target', type=float, required=True, help='Target balance')
+    target_parser.add_argument('--grid', type=int, default=DEFAULT_GRID_POINTS,
+                               help='Number of balance grid points between 0 and the target')
+    target_parser.add_argument('--compare-cases', action='store_true',
+                               help='Also compare always opening each case (one solve per case, slower)')
+    target_parser.add_argument('--top', type=int, default=20, help='Number of cases to display with --compare-cases')
+    
+    # Battle command
+    battle_parser = subparsers.add_parser('battle', help='Simulate case battles over a lineup of cases')
+    battle_parser.add_argument('case_names', nargs='*', help='Cases opened in each battle, in order')
+    battle_parser.add_argument('--casebattle-only', action='store_true',
+                               help='Simulate a battle lineup of each casebattle-only case instead')
+    battle_parser.add_argument('--rounds', type=int, default=1, help='Number of times the lineup is opened per battle')
+    battle_parser.add_argument('--players', type=int, default=2, help='Number of players in each battle')
+    battle_parser.add_argument('--rule', choices=BATTLE_RULES, default='highest',
+                               help='Whether the highest or the lowest total value wins')
+    battle_parser.add_argument('-n', '--num', type=int, default=DEFAULT_NUM_BATTLES,
+                               help='Number of battles to simulate per lineup')
+    battle_parser.add_argument('--top', type=int, default=20, help='Number of lineups to display')
+    battle_parser.add_argument('--seed', type=int, help='Seed for the random number generator')
+    
+    # Upgrade command
+    upgrade_parser = subparsers.add_parser('upgrade', help='Analyze upgrade contracts')
+    upgrade_parser.add_argument('--chances', type=float, nargs='+', default=list(DEFAULT_CHANCES),
+                               help='Upgrade chances to evaluate, in %%')
+    upgrade_parser.add_argument('--directions', choices=DIRECTIONS, nargs='+', default=list(DIRECTIONS),
+                               help='Roll directions to evaluate')
+    upgrade_parser.add_argument('--house-edge', type=float, default=DEFAULT_HOUSE_EDGE,
+                               help='Share of the stake kept by the house')
+    upgrade_parser.add_argument('--top', type=int, default=20, help='Number of best upgrades to display')
+    upgrade_parser.add_argument('--rank', choices=list(UPGRADE_RANKINGS), default='ev',
+                               help='Ranking of the best upgrades (every EV Ratio is the same with a uniform roll)')
+    upgrade_parser.add_argument('--chain', nargs='+', metavar='CASE_NAME',
+                               help='Compare opening these cases with opening them and upgrading the drop')
+    upgrade_parser.add_argument('--chain-all', action='store_true', help='Compare every case')
+    upgrade_parser.add_argument('--chain-chance', type=float, default=50, help='Upgrade chance of the drop, in %%')
+    upgrade_parser.add_argument('--chain-direction', choices=DIRECTIONS, default='under',
+                               help='Roll direction of the drop upgrade')
+    
+    # Scenarios command
+    scenarios_parser = subparsers.add_parser('scenarios', help='Test the EV Ratio ranking against price scenarios')
+    scenarios_parser.add_argument('--kind', choices=SCENARIO_KINDS, nargs='+', default=['noise'],
+                                  help='Scenario kinds, combined when several are given')
+    scenarios_parser.add_argument('--scenarios', type=positive_int, default=DEFAULT_NUM_SCENARIOS, help='Number of scenarios')
+    scenarios_parser.add_argument('--sigma', type=float, default=DEFAULT_NOISE_SIGMA,
+                                  help='Log standard deviation of the per-item noise')
+    scenarios_parser.add_argument('--rarity-sigma', type=float, default=DEFAULT_RARITY_SIGMA,
+                                  help='Log standard deviation of the per-rarity shocks')
+    scenarios_parser.add_argument('--reference', help='Earlier case contents CSV to bootstrap price changes from')
+    scenarios_parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the intervals')
+    scenarios_parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                                  help='Size of the top list whose stability is measured')
+    scenarios_parser.add_argument('--top', type=int, default=20, help='Number of cases to display')
+    scenarios_parser.add_argument('--seed', type=int, help='Seed for the random number generator')
+    
+    # Serve command
+    serve_parser = subparsers.add_parser('serve', help='Keep the data loaded and answer queries over a local JSON API')
+    add_serve_arguments(serve_parser)
+    
     # List command
     list_parser = subparsers.add_parser('list', help='List available cases')
     list_parser.add_argument('--filter', help='Filter cases by name (case-insensitive)')
@@ -384,42 +911,268 @@ def main():
     # Parse arguments
     args = parser.parse_args()
     
-    # Load data
-    cases_df, case_contents_df = load_data()
-    if cases_df is None or case_contents_df is None:
+    start_profiling(args)
+    try:
+        if args.command == 'serve':
+            serve(args)
+        else:
+            run_command(args, parser)
+    finally:
+        report_profiling(args)
+
+def run_command(args, parser):
+    """
+    Execute the command given on the command line.
+    
+    Args:
+        args (Namespace): Parsed arguments
+        parser (ArgumentParser): Parser of the arguments, used to print the help
+    """
+    if args.command == 'simulate' and args.float_curve and not os.path.exists(args.float_curve):
+        print(f"Error: {args.float_curve} not found.")
         return
     
-    # Calculate metrics
-    ev_df = calculate_ev_metrics(cases_df, case_contents_df)
+    # Single-case commands are answered from the compiled case store
+    single_case = args.command in ('simulate', 'analyze') and args.case_name and not getattr(args, 'all', False)
+    if single_case:
+        store = open_case_store()
+        if store is not None:
+            run_single_case_command(args, store)
+            return
+    
+    # Load data: analyze and recommend only need the metric tables, served from the
+    # metrics cache while the data is unchanged, and list only needs the cases
+    cache = None
+    if args.command in ('analyze', 'recommend'):
+        cache = None if args.no_cache else open_metrics_cache()
+        tables = load_metric_tables(cache)
+        if tables is None:
+            return
+        cases_df, ev_df, risk_df = tables['cases_df'], tables['ev_df'], tables['risk_df']
+    elif args.command == 'list':
+        cases_df = load_cases()
+        if cases_df is None:
+            return
+    elif args.command is not None:
+        cases_df, case_contents_df = load_data()
+        if cases_df is None or case_contents_df is None:
+            return
     
     # Execute the appropriate command
-    if args.command == 'simulate':
-        results = simulate_case_opening(args.case_name, cases_df, case_contents_df, args.num)
+    if args.command == 'simulate' and args.all:
+        summary_df = simulate_all_cases(cases_df, case_contents_df, args.num, seed=args.seed,
+                                        workers=args.workers, batch_size=args.batch_size)
+        print(f"\n=== Simulation Results for All Cases ({args.num} openings each) ===")
+        print(tabulate(summary_df[['Case Name', 'Case Price', 'Total Profit', 'ROI (%)', 'ROI CI Low (%)',
+                                   'ROI CI High (%)', 'Profit Percentage (%)']],
+                      headers='keys', tablefmt='grid', floatfmt='.2f', showindex=False))
+        if args.output:
+            summary_df.to_csv(args.output, index=False)
+            print(f"Saved results to {args.output}")
+    
+    elif args.command == 'simulate':
+        if not args.case_name:
+            print("Error: Please provide a case name or use --all.")
+            return
+        plot = (args.plot or args.plot_out) and args.num > 1
+        results = simulate_case_opening(args.case_name, cases_df, case_contents_df, args.num,
+                                        seed=args.seed, batch_size=args.batch_size,
+                                        curve_points=DEFAULT_CURVE_POINTS if plot else None,
+                                        summary_only=args.summary_only, price_curve=price_curve_from_args(args))
         if results:
             display_simulation_results(results)
-            if args.plot and args.num > 1:
-                plot_simulation_results(results)
+            if plot:
+                plot_simulation_results(results, args.plot_out)
+    
+    elif args.command == 'bankroll':
+        if args.all:
+            distributions = build_all_distributions(cases_df, case_contents_df)
+        else:
+            distributions = []
+            for case_name in args.case_names:
+                distribution = build_case_distribution(case_name, cases_df, case_contents_df)
+                if distribution is None or not distribution['items']:
+                    print(f"Error: Case '{case_name}' not found in the dataset.")
+                    return
+                distributions.append(distribution)
+        if not distributions:
+            print("Error: Please provide at least one case name or use --all.")
+            return
+        
+        summary_df, histograms = bankroll_report(distributions, args.balance, args.paths, args.max_openings,
+                                                 args.stop_loss, args.take_profit, args.seed)
+        
+        print(f"\n=== Bankroll Simulation (${args.balance:.2f} start, {args.paths} paths, "
+              f"up to {args.max_openings} openings) ===")
+        # The stop-loss share is always zero without a stop-loss
+        hidden = ['Starting Balance'] if args.stop_loss is not None else ['Starting Balance', 'Stop-Loss (%)']
+        print(tabulate(summary_df.sort_values(['Risk of Ruin (%)', 'Stop-Loss (%)']).drop(columns=hidden),
+                      headers='keys', tablefmt='grid', floatfmt='.2f', showindex=False))
+        
+        # Show the time to ruin distribution when looking at a single case
+        if len(distributions) == 1:
+            counts, edges = histograms[distributions[0]['case_name']]
+            if len(counts):
+                print("\nTime to Ruin Distribution:")
+                table_data = [[f"{edges[i]:.0f}-{edges[i + 1]:.0f}", count, f"{count / args.paths * 100:.2f}%"]
+                              for i, count in enumerate(counts)]
+                print(tabulate(table_data, headers=["Openings", "Paths", "Share of Paths"], tablefmt="grid"))
+    
+    elif args.command == 'target':
+        if not 0 <= args.balance < args.target:
+            print("Error: The starting balance must be between 0 and the target.")
+            return
+        if args.grid < 2:
+            print("Error: The grid needs at least 2 points.")
+            return
+        if args.case_names:
+            distributions = []
+            for case_name in args.case_names:
+                distribution = build_case_distribution(case_name, cases_df, case_contents_df)
+                if distribution is None or not distribution['items']:
+                    print(f"Error: Case '{case_name}' not found in the dataset.")
+                    return
+                distributions.append(distribution)
+        else:
+            # Cases only opened in battles cannot be bought on their own
+            battle_only = set()
+            if 'casebattle_only' in cases_df.columns:
+                battle_only = set(cases_df.loc[cases_df['casebattle_only'].eq(True), 'name'])
+            distributions = [distribution for distribution in build_all_distributions(cases_df, case_contents_df)
+                             if distribution['case_name'] not in battle_only]
+        
+        cases_df, policy_df, optimal = target_report(distributions, args.balance, args.target, args.grid,
+                                                     compare_cases=args.compare_cases)
+        if not optimal['Cases']:
+            print(f"Error: No case is priced below the target of ${args.target:.2f}.")
+            return
+        
+        print(f"\n=== Reaching ${args.target:.2f} Before Ruin From ${args.balance:.2f} "
+              f"(grid step ${optimal['Grid Step']:.4g}) ===")
+        if cases_df is not None:
+            print("\nAlways Opening the Same Case:")
+            print(tabulate(cases_df.head(args.top), headers='keys', tablefmt='grid', floatfmt='.4f', showindex=False))
+        
+        print("\nOptimal Policy (best case at every balance):")
+        print(f"Reach target: {optimal['Reach Target (%)']:.4f}%, ruin: {optimal['Ruin (%)']:.4f}%, "
+              f"first case: {optimal['First Case']}")
+        print(tabulate(policy_df, headers='keys', tablefmt='grid', floatfmt='.4f', showindex=False))
+        if optimal['Residual'] > DEFAULT_TOLERANCE:
+            print(f"Warning: the solver did not fully converge (residual {optimal['Residual']:.2e}).")
+    
+    elif args.command == 'battle':
+        if args.players < 2:
+            print("Error: A battle needs at least 2 players.")
+            return
+        if args.casebattle_only:
+            if 'casebattle_only' not in cases_df.columns:
+                print("Error: The cases data has no casebattle_only column.")
+                return
+            battle_cases = cases_df.loc[cases_df['casebattle_only'].eq(True), 'name']
+            lineups = [[distribution] for distribution in build_all_distributions(
+                cases_df, case_contents_df[case_contents_df['case_name'].isin(battle_cases)])]
+        else:
+            lineup = []
+            for case_name in args.case_names:
+                distribution = build_case_distribution(case_name, cases_df, case_contents_df)
+                if distribution is None or not distribution['items']:
+                    print(f"Error: Case '{case_name}' not found in the dataset.")
+                    return
+                lineup.append(distribution)
+            lineups = [lineup] if lineup else []
+        if not lineups:
+            print("Error: Please provide the cases of the lineup or use --casebattle-only.")
+            return
+        
+        summary_df, battles = battle_report([lineup * args.rounds for lineup in lineups], args.players, args.num,
+                                            args.rule, args.seed)
+        
+        print(f"\n=== Case Battles ({args.players} players, {args.rule} total wins, {args.num} battles) ===")
+        print(tabulate(summary_df.sort_values('Expected Net Return', ascending=False).head(args.top)
+                       .drop(columns=['Players', 'Rule']),
+                      headers='keys', tablefmt='grid', floatfmt='.2f', showindex=False))
+        
+        # Show the seats and the payout distribution when looking at a single lineup
+        if len(lineups) == 1:
+            print("\nPer Seat:")
+            print(tabulate(seat_summary(battles), headers='keys', tablefmt='grid', floatfmt=['g', '.2f', '.2f', '.2f'],
+                          showindex=False))
+            counts, edges, losing = payout_histogram(battles)
+            seats = args.num * args.players
+            table_data = [["0 (lost)", losing, f"{losing / seats * 100:.2f}%"]]
+            table_data += [[f"{edges[i]:.2f}-{edges[i + 1]:.2f}", count, f"{count / seats * 100:.2f}%"]
+                           for i, count in enumerate(counts)]
+            print("\nPayout Distribution:")
+            print(tabulate(table_data, headers=["Payout", "Seats", "Share of Seats"], tablefmt="grid"))
+    
+    elif args.command == 'scenarios':
+        price_changes = None
+        if 'bootstrap' in args.kind:
+            if not args.reference or not os.path.exists(args.reference):
+                print("Error: bootstrap scenarios need an earlier case contents CSV (--reference).")
+                return
+            price_changes = bootstrap_price_changes(case_contents_df, pd.read_csv(args.reference))
+            if not len(price_changes):
+                print(f"Error: no item is priced in both {args.reference} and the current dataset.")
+                return
+        
+        inputs = build_scenario_inputs(cases_df, case_contents_df)
+        ratios = scenario_ev_ratios(inputs, args.kind, args.scenarios, args.seed, args.sigma, args.rarity_sigma,
+                                    price_changes)
+        summary_df, top_overlap = summarize_scenarios(inputs, ratios, args.confidence, args.top_k)
+        
+        print(f"\n=== EV Ratio Under {args.scenarios} Price Scenarios ({' + '.join(args.kind)}, "
+              f"{args.confidence:.0%} intervals) ===")
+        print(tabulate(summary_df.head(args.top), headers='keys', tablefmt='grid', floatfmt='.2f', showindex=False))
+        print(f"\nOn average, {top_overlap * 100:.1f}% of the top {args.top_k} cases stay in the top {args.top_k} "
+              f"of a scenario.")
+    
+    elif args.command == 'upgrade':
+        price_table = build_item_price_table(case_contents_df)
+        
+        if args.chain or args.chain_all:
+            # Opening a case versus opening it and upgrading the drop
+            if args.chain_all:
+                distributions = build_all_distributions(cases_df, case_contents_df)
+            else:
+                distributions = []
+                for case_name in args.chain:
+                    distribution = build_case_distribution(case_name, cases_df, case_contents_df)
+                    if distribution is None or not distribution['items']:
+                        print(f"Error: Case '{case_name}' not found in the dataset.")
+                        return
+                    distributions.append(distribution)
+            
+            chain_df = pd.DataFrame([chain_case_upgrade(distribution, price_table, args.chain_chance,
+                                                        args.chain_direction, args.house_edge)
+                                     for distribution in distributions])
+            print(f"\n=== Case Then Upgrade ({args.chain_chance:g}% {args.chain_direction}, "
+                  f"{args.house_edge:.0%} house edge) ===")
+            print(tabulate(chain_df.sort_values('Chained EV Ratio', ascending=False).head(args.top),
+                          headers='keys', tablefmt='grid', floatfmt='.2f', showindex=False))
+            return
+        
+        summary_df, top_df = sweep_upgrades(price_table, args.chances, args.directions, args.house_edge,
+                                            top=args.top, rank=args.rank)
+        
+        print(f"\n=== Upgrade Contracts ({len(price_table)} items, {args.house_edge:.0%} house edge) ===")
+        print(tabulate(summary_df, headers='keys', tablefmt='grid', floatfmt='.2f', showindex=False))
+        print(f"With a uniform roll every upgrade has an EV Ratio of 1 - house edge = {1 - args.house_edge:.2f} and "
+              f"loses {args.house_edge:.0%} of its stake on average; the source item only changes the balance top-up.")
+        
+        print(f"\n=== Top {args.top} Upgrades by {UPGRADE_RANKINGS[args.rank][0]} ===")
+        print(tabulate(top_df, headers='keys', tablefmt='grid', floatfmt='.2f', showindex=False))
     
     elif args.command == 'analyze':
         if args.case_name:
             # Analyze a specific case
-            case_ev = ev_df[ev_df['Case Name'] == args.case_name]
-            if case_ev.empty:
-                print(f"Error: Case '{args.case_name}' not found in the dataset.")
-                return
-            
-            risk_df = calculate_risk_metrics(cases_df, case_contents_df, [args.case_name])
-            
-            print(f"\n=== Analysis for {args.case_name} ===")
-            print(f"Case Price: ${case_ev['Case Price'].values[0]:.2f}")
-            print(f"Expected Value: ${case_ev['Expected Value'].values[0]:.2f}")
-            print(f"EV Ratio: {case_ev['EV Ratio'].values[0]:.2f}")
-            
             if not risk_df.empty:
-                print(f"Standard Deviation: ${risk_df['Standard Deviation'].values[0]:.2f}")
-                print(f"Coefficient of Variation: {risk_df['Coefficient of Variation'].values[0]:.2f}")
-                print(f"Probability of Profit: {risk_df['Probability of Profit (%)'].values[0]:.2f}%")
-                print(f"Max Potential Profit: ${risk_df['Max Potential Profit'].values[0]:.2f}")
+                risk_df = risk_df[risk_df['Case Name'] == args.case_name]
+            display_case_analysis(args.case_name, ev_df, risk_df)
+            if args.openings and args.case_name in ev_df['Case Name'].values:
+                cases_df, case_contents_df = load_data()
+                distribution = build_case_distribution(args.case_name, cases_df, case_contents_df)
+                display_n_opening_analysis(distribution, args.openings, args.alpha)
         else:
             # Analyze top cases
             if args.sort == 'ev':
@@ -435,8 +1188,6 @@ def main():
                               headers='keys', tablefmt='grid', floatfmt='.2f'))
             
             elif args.sort == 'profit-prob' or args.sort == 'max-profit':
-                risk_df = calculate_risk_metrics(cases_df, case_contents_df, ev_df['Case Name'].tolist())
-                
                 if args.sort == 'profit-prob':
                     sorted_df = risk_df.sort_values('Probability of Profit (%)', ascending=False).head(args.top)
                     print(f"\n=== Top {args.top} Cases by Probability of Profit ===")
@@ -455,10 +1206,8 @@ def main():
                               headers=['Case Name', 'Price'], tablefmt='grid', floatfmt='.2f'))
     
     elif args.command == 'recommend':
-        risk_df = calculate_risk_metrics(cases_df, case_contents_df, ev_df['Case Name'].tolist())
-        
         if args.type == 'all':
-            recommendations = get_recommendations(ev_df, risk_df, cases_df, 'all')
+            recommendations = tables['recommendations']
             
             print("\n=== Case Recommendations ===")
             
@@ -478,7 +1227,7 @@ def main():
             print(tabulate(recommendations['Budget'][['Case Name', 'Case Price', 'EV Ratio']], 
                           headers='keys', tablefmt='grid', floatfmt='.2f'))
         else:
-            recommendations = get_recommendations(ev_df, risk_df, cases_df, args.type)
+            recommendations = tables['recommendations'][RECOMMENDATION_TYPES[args.type]]
             
             print(f"\n=== Case Recommendations for {args.type.capitalize()} Players ===")
             
@@ -508,6 +1257,15 @@ def main():
     
     else:
         parser.print_help()
+    
+    if args.cache_stats:
+        if cache is None:
+            print("\nThe metrics cache is only used by the analyze and recommend commands.")
+        else:
+            print("\n=== Metrics Cache ===")
+            table_data = [[name, '-' if value is None else f"{value:.2f}" if isinstance(value, float) else value]
+                          for name, value in cache.stats().items()]
+            print(tabulate(table_data, tablefmt='grid'))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compiled Case Store
+
+Compiles data/cases.csv and data/case_contents_dataset.csv into flat binary
+arrays that can be memory-mapped with np.memmap. Rows are grouped by case with
+CSR-style offsets, so looking up a single case only touches the pages holding
+that case's rows instead of re-parsing both CSV files.
+
+The store is rebuilt automatically when the source CSVs change. Changes are
+detected from file size and modification time first, then confirmed with a
+content hash so that touching a file does not trigger a rebuild.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from case_sampling import make_distribution
+
+# Default locations of the source CSVs and of the compiled store
+CASES_CSV = 'data/cases.csv'
+CASE_CONTENTS_CSV = 'data/case_contents_dataset.csv'
+STORE_DIR = 'data/case_store'
+
+# Bump when the layout of the store changes
+STORE_VERSION = 1
+
+# Arrays of the store: name -> dtype
+STORE_ARRAYS = {
+    'offsets': np.int64,       # Row range of each case: offsets[i]:offsets[i + 1]
+    'case_prices': np.float64, # Price of each case (NaN when missing from cases.csv)
+    'odds': np.float64,        # Raw odds of each row
+    'norm_odds': np.float64,   # Odds normalized per case over rows with odds and price (0 otherwise)
+    'prices': np.float64,      # Item price of each row
+    'item_codes': np.int32     # Index of each row's item name in item_names.json
+}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 hash of a file.
+
+    Args:
+        path (str): Path of the file
+        chunk_size (int): Number of bytes read at a time
+
+    Returns:
+        str: Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprints(sources, previous=None):
+    """
+    Fingerprint the source files of the store.
+
+    Files whose size and modification time match the previous fingerprint keep
+    their previous hash; every other file is hashed again.
+
+    Args:
+        sources (list): Paths of the source files
+        previous (dict, optional): Previous fingerprints, keyed by path
+
+    Returns:
+        dict: Fingerprint (mtime_ns, size and sha256) of each source, keyed by path
+    """
+    previous = previous or {}
+    fingerprints = {}
+    for path in sources:
+        stat = os.stat(path)
+        old = previous.get(path)
+        if old and old['mtime_ns'] == stat.st_mtime_ns and old['size'] == stat.st_size:
+            sha256 = old['sha256']
+        else:
+            sha256 = file_sha256(path)
+        fingerprints[path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256}
+    return fingerprints
+
+
+def build_case_store(cases_csv=CASES_CSV, case_contents_csv=CASE_CONTENTS_CSV, store_dir=STORE_DIR,
+                     fingerprints=None):
+    """
+    Compile the case CSVs into a binary store.
+
+    Args:
+        cases_csv (str): Path of the cases CSV
+        case_contents_csv (str): Path of the case contents CSV
+        store_dir (str): Directory of the store
+        fingerprints (dict, optional): Precomputed source fingerprints
+
+    Returns:
+        str: The store directory
+    """
+    cases_df = pd.read_csv(cases_csv)
+    case_contents_df = pd.read_csv(case_contents_csv)
+
+    # Group rows by case, keeping cases in order of first appearance
+    case_codes, case_names = pd.factorize(case_contents_df['case_name'])
+    order = np.argsort(case_codes, kind='stable')
+    rows = case_contents_df.iloc[order[case_codes[order] >= 0]]
+    counts = np.bincount(case_codes[case_codes >= 0], minlength=len(case_names))
+    offsets = np.zeros(len(case_names) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    odds = rows['odds'].to_numpy(dtype=np.float64)
+    prices = rows['sub_steam_price_en'].to_numpy(dtype=np.float64)
+
+    # Normalize odds per case over the rows that can actually drop
+    valid = ~np.isnan(odds) & ~np.isnan(prices)
+    valid_odds = np.where(valid, odds, 0.0)
+    totals = np.add.reduceat(valid_odds, offsets[:-1]) if len(valid_odds) else np.zeros(0)
+    row_totals = np.repeat(totals, counts)
+    norm_odds = np.divide(valid_odds, row_totals, out=np.zeros_like(valid_odds), where=row_totals > 0)
+
+    # Dictionary-encode the item display names
+    labels = (rows['weapon_name'].astype(str) + ' | ' + rows['skin_name'].astype(str)
+              + ' (' + rows['sub_steam_short_exterior'].astype(str) + ')')
+    item_codes, item_names = pd.factorize(labels)
+
+    case_prices = cases_df.drop_duplicates('name').set_index('name')['price'].reindex(case_names)
+
+    arrays = {
+        'offsets': offsets,
+        'case_prices': case_prices.to_numpy(dtype=np.float64),
+        'odds': odds,
+        'norm_odds': norm_odds,
+        'prices': prices,
+        'item_codes': item_codes
+    }
+
+    # Drop the manifest first so an interrupted build is never seen as fresh
+    os.makedirs(store_dir, exist_ok=True)
+    manifest_path = os.path.join(store_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    for name, dtype in STORE_ARRAYS.items():
+        np.save(os.path.join(store_dir, f'{name}.npy'), np.ascontiguousarray(arrays[name], dtype=dtype))
+
+    with open(os.path.join(store_dir, 'case_names.json'), 'w', encoding='utf-8') as f:
+        json.dump([str(name) for name in case_names], f)
+    with open(os.path.join(store_dir, 'item_names.json'), 'w', encoding='utf-8') as f:
+        json.dump(list(item_names), f)
+
+    manifest = {
+        'version': STORE_VERSION,
+        'num_cases': len(case_names),
+        'num_rows': len(odds),
+        'sources': fingerprints or source_fingerprints([cases_csv, case_contents_csv])
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    return store_dir
+
+
+def read_manifest(store_dir=STORE_DIR):
+    """
+    Read the manifest of a store.
+
+    Args:
+        store_dir (str): Directory of the store
+
+    Returns:
+        dict: The manifest, or None if the store has not been built
+    """
+    try:
+        with open(os.path.join(store_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def open_case_store(cases_csv=CASES_CSV, case_contents_csv=CASE_CONTENTS_CSV, store_dir=STORE_DIR):
+    """
+    Open the compiled case store, rebuilding it first if the source CSVs changed.
+
+    Args:
+        cases_csv (str): Path of the cases CSV
+        case_contents_csv (str): Path of the case contents CSV
+        store_dir (str): Directory of the store
+
+    Returns:
+        dict: The store (memory-mapped arrays, case index and item names), or None if the
+            source CSVs are missing
+    """
+    sources = [cases_csv, case_contents_csv]
+    if not all(os.path.exists(path) for path in sources):
+        return None
+
+    manifest = read_manifest(store_dir)
+    previous = manifest['sources'] if manifest and manifest.get('version') == STORE_VERSION else None
+    fingerprints = source_fingerprints(sources, previous)
+
+    if previous is None or any(fingerprints[p]['sha256'] != previous.get(p, {}).get('sha256') for p in sources):
+        print("Building case store...")
+        build_case_store(cases_csv, case_contents_csv, store_dir, fingerprints)
+    elif fingerprints != previous:
+        # Same content with a new mtime: refresh the manifest so the next check stays cheap
+        manifest['sources'] = fingerprints
+        with open(os.path.join(store_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+    store = {name: np.load(os.path.join(store_dir, f'{name}.npy'), mmap_mode='r') for name in STORE_ARRAYS}
+    with open(os.path.join(store_dir, 'case_names.json'), 'r', encoding='utf-8') as f:
+        store['case_names'] = json.load(f)
+    store['case_index'] = {name: i for i, name in enumerate(store['case_names'])}
+    store['store_dir'] = store_dir
+
+    return store
+
+
+def load_item_names(store):
+    """
+    Load the item name dictionary of a store.
+
+    Args:
+        store (dict): The opened store
+
+    Returns:
+        list: Item display names, indexed by item code
+    """
+    if 'item_names' not in store:
+        with open(os.path.join(store['store_dir'], 'item_names.json'), 'r', encoding='utf-8') as f:
+            store['item_names'] = json.load(f)
+    return store['item_names']
+
+
+def case_slice(store, case_name):
+    """
+    Get the row range of a case.
+
+    Args:
+        store (dict): The opened store
+        case_name (str): Name of the case
+
+    Returns:
+        slice: Rows of the case, or None if the case is not in the store
+    """
+    case_id = store['case_index'].get(case_name)
+    if case_id is None:
+        return None
+    return slice(int(store['offsets'][case_id]), int(store['offsets'][case_id + 1]))
+
+
+def load_case_frames(store, case_name):
+    """
+    Load the rows of a single case as (cases_df, case_contents_df) frames.
+
+    The frames only hold the columns needed by the metric functions of
+    case_simulator, so they can be passed to them unchanged.
+
+    Args:
+        store (dict): The opened store
+        case_name (str): Name of the case
+
+    Returns:
+        tuple: (cases_df, case_contents_df), or (None, None) if the case is not in the store
+    """
+    rows = case_slice(store, case_name)
+    if rows is None:
+        return None, None
+
+    case_price = store['case_prices'][store['case_index'][case_name]]
+    cases_df = pd.DataFrame({'name': [case_name], 'price': [case_price]})
+    if np.isnan(case_price):
+        cases_df = cases_df.iloc[:0]
+
+    case_contents_df = pd.DataFrame({
+        'case_name': case_name,
+        'odds': np.array(store['odds'][rows]),
+        'sub_steam_price_en': np.array(store['prices'][rows])
+    })
+
+    return cases_df, case_contents_df
+
+
+def load_case_distribution(store, case_name):
+    """
+    Build the drop distribution of a case from the store.
+
+    The result is identical to case_sampling.build_case_distribution on the source CSVs.
+
+    Args:
+        store (dict): The opened store
+        case_name (str): Name of the case
+
+    Returns:
+        dict: Distribution of the case, or None if the case is not in the store
+    """
+    rows = case_slice(store, case_name)
+    if rows is None:
+        return None
+
+    odds = np.array(store['odds'][rows])
+    prices = np.array(store['prices'][rows])
+    valid = ~np.isnan(odds) & ~np.isnan(prices)
+
+    item_names = load_item_names(store)
+    items = [item_names[code] for code in store['item_codes'][rows][valid]]
+
+    case_price = store['case_prices'][store['case_index'][case_name]]
+    case_price = 0 if np.isnan(case_price) else case_price
+
+    return make_distribution(case_name, case_price, items, odds[valid], prices[valid])
+
+
+if __name__ == "__main__":
+    build_case_store()
+    print(f"Saved case store to {STORE_DIR}")
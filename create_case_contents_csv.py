@@ -1,116 +1,300 @@
+import argparse
 import json
 import pandas as pd
 import os
+from concurrent.futures import ProcessPoolExecutor
 
-def create_case_contents_csv():
+from instrumentation import add_profile_arguments, increment, report_profiling, stage, start_profiling
+
+# Parent item fields: output column -> (key in the API response, default value)
+PARENT_FIELDS = {
+    'item_name': ('item_name', ''),
+    'weapon_name': ('weapon_name', ''),
+    'skin_name': ('skin_name', ''),
+    'rarity': ('rarity', ''),
+    'steam_type': ('steam_type', ''),
+    'steam_itemtype': ('steam_itemtype', ''),
+    'steam_exterior': ('steam_exterior', ''),
+    'steam_short_exterior': ('steam_short_exterior', ''),
+    'is_stattrak': ('is_stattrak', False),
+    'steam_is_souvenir': ('steam_is_souvenir', False),
+    'steam_market_hash_name': ('steam_market_hash_name', ''),
+    'steam_image': ('steam_image', ''),
+    'is_shard': ('is_shard', False),
+    'game': ('game', '')
+}
+
+# Sub-item fields: output column -> (key in the API response, default value)
+SUB_ITEM_FIELDS = {
+    'min': ('min', 0),
+    'max': ('max', 0),
+    'odds': ('odds', 0),
+    'sub_steam_exterior': ('steam_exterior', ''),
+    'sub_steam_short_exterior': ('steam_short_exterior', ''),
+    'sub_is_stattrak': ('is_stattrak', False),
+    'sub_rarity': ('rarity', ''),
+    'sub_steam_image': ('steam_image', ''),
+    'sub_game': ('game', ''),
+    'sub_steam_price_en': ('steam_price_en', 0)
+}
+
+# Columns of the output CSV
+COLUMNS = ['case_name'] + list(PARENT_FIELDS) + ['is_sub_item'] + list(SUB_ITEM_FIELDS)
+
+# Number of rows written to the CSV at a time
+DEFAULT_CHUNK_SIZE = 50000
+
+# Number of characters read at a time from the combined JSON file
+READ_SIZE = 1 << 20
+
+
+def flatten_case(case_name, case_data):
+    """
+    Flatten the items of a case into rows with their parent data.
+
+    Args:
+        case_name (str): Name of the case
+        case_data (dict): Content of the case from the API
+
+    Yields:
+        tuple: Values of one row, in the order of COLUMNS
+    """
+    print(f"Processing case: {case_name}")
+
+    # Check if itemlist exists in the case data
+    if 'itemlist' not in case_data:
+        print(f"Warning: No itemlist found for case {case_name}")
+        return
+
+    # Process each parent item in the case
+    for parent_item in case_data['itemlist']:
+        # Extract parent item data
+        parent_data = (case_name,) + tuple(parent_item.get(key, default) for key, default in PARENT_FIELDS.values())
+
+        # Check if the parent item has sub-items
+        if 'items' in parent_item and parent_item['items']:
+            # Process each sub-item, sharing the parent data between rows
+            for sub_item in parent_item['items']:
+                yield parent_data + (True,) + tuple(sub_item.get(key, default) for key, default in SUB_ITEM_FIELDS.values())
+        else:
+            # If there are no sub-items, add the parent item as is
+            yield parent_data + (False,) + (None,) * len(SUB_ITEM_FIELDS)
+
+
+def iter_combined_json(json_file, read_size=READ_SIZE):
+    """
+    Read the cases of a combined case contents JSON file one at a time.
+
+    Only one case is held in memory at a time, instead of the whole file.
+
+    Args:
+        json_file (str): Path of the combined JSON file ({case_name: case_data, ...})
+        read_size (int): Number of characters read at a time
+
+    Yields:
+        tuple: (case_name, case_data) for each case
+
+    Raises:
+        json.JSONDecodeError: If the file is not a valid JSON object
+    """
+    decoder = json.JSONDecoder()
+
+    with open(json_file, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def fill(min_size=0):
+            # Drop what has been parsed and read at least one more block
+            nonlocal buffer, pos, eof
+            buffer = buffer[pos:]
+            pos = 0
+            block = f.read(max(read_size, min_size))
+            if not block:
+                eof = True
+            buffer += block
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        def decode():
+            # Decode the next value, reading more of the file while it is incomplete
+            nonlocal pos
+            attempt_size = read_size
+            while True:
+                try:
+                    with stage('json_parse'):
+                        value, end = decoder.raw_decode(buffer, pos)
+                    # A value ending exactly at the buffer end may be a truncated number
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                # Grow the reads geometrically so large cases are not re-parsed too often
+                fill(attempt_size)
+                attempt_size *= 2
+
+        def expect(char):
+            nonlocal pos
+            skip_whitespace()
+            if pos >= len(buffer) or buffer[pos] != char:
+                raise json.JSONDecodeError(f"Expecting '{char}'", buffer, pos)
+            pos += 1
+
+        expect('{')
+        skip_whitespace()
+        if pos < len(buffer) and buffer[pos] == '}':
+            return
+
+        while True:
+            skip_whitespace()
+            case_name = decode()
+            expect(':')
+            skip_whitespace()
+            case_data = decode()
+            yield case_name, case_data
+
+            skip_whitespace()
+            if pos < len(buffer) and buffer[pos] == ',':
+                pos += 1
+                continue
+            expect('}')
+            return
+
+
+def flatten_case_file(case_file):
+    """
+    Flatten a per-case JSON file. Used as a process pool worker.
+
+    Args:
+        case_file (str): Path of the case file (data/case_contents/{case_name}.json)
+
+    Returns:
+        list: Rows of the case, in the order of COLUMNS
+    """
+    case_name = os.path.splitext(os.path.basename(case_file))[0]
+    with open(case_file, 'r', encoding='utf-8') as f:
+        case_data = json.load(f)
+    return list(flatten_case(case_name, case_data))
+
+
+def iter_case_file_rows(case_dir, workers=None):
+    """
+    Flatten the per-case JSON files of a directory on a process pool.
+
+    At most a few files per worker are in flight, so memory does not grow
+    with the number of files.
+
+    Args:
+        case_dir (str): Directory containing one JSON file per case
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs
+
+    Yields:
+        list: Rows of each case, in file name order
     """
-    Process the case_contents.json file and create a CSV dataset with sub-items and their parent data.
-    
+    case_files = sorted(os.path.join(case_dir, name) for name in os.listdir(case_dir) if name.endswith('.json'))
+    workers = workers or os.cpu_count() or 1
+    window = workers * 4
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = [executor.submit(flatten_case_file, case_file) for case_file in case_files[:window]]
+        next_file = len(pending)
+        while pending:
+            rows = pending.pop(0).result()
+            if next_file < len(case_files):
+                pending.append(executor.submit(flatten_case_file, case_files[next_file]))
+                next_file += 1
+            yield rows
+
+
+def create_case_contents_csv(json_file='data/case_contents.json', output_file='data/case_contents_dataset.csv',
+                             case_dir=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None):
+    """
+    Process the case contents JSON and create a CSV dataset with sub-items and their parent data.
+
     This function:
-    1. Reads the case_contents.json file
+    1. Reads the cases one at a time, from the combined case_contents.json file or
+       from the per-case files in case_dir
     2. Extracts parent item data and sub-item data
-    3. Combines them into a single dataset
-    4. Saves the result as a CSV file
-    
+    3. Combines them into rows
+    4. Writes the rows to the CSV file in chunks, so memory stays bounded by the chunk size
+
+    Args:
+        json_file (str): Path of the combined case contents JSON file
+        output_file (str): Path of the output CSV file
+        case_dir (str, optional): Directory of per-case JSON files to read instead of json_file.
+            The files are flattened on a process pool
+        chunk_size (int): Number of rows written at a time
+        workers (int, optional): Number of worker processes when reading case_dir
+
     Returns:
         str: The filename of the created CSV file, or None if an error occurred
     """
-    # Path to the case_contents.json file
-    json_file = 'data/case_contents.json'
-    
-    # Output CSV file path
-    output_file = 'data/case_contents_dataset.csv'
-    
+    source = case_dir or json_file
+
     try:
-        # Read the JSON file
-        print(f"Reading {json_file}...")
-        with open(json_file, 'r', encoding='utf-8') as f:
-            case_contents = json.load(f)
-        
-        print(f"Successfully loaded {json_file}")
-        
-        # List to store all items with their parent data
-        all_items = []
-        
-        # Process each case
-        for case_name, case_data in case_contents.items():
-            print(f"Processing case: {case_name}")
-            
-            # Check if itemlist exists in the case data
-            if 'itemlist' not in case_data:
-                print(f"Warning: No itemlist found for case {case_name}")
-                continue
-            
-            # Process each parent item in the case
-            for parent_item in case_data['itemlist']:
-                # Extract parent item data
-                parent_data = {
-                    'case_name': case_name,
-                    'item_name': parent_item.get('item_name', ''),
-                    'weapon_name': parent_item.get('weapon_name', ''),
-                    'skin_name': parent_item.get('skin_name', ''),
-                    'rarity': parent_item.get('rarity', ''),
-                    'steam_type': parent_item.get('steam_type', ''),
-                    'steam_itemtype': parent_item.get('steam_itemtype', ''),
-                    'steam_exterior': parent_item.get('steam_exterior', ''),
-                    'steam_short_exterior': parent_item.get('steam_short_exterior', ''),
-                    'is_stattrak': parent_item.get('is_stattrak', False),
-                    'steam_is_souvenir': parent_item.get('steam_is_souvenir', False),
-                    'steam_market_hash_name': parent_item.get('steam_market_hash_name', ''),
-                    'steam_image': parent_item.get('steam_image', ''),
-                    'is_shard': parent_item.get('is_shard', False),
-                    'game': parent_item.get('game', '')
-                }
-                
-                # Check if the parent item has sub-items
-                if 'items' in parent_item and parent_item['items']:
-                    # Process each sub-item
-                    for sub_item in parent_item['items']:
-                        # Create a copy of parent data
-                        item_data = parent_data.copy()
-                        
-                        # Add sub-item specific data
-                        item_data.update({
-                            'is_sub_item': True,
-                            'min': sub_item.get('min', 0),
-                            'max': sub_item.get('max', 0),
-                            'odds': sub_item.get('odds', 0),
-                            'sub_steam_exterior': sub_item.get('steam_exterior', ''),
-                            'sub_steam_short_exterior': sub_item.get('steam_short_exterior', ''),
-                            'sub_is_stattrak': sub_item.get('is_stattrak', False),
-                            'sub_rarity': sub_item.get('rarity', ''),
-                            'sub_steam_image': sub_item.get('steam_image', ''),
-                            'sub_game': sub_item.get('game', ''),
-                            'sub_steam_price_en': sub_item.get('steam_price_en', 0)
-                        })
-                        
-                        # Add to the list of all items
-                        all_items.append(item_data)
-                else:
-                    # If there are no sub-items, add the parent item as is
-                    parent_data['is_sub_item'] = False
-                    all_items.append(parent_data)
-        
-        # Create a DataFrame from the list of items
-        df = pd.DataFrame(all_items)
-        
-        # Save to CSV
-        df.to_csv(output_file, index=False)
-        
-        print(f"Successfully created CSV dataset with {len(df)} items")
+        print(f"Reading {source}...")
+
+        if case_dir:
+            case_rows = iter_case_file_rows(case_dir, workers)
+        else:
+            case_rows = (flatten_case(case_name, case_data) for case_name, case_data in iter_combined_json(json_file))
+
+        total_rows = 0
+        chunk = []
+
+        def write_chunk(header):
+            with stage('write_csv'):
+                pd.DataFrame.from_records(chunk, columns=COLUMNS).to_csv(f, header=header, index=False)
+            increment('rows_written', len(chunk))
+
+        with open(output_file, 'w', encoding='utf-8', newline='') as f:
+            for rows in case_rows:
+                with stage('flatten'):
+                    chunk.extend(rows)
+                if len(chunk) >= chunk_size:
+                    write_chunk(header=total_rows == 0)
+                    total_rows += len(chunk)
+                    chunk = []
+
+            # Write the remaining rows (and the header if there were no rows at all)
+            if chunk or total_rows == 0:
+                write_chunk(header=total_rows == 0)
+                total_rows += len(chunk)
+
+        print(f"Successfully created CSV dataset with {total_rows} items")
         print(f"Saved to {output_file}")
-        
+
         return output_file
-    
+
     except FileNotFoundError:
-        print(f"Error: File {json_file} not found")
+        print(f"Error: File {source} not found")
         return None
     except json.JSONDecodeError:
-        print(f"Error: Invalid JSON format in {json_file}")
+        print(f"Error: Invalid JSON format in {source}")
         return None
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return None
 
 if __name__ == "__main__":
-    create_case_contents_csv()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Create the case contents CSV dataset')
+    parser.add_argument('--json', default='data/case_contents.json', help='Combined case contents JSON file')
+    parser.add_argument('--case-dir', help='Read the per-case JSON files of this directory instead (e.g. data/case_contents)')
+    parser.add_argument('--output', default='data/case_contents_dataset.csv', help='Output CSV file')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Number of rows written at a time')
+    parser.add_argument('--workers', type=int, help='Number of worker processes for --case-dir (default: all CPUs)')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    start_profiling(args)
+    create_case_contents_csv(args.json, args.output, args.case_dir, args.chunk_size, args.workers)
+    report_profiling(args)
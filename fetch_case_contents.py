@@ -1,18 +1,276 @@
+import argparse
+import random
+import threading
 import requests
 import pandas as pd
 import json
 import time
 import os
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
 
-def fetch_case_contents():
+from http_cache import add_cache_arguments, mount_cache, open_http_cache
+from instrumentation import add_profile_arguments, increment, observe, report_profiling, stage, start_profiling
+from snapshot_store import add_snapshot_arguments, open_snapshot_store
+
+# Base URL of the Hellcase API
+API_BASE_URL = "https://api.hellcase.com"
+
+# Headers for API requests
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://hellcase.com/',
+    'Origin': 'https://hellcase.com'
+}
+
+# Append-only journal of fetched case contents, one JSON object per line
+JOURNAL_FILE = "data/case_contents_journal.jsonl"
+
+# HTTP status codes that are worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    
+    Tokens are added at a fixed rate up to the bucket capacity, and each request
+    takes one token, waiting for it if the bucket is empty. The capacity sets how
+    many requests can be sent in a burst after an idle period.
+    """
+    
+    def __init__(self, rate, capacity=1):
+        """
+        Args:
+            rate (float): Number of tokens added per second
+            capacity (int): Maximum number of tokens in the bucket
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Take a token from the bucket, waiting until one is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def create_session(pool_size=10, cache=None, rate_limiter=None):
+    """
+    Create a requests session with a pool of keep-alive connections.
+    
+    Args:
+        pool_size (int): Maximum number of connections kept open
+        cache (HTTPCache, optional): Answer the requests from this response cache
+        rate_limiter (TokenBucket, optional): With a cache, pace the requests that miss it with this
+            rate limiter, instead of passing it to fetch_case
+    
+    Returns:
+        Session: The configured session
+    """
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    if cache is not None:
+        mount_cache(session, cache, pool_size, rate_limiter)
+        return session
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def retry_delay(response, attempt, backoff=1.0, max_backoff=60.0):
+    """
+    Get how long to wait before retrying a request.
+    
+    The Retry-After header is honoured when present; otherwise the delay is an
+    exponential backoff with full jitter.
+    
+    Args:
+        response (Response): The failed response, or None for connection errors
+        attempt (int): Number of the failed attempt, starting at 0
+        backoff (float): Base backoff delay in seconds
+        max_backoff (float): Maximum backoff delay in seconds
+    
+    Returns:
+        float: Delay in seconds
+    """
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+def fetch_case(session, case_name, rate_limiter=None, base_url=API_BASE_URL, max_retries=5, backoff=1.0):
+    """
+    Fetch the content of a single case, retrying rate-limited and server errors.
+    
+    Args:
+        session (Session): Session used for the request
+        case_name (str): Name of the case
+        rate_limiter (TokenBucket, optional): Rate limiter shared by all requests
+        base_url (str): Base URL of the API
+        max_retries (int): Maximum number of retries
+        backoff (float): Base backoff delay in seconds
+    
+    Returns:
+        dict: The parsed JSON response
+    
+    Raises:
+        requests.exceptions.RequestException: If the request still fails after all retries
+    """
+    url = f"{base_url}/open/{case_name}"
+    
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        
+        increment('http_requests')
+        try:
+            with stage('http'):
+                response = session.get(url, timeout=30)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            increment('http_errors')
+            if attempt == max_retries:
+                raise
+            increment('http_retries')
+            time.sleep(retry_delay(None, attempt, backoff))
+            continue
+        # Responses served from the response cache did not reach the network and are not observed
+        if response.headers.get('X-Cache') != 'HIT':
+            observe('http_request_seconds', response.elapsed.total_seconds())
+        increment('http_bytes', len(response.content))
+        
+        if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+            increment('http_retries')
+            time.sleep(retry_delay(response, attempt, backoff))
+            continue
+        
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        with stage('json_parse'):
+            return response.json()
+
+
+def read_journal(journal_file):
+    """
+    Read the cases recorded in a journal.
+    
+    A partially written last line (e.g. after a crash) is ignored.
+    
+    Args:
+        journal_file (str): Path of the journal
+    
+    Yields:
+        tuple: (case_name, data) for each complete journal entry
+    """
+    if not os.path.exists(journal_file):
+        return
+    
+    with open(journal_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            entry = json.loads(line)
+            yield entry['case_name'], entry['data']
+
+
+def open_journal(journal_file, resume=False):
+    """
+    Open the journal for appending.
+    
+    When resuming, any partially written last line is cut off so new entries
+    start on a clean line; otherwise the journal is started over.
+    
+    Args:
+        journal_file (str): Path of the journal
+        resume (bool): Whether to keep the existing entries
+    
+    Returns:
+        file: The journal opened for appending
+    """
+    if not resume or not os.path.exists(journal_file):
+        return open(journal_file, 'w', encoding='utf-8')
+    
+    # Find the end of the last complete line
+    with open(journal_file, 'rb') as f:
+        content = f.read()
+    valid_length = content.rfind(b'\n') + 1
+    if valid_length < len(content):
+        with open(journal_file, 'r+b') as f:
+            f.truncate(valid_length)
+    
+    return open(journal_file, 'a', encoding='utf-8')
+
+
+def write_combined_json(journal_file, output_file):
+    """
+    Write the combined case contents JSON from the journal in a single streaming pass.
+    
+    Args:
+        journal_file (str): Path of the journal
+        output_file (str): Path of the combined JSON file
+    
+    Returns:
+        int: Number of cases written
+    """
+    written = set()
+    with stage('write_json'), open(output_file, 'w', encoding='utf-8') as f:
+        f.write('{')
+        for case_name, data in read_journal(journal_file):
+            if case_name in written:
+                continue
+            f.write(',\n' if written else '\n')
+            f.write(f"  {json.dumps(case_name)}: {json.dumps(data)}")
+            written.add(case_name)
+        f.write('\n}\n')
+    
+    return len(written)
+
+
+def fetch_case_contents(concurrency=4, rate=2.0, burst=1, base_url=API_BASE_URL, max_retries=5,
+                        resume=False, journal_file=JOURNAL_FILE, cache=None, snapshots=None):
     """
     Fetch the contents of each case from the Hellcase API.
     
     This function:
     1. Reads case names from data/cases.csv
-    2. For each case, makes a request to the Hellcase API to get its content
-    3. Saves the response data to a JSON file
+    2. Fetches the content of each case from the Hellcase API on a pool of
+       threads sharing a keep-alive session and a token bucket rate limiter
+    3. Appends each response to a JSONL journal as it arrives
+    4. Writes the combined JSON file from the journal at the end
+    5. Records the cases in the snapshot store, if given
+    
+    Args:
+        concurrency (int): Number of requests in flight at the same time
+        rate (float): Maximum number of requests per second
+        burst (int): Maximum number of requests sent in a burst
+        base_url (str): Base URL of the API
+        max_retries (int): Maximum number of retries for rate-limited and server errors
+        resume (bool): Skip the cases already recorded in the journal
+        journal_file (str): Path of the journal
+        cache (HTTPCache, optional): Response cache answering the requests it holds
+        snapshots (SnapshotStore, optional): Snapshot store recording the fetch
     
     Returns:
         str: The filename of the created JSON file, or None if an error occurred
@@ -29,17 +287,11 @@ def fetch_case_contents():
         print(f"Error reading CSV file: {e}")
         return None
     
-    # Headers for API requests
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://hellcase.com/',
-        'Origin': 'https://hellcase.com'
-    }
-    
-    # Dictionary to store case contents
-    case_contents = {}
+    # Skip the cases already recorded in the journal when resuming
+    if resume:
+        done = {case_name for case_name, _ in read_journal(journal_file)}
+        case_names = [case_name for case_name in case_names if case_name not in done]
+        print(f"Resuming: {len(done)} cases already in {journal_file}, {len(case_names)} left to fetch.")
     
     # Counter for successful and failed requests
     successful = 0
@@ -49,62 +301,81 @@ def fetch_case_contents():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_file = f"data/case_contents_{timestamp}.json"
     
-    # Fetch content for each case
-    for i, case_name in enumerate(case_names):
-        print(f"Processing case {i+1}/{len(case_names)}: {case_name}")
-        
-        # Construct API URL
-        url = f"https://api.hellcase.com/open/{case_name}"
+    rate_limiter = TokenBucket(rate, burst)
+    session = create_session(concurrency, cache, rate_limiter)
+    if cache is not None:
+        # The cache paces the requests that reach the API; cached responses are not rate limited
+        rate_limiter = None
+    
+    with open_journal(journal_file, resume) as journal, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(fetch_case, session, case_name, rate_limiter, base_url, max_retries): case_name
+                   for case_name in case_names}
         
-        try:
-            # Make API request
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            
-            # Parse JSON response
-            data = response.json()
-            
-            # Save individual case content to a file
-            case_file = f"data/case_contents/{case_name}.json"
-            with open(case_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2)
-            
-            # Add to the combined dictionary
-            case_contents[case_name] = data
-            successful += 1
+        # Handle responses as they arrive
+        for i, future in enumerate(as_completed(futures)):
+            case_name = futures[future]
+            print(f"Processed case {i+1}/{len(case_names)}: {case_name}")
             
-            # Print success message
-            print(f"  Success: Saved content for {case_name}")
-            
-            # Sleep to avoid overwhelming the API
-            time.sleep(1)  # 1 second delay between requests
-            
-        except requests.exceptions.RequestException as e:
-            print(f"  Error making API request for {case_name}: {e}")
-            failed += 1
-        except json.JSONDecodeError as e:
-            print(f"  Error parsing JSON response for {case_name}: {e}")
-            failed += 1
-        except Exception as e:
-            print(f"  An unexpected error occurred for {case_name}: {e}")
-            failed += 1
-        
-        # Save the combined data periodically (every 10 cases)
-        if (i + 1) % 10 == 0:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(case_contents, f, indent=2)
-            print(f"Saved progress to {output_file} after {i+1} cases")
+            try:
+                data = future.result()
+                
+                with stage('write_json'):
+                    # Save individual case content to a file
+                    case_file = f"data/case_contents/{case_name}.json"
+                    with open(case_file, 'w', encoding='utf-8') as f:
+                        json.dump(data, f, indent=2)
+                    
+                    # Record the case in the journal right away
+                    journal.write(json.dumps({'case_name': case_name, 'data': data}) + '\n')
+                    journal.flush()
+                increment('cases_fetched')
+                successful += 1
+                
+                # Print success message
+                print(f"  Success: Saved content for {case_name}")
+                
+            except requests.exceptions.RequestException as e:
+                print(f"  Error making API request for {case_name}: {e}")
+                failed += 1
+            except json.JSONDecodeError as e:
+                print(f"  Error parsing JSON response for {case_name}: {e}")
+                failed += 1
+            except Exception as e:
+                print(f"  An unexpected error occurred for {case_name}: {e}")
+                failed += 1
     
     # Save the final combined data
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(case_contents, f, indent=2)
+    total = write_combined_json(journal_file, output_file)
     
     print(f"\nCompleted processing {len(case_names)} cases:")
     print(f"  Successful: {successful}")
     print(f"  Failed: {failed}")
-    print(f"Saved all case contents to {output_file}")
+    print(f"Saved all {total} case contents to {output_file}")
+    
+    if snapshots is not None:
+        manifest = snapshots.record_contents(dict(read_journal(journal_file)).items())
+        print(f"Recorded snapshot {manifest['id']} ({manifest['new_blobs']} new blobs)")
     
     return output_file
 
 if __name__ == "__main__":
-    fetch_case_contents()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Fetch the contents of every case from the Hellcase API')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of requests in flight at the same time')
+    parser.add_argument('--rate', type=float, default=2.0, help='Maximum number of requests per second')
+    parser.add_argument('--burst', type=int, default=1, help='Maximum number of requests sent in a burst')
+    parser.add_argument('--retries', type=int, default=5, help='Maximum number of retries for 429 and 5xx responses')
+    parser.add_argument('--base-url', default=API_BASE_URL, help='Base URL of the API (e.g. a local stub server)')
+    parser.add_argument('--resume', action='store_true', help='Skip the cases already recorded in the journal')
+    parser.add_argument('--journal', default=JOURNAL_FILE, help='Path of the JSONL journal')
+    add_cache_arguments(parser)
+    add_snapshot_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    
+    start_profiling(args)
+    cache = open_http_cache(args)
+    fetch_case_contents(args.concurrency, args.rate, args.burst, args.base_url, args.retries,
+                        args.resume, args.journal, cache, open_snapshot_store(args))
+    if cache is not None:
+        cache.print_stats()
+    report_profiling(args)
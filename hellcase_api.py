@@ -1,86 +1,145 @@
+import argparse
 import requests
 import csv
 import json
 from datetime import datetime
 
-def fetch_hellcase_data():
+from http_cache import add_cache_arguments, mount_cache, open_http_cache
+from instrumentation import add_profile_arguments, increment, observe, report_profiling, stage, start_profiling
+from snapshot_store import add_snapshot_arguments, open_snapshot_store
+
+# Base URL of the Hellcase API
+API_BASE_URL = "https://api.hellcase.com"
+
+# Headers that mimic a browser
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://hellcase.com/',
+    'Origin': 'https://hellcase.com'
+}
+
+def fetch_cases(base_url=API_BASE_URL, session=None):
+    """
+    Fetch the cases listed on the Hellcase main page.
+
+    Args:
+        base_url (str): Base URL of the API
+        session (Session, optional): Session used for the request (e.g. with a response cache)
+
+    Returns:
+        list: Case dictionaries, with is_new and is_top taken out of their settings
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails
+        json.JSONDecodeError: If the response is not valid JSON
+    """
+    # API endpoint for CS:GO cases
+    url = f"{base_url}/mainpage?game=csgo"
+
+    with stage('http'):
+        response = (session or requests).get(url, headers=HEADERS)
+    # Responses served from the response cache did not reach the network and are not observed
+    if response.headers.get('X-Cache') != 'HIT':
+        observe('http_request_seconds', response.elapsed.total_seconds())
+    increment('http_requests')
+    increment('http_bytes', len(response.content))
+    response.raise_for_status()  # Raise an exception for HTTP errors
+
+    # Parse the JSON response
+    with stage('json_parse'):
+        data = response.json()
+
+    # Extract cases data from the main_page section
+    cases = []
+    for section in data.get('main_page', []):
+        if 'cases_to_show' in section:
+            cases.extend(section['cases_to_show'])
+
+    # Extract is_new and is_top from settings dictionary
+    for case in cases:
+        if 'settings' in case and isinstance(case['settings'], dict):
+            # Extract values from settings
+            case['is_new'] = case['settings'].get('is_new', False)
+            case['is_top'] = case['settings'].get('is_top', False)
+            # Remove the settings field to avoid duplication
+            del case['settings']
+
+    return cases
+
+def write_cases_csv(cases, filename):
+    """
+    Save cases to a CSV file.
+
+    Args:
+        cases (list): Case dictionaries, as returned by fetch_cases
+        filename (str): Path of the CSV file
+    """
+    # Collect all possible fields from all cases to ensure we capture all fields
+    # This is important because different cases might have different fields
+    all_fields = set()
+    for case in cases:
+        all_fields.update(case.keys())
+
+    # Define CSV headers based on all possible fields and sort them for consistency
+    headers = sorted(list(all_fields))
+
+    # Write data to CSV file
+    with stage('write_csv'), open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=headers)
+        writer.writeheader()
+
+        for case in cases:
+            # Handle nested dictionaries by converting them to JSON strings
+            # This is necessary because CSV can't directly store nested structures
+            for key, value in case.items():
+                if isinstance(value, dict):
+                    case[key] = json.dumps(value)
+            # Write the case data to the CSV file
+            writer.writerow(case)
+    increment('rows_written', len(cases))
+
+def fetch_hellcase_data(base_url=API_BASE_URL, cache=None, snapshots=None):
     """
     Fetch case data from Hellcase API and save it to a CSV file.
 
     This function:
-    1. Makes a request to the Hellcase API endpoint for CS:GO cases
-    2. Parses the JSON response
-    3. Extracts case data from the 'main_page' section
-    4. Saves the data to a CSV file with a timestamp in the filename
+    1. Fetches the cases listed on the main page (see fetch_cases)
+    2. Saves the data to a CSV file with a timestamp in the filename
+    3. Records the cases in the snapshot store, if given
+
+    Args:
+        base_url (str): Base URL of the API
+        cache (HTTPCache, optional): Response cache answering the request if it holds it
+        snapshots (SnapshotStore, optional): Snapshot store recording the fetch
 
     Returns:
         str: The filename of the created CSV file, or None if an error occurred
     """
-    # API endpoint
-    url = "https://api.hellcase.com/mainpage?game=csgo"
+    session = None
+    if cache is not None:
+        session = requests.Session()
+        mount_cache(session, cache)
 
     try:
-        # Make the API request with headers that mimic a browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://hellcase.com/',
-            'Origin': 'https://hellcase.com'
-        }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-
-        # Parse the JSON response
-        data = response.json()
-
-        # Extract cases data from the main_page section
-        cases = []
-        for section in data.get('main_page', []):
-            if 'cases_to_show' in section:
-                cases.extend(section['cases_to_show'])
+        cases = fetch_cases(base_url, session)
 
         if not cases:
             print("No case data found in the API response.")
             return
 
-        # Extract is_new and is_top from settings dictionary
-        for case in cases:
-            if 'settings' in case and isinstance(case['settings'], dict):
-                # Extract values from settings
-                case['is_new'] = case['settings'].get('is_new', False)
-                case['is_top'] = case['settings'].get('is_top', False)
-                # Remove the settings field to avoid duplication
-                del case['settings']
-
         # Generate filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"hellcase_cases_{timestamp}.csv"
 
-        # Collect all possible fields from all cases to ensure we capture all fields
-        # This is important because different cases might have different fields
-        all_fields = set()
-        for case in cases:
-            all_fields.update(case.keys())
-
-        # Define CSV headers based on all possible fields and sort them for consistency
-        headers = sorted(list(all_fields))
-
-        # Write data to CSV file
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=headers)
-            writer.writeheader()
-
-            for case in cases:
-                # Handle nested dictionaries by converting them to JSON strings
-                # This is necessary because CSV can't directly store nested structures
-                for key, value in case.items():
-                    if isinstance(value, dict):
-                        case[key] = json.dumps(value)
-                # Write the case data to the CSV file
-                writer.writerow(case)
+        write_cases_csv(cases, filename)
 
         print(f"Successfully saved {len(cases)} cases to {filename}")
+
+        if snapshots is not None:
+            manifest = snapshots.record_mainpage(cases)
+            print(f"Recorded snapshot {manifest['id']} ({manifest['new_blobs']} new blobs)")
         return filename
 
     except requests.exceptions.RequestException as e:
@@ -91,4 +150,16 @@ def fetch_hellcase_data():
         print(f"An unexpected error occurred: {e}")
 
 if __name__ == "__main__":
-    fetch_hellcase_data()
+    parser = argparse.ArgumentParser(description='Fetch the list of cases from the Hellcase API')
+    parser.add_argument('--base-url', default=API_BASE_URL, help='Base URL of the API (e.g. a local stub server)')
+    add_cache_arguments(parser)
+    add_snapshot_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    start_profiling(args)
+    cache = open_http_cache(args)
+    fetch_hellcase_data(args.base_url, cache, open_snapshot_store(args))
+    if cache is not None:
+        cache.print_stats()
+    report_profiling(args)
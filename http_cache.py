@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP Response Cache
+
+On-disk cache of API responses, mounted under the requests sessions of the
+fetchers as a transport adapter, so repeated runs do not hit the API for
+responses they already have. The cache is opt-in (--http-cache): case
+contents carry the item prices, so a cached response can be up to its
+time-to-live older than the prices on the site.
+- Bodies are stored content-addressed (by their SHA-256) and gzip-compressed
+  in blobs/, so identical responses are stored once.
+- Each URL has a small entry file in entries/ pointing at its body, with the
+  time it was stored. The modification time of the entry is its last use.
+- Entries expire after a time-to-live set per endpoint (the main page changes
+  more often than the contents of a case).
+- The total size of the bodies is capped; beyond it the least recently used
+  entries are evicted.
+- In offline mode every request is answered from the cache, expired or not,
+  and requests missing from it fail without touching the network.
+
+Only successful GET responses are cached.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from instrumentation import increment
+
+# Default location of the cache
+CACHE_DIR = 'data/http_cache'
+
+# Default time-to-live of the responses of each endpoint, in seconds
+DEFAULT_TTLS = {
+    'mainpage': 10 * 60,
+    'open': 24 * 60 * 60,
+    'default': 60 * 60
+}
+
+# Default maximum total size of the cached bodies, in bytes
+DEFAULT_MAX_BYTES = 500 * 2**20
+
+# Share of the maximum size kept after an eviction, so evictions do not run on every store
+EVICTION_TARGET = 0.9
+
+# Response headers stored with the body
+STORED_HEADERS = ('Content-Type',)
+
+
+class CacheMissError(requests.exceptions.RequestException):
+    """Raised in offline mode for a request that is not in the cache."""
+
+
+def endpoint_of(url):
+    """
+    Get the endpoint of an API URL, used to pick its time-to-live.
+
+    Args:
+        url (str): URL of the request
+
+    Returns:
+        str: 'mainpage', 'open' or 'default'
+    """
+    path = urlparse(url).path
+    if path.rstrip('/').endswith('/mainpage'):
+        return 'mainpage'
+    if '/open/' in path:
+        return 'open'
+    return 'default'
+
+
+class HTTPCache:
+    """
+    Content-addressed, compressed, size-capped cache of HTTP responses.
+
+    Args:
+        cache_dir (str): Directory of the cache
+        ttls (dict, optional): Time-to-live of each endpoint in seconds, overriding DEFAULT_TTLS
+        max_bytes (int): Maximum total size of the compressed bodies
+        offline (bool): Answer every request from the cache
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttls=None, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.cache_dir = cache_dir
+        self.entries_dir = os.path.join(cache_dir, 'entries')
+        self.blobs_dir = os.path.join(cache_dir, 'blobs')
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'expired': 0, 'offline_misses': 0, 'stored': 0, 'evicted': 0}
+        self.bytes_served = 0
+        self.size = sum(entry.stat().st_size for entry in os.scandir(self.blobs_dir))
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _entry_path(self, url):
+        return os.path.join(self.entries_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest + '.gz')
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counts[name] += value
+        increment(f'http_cache_{name}', value)
+
+    def _write_atomic(self, path, data):
+        # Write to a unique temporary file first so concurrent or interrupted writes are never read back
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def lookup(self, url):
+        """
+        Get the cached response of a URL.
+
+        Args:
+            url (str): URL of the request
+
+        Returns:
+            tuple: (body, headers) of the response, or None on a miss. Expired
+                responses are only returned in offline mode
+        """
+        entry_path = self._entry_path(url)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(self._blob_path(entry['body']), 'rb') as f:
+                body = gzip.decompress(f.read())
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, OSError, EOFError):
+            self._count('offline_misses' if self.offline else 'misses')
+            return None
+
+        if not self.offline and time.time() - entry['stored_at'] > self.ttls[endpoint_of(url)]:
+            self._count('expired')
+            self._count('misses')
+            return None
+
+        # The modification time of the entry records its last use
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
+        self._count('hits')
+        with self.lock:
+            self.bytes_served += len(body)
+        return body, entry['headers']
+
+    def store(self, url, body, headers):
+        """
+        Store the response of a URL.
+
+        Args:
+            url (str): URL of the request
+            body (bytes): Body of the response
+            headers (dict): Headers of the response to keep
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            compressed = gzip.compress(body)
+            self._write_atomic(blob_path, compressed)
+            with self.lock:
+                self.size += len(compressed)
+
+        entry = {'url': url, 'body': digest, 'stored_at': time.time(), 'headers': headers}
+        self._write_atomic(self._entry_path(url), json.dumps(entry).encode('utf-8'))
+        self._count('stored')
+
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self, max_bytes=None):
+        """
+        Evict the least recently used entries until the cache fits in its size.
+
+        Bodies are removed once no remaining entry points at them.
+
+        Args:
+            max_bytes (int, optional): Size to fit in. Defaults to EVICTION_TARGET of the maximum size
+        """
+        max_bytes = self.max_bytes * EVICTION_TARGET if max_bytes is None else max_bytes
+        with self.lock:
+            entries = []
+            references = {}
+            for item in os.scandir(self.entries_dir):
+                if not item.name.endswith('.json'):
+                    continue
+                try:
+                    with open(item.path, 'r', encoding='utf-8') as f:
+                        digest = json.load(f)['body']
+                    last_used = item.stat().st_mtime
+                except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                    continue
+                entries.append((last_used, item.path, digest))
+                references[digest] = references.get(digest, 0) + 1
+
+            evicted = 0
+            for _, entry_path, digest in sorted(entries):
+                if self.size <= max_bytes:
+                    break
+                os.remove(entry_path)
+                evicted += 1
+                references[digest] -= 1
+                if not references[digest]:
+                    blob_path = self._blob_path(digest)
+                    try:
+                        self.size -= os.path.getsize(blob_path)
+                        os.remove(blob_path)
+                    except FileNotFoundError:
+                        pass
+            self.counts['evicted'] += evicted
+        increment('http_cache_evicted', evicted)
+
+    def stats(self):
+        """
+        Get the statistics of the cache for this run.
+
+        Returns:
+            dict: Hits, misses (of which expired), hit rate, stored and evicted
+                responses, bytes served from the cache, entries and size on disk
+        """
+        lookups = self.counts['hits'] + self.counts['misses'] + self.counts['offline_misses']
+        return {
+            'Hits': self.counts['hits'],
+            'Misses': self.counts['misses'] + self.counts['offline_misses'],
+            'Expired': self.counts['expired'],
+            'Offline Misses': self.counts['offline_misses'],
+            'Hit Rate (%)': self.counts['hits'] / lookups * 100 if lookups else None,
+            'Stored': self.counts['stored'],
+            'Evicted': self.counts['evicted'],
+            'Bytes Served': self.bytes_served,
+            'Entries': sum(1 for name in os.listdir(self.entries_dir) if name.endswith('.json')),
+            'Size (bytes)': self.size
+        }
+
+    def print_stats(self):
+        """Print the statistics of the cache for this run."""
+        print("\n=== HTTP Cache ===")
+        for name, value in self.stats().items():
+            print(f"{name}: {'-' if value is None else f'{value:.2f}' if isinstance(value, float) else value}")
+
+    def clear(self):
+        """Remove every cached response."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.size = 0
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter answering GET requests from an HTTPCache.
+
+    Args:
+        cache (HTTPCache): The cache
+        rate_limiter (TokenBucket, optional): Rate limiter paced by the requests that reach the network only
+        **kwargs: Arguments of HTTPAdapter (e.g. pool_connections, pool_maxsize)
+    """
+
+    def __init__(self, cache, rate_limiter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            return super().send(request, **kwargs)
+
+        cached = self.cache.lookup(request.url)
+        if cached is not None:
+            body, headers = cached
+            response = requests.Response()
+            response.status_code = 200
+            response.reason = 'OK'
+            response._content = body
+            response.headers = CaseInsensitiveDict(headers)
+            response.headers['X-Cache'] = 'HIT'
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.url = request.url
+            response.request = request
+            response.connection = self
+            return response
+
+        if self.cache.offline:
+            raise CacheMissError(f"{request.url} is not in the cache (offline mode)", request=request)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+            self.cache.store(request.url, response.content, headers)
+        return response
+
+
+def mount_cache(session, cache, pool_size=10, rate_limiter=None):
+    """
+    Answer the requests of a session from a cache.
+
+    Args:
+        session (Session): The session
+        cache (HTTPCache): The cache
+        pool_size (int): Maximum number of connections kept open
+        rate_limiter (TokenBucket, optional): Rate limiter paced by the requests that reach the network only
+    """
+    adapter = CachingAdapter(cache, rate_limiter, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+def add_cache_arguments(parser):
+    """
+    Add the HTTP cache options to a command-line parser.
+
+    Args:
+        parser (ArgumentParser): The parser
+    """
+    parser.add_argument('--http-cache', action='store_true',
+                        help='Answer requests from the HTTP cache when possible (prices may be up to --ttl-open old)')
+    parser.add_argument('--offline', action='store_true',
+                        help='Answer every request from the HTTP cache, without the network (implies --http-cache)')
+    parser.add_argument('--ttl-mainpage', type=float, default=DEFAULT_TTLS['mainpage'],
+                        help='Time-to-live of cached main page responses, in seconds')
+    parser.add_argument('--ttl-open', type=float, default=DEFAULT_TTLS['open'],
+                        help='Time-to-live of cached case contents, in seconds')
+    parser.add_argument('--http-cache-mb', type=float, default=DEFAULT_MAX_BYTES / 2**20,
+                        help='Maximum size of the HTTP cache, in MB')
+
+
+def open_http_cache(args):
+    """
+    Open the HTTP cache as requested by the parsed command-line options.
+
+    Args:
+        args (Namespace): Parsed arguments (see add_cache_arguments)
+
+    Returns:
+        HTTPCache: The cache, or None without --http-cache or --offline
+    """
+    if not args.http_cache and not args.offline:
+        return None
+    return HTTPCache(ttls={'mainpage': args.ttl_mainpage, 'open': args.ttl_open},
+                     max_bytes=int(args.http_cache_mb * 2**20), offline=args.offline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect or clear the HTTP response cache')
+    parser.add_argument('--clear', action='store_true', help='Remove every cached response')
+    parser.add_argument('--evict', type=float, metavar='MB', help='Evict the least recently used responses down to MB')
+    args = parser.parse_args()
+
+    cache = HTTPCache()
+    if args.clear:
+        cache.clear()
+        print(f"Cleared {CACHE_DIR}")
+    else:
+        if args.evict is not None:
+            cache.evict(int(args.evict * 2**20))
+        for name in ('Evicted', 'Entries', 'Size (bytes)'):
+            print(f"{name}: {cache.stats()[name]}")
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Pipeline Instrumentation
+
+Shared, thread-safe recording of where the time goes in the pipeline:
+- Stages: wall and CPU time, and number of calls, of named blocks of code
+  (`with stage('flatten'): ...`). CPU time is the process CPU time, so for
+  stages running on several threads it includes the other threads' work.
+- Counters: requests, bytes, retries, rows, ... (`increment('http_requests')`)
+- Histograms: distributions such as per-request latency, with fixed
+  Prometheus-style buckets (`observe('http_request_seconds', latency)`).
+
+Recording is always on and cheap. The scripts of the pipeline expose it with
+--profile (summary tables), --metrics-out (JSON, or Prometheus text format
+for .prom files) and --cprofile-stage/--cprofile-out (a cProfile dump of
+every call of a single stage).
+"""
+
+import cProfile
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+from tabulate import tabulate
+
+# Default histogram buckets (upper bounds), suited to request latencies in seconds
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Prefix of the Prometheus metric names
+PROMETHEUS_PREFIX = 'hellcase'
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_histograms = {}
+_profiled_stage = {'name': None, 'output': None, 'profiler': None}
+
+
+def reset():
+    """Clear every recorded stage, counter and histogram."""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _histograms.clear()
+
+
+@contextmanager
+def stage(name):
+    """
+    Record the wall and CPU time of a block of code.
+
+    Args:
+        name (str): Name of the stage
+    """
+    profiler = None
+    if name == _profiled_stage['name']:
+        profiler = _profiled_stage['profiler']
+        profiler.enable()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        if profiler is not None:
+            profiler.disable()
+        with _lock:
+            record = _stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            record['calls'] += 1
+            record['wall_seconds'] += wall
+            record['cpu_seconds'] += cpu
+
+
+def increment(name, value=1):
+    """
+    Add to a counter.
+
+    Args:
+        name (str): Name of the counter
+        value (float): Amount to add
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value, buckets=DEFAULT_LATENCY_BUCKETS):
+    """
+    Record a value in a histogram.
+
+    Args:
+        name (str): Name of the histogram
+        value (float): Observed value
+        buckets (tuple): Bucket upper bounds, used when the histogram is created
+    """
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1),
+                                             'sum': 0.0, 'count': 0}
+        # The last count is the +Inf bucket
+        index = next((i for i, bound in enumerate(histogram['buckets']) if value <= bound), len(histogram['buckets']))
+        histogram['counts'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def profile_stage(name, output=None):
+    """
+    Profile every call of a stage with cProfile.
+
+    Args:
+        name (str): Name of the stage to profile
+        output (str, optional): File the stats are dumped to by dump_profile. Defaults to '{name}.prof'
+    """
+    _profiled_stage.update({'name': name, 'output': output or f'{name}.prof', 'profiler': cProfile.Profile()})
+
+
+def dump_profile():
+    """
+    Dump the cProfile stats of the profiled stage.
+
+    Returns:
+        str: Path of the stats file, or None if no stage was profiled
+    """
+    if _profiled_stage['profiler'] is None:
+        return None
+    _profiled_stage['profiler'].dump_stats(_profiled_stage['output'])
+    return _profiled_stage['output']
+
+
+def snapshot():
+    """
+    Get a copy of everything recorded so far.
+
+    Returns:
+        dict: Stages, counters and histograms
+    """
+    with _lock:
+        return json.loads(json.dumps({'stages': _stages, 'counters': _counters, 'histograms': _histograms}))
+
+
+def histogram_quantile(histogram, q):
+    """
+    Estimate a quantile of a histogram by linear interpolation within its buckets.
+
+    Args:
+        histogram (dict): A histogram from snapshot()
+        q (float): Quantile, between 0 and 1
+
+    Returns:
+        float: Estimated quantile (the last finite bound for values in the +Inf bucket)
+    """
+    target = q * histogram['count']
+    seen = 0
+    lower = 0.0
+    for bound, count in zip(histogram['buckets'] + [histogram['buckets'][-1]], histogram['counts']):
+        if count and seen + count >= target:
+            return lower + (bound - lower) * (target - seen) / count
+        seen += count
+        lower = bound
+    return lower
+
+
+def summary_tables(metrics=None):
+    """
+    Build the summary tables of the recorded metrics.
+
+    Args:
+        metrics (dict, optional): Output of snapshot(). Defaults to the current metrics
+
+    Returns:
+        tuple: (stages_df, counters_df, histograms_df)
+    """
+    metrics = metrics or snapshot()
+
+    stages_df = pd.DataFrame([{
+        'Stage': name,
+        'Calls': record['calls'],
+        'Wall (s)': record['wall_seconds'],
+        'CPU (s)': record['cpu_seconds']
+    } for name, record in metrics['stages'].items()])
+
+    counters_df = pd.DataFrame([{'Counter': name, 'Value': value} for name, value in metrics['counters'].items()])
+
+    histograms_df = pd.DataFrame([{
+        'Histogram': name,
+        'Count': histogram['count'],
+        'Mean': histogram['sum'] / histogram['count'] if histogram['count'] else None,
+        'P50': histogram_quantile(histogram, 0.5),
+        'P90': histogram_quantile(histogram, 0.9),
+        'P99': histogram_quantile(histogram, 0.99)
+    } for name, histogram in metrics['histograms'].items()])
+
+    return stages_df, counters_df, histograms_df
+
+
+def print_summary(metrics=None):
+    """
+    Print the summary tables of the recorded metrics.
+
+    Args:
+        metrics (dict, optional): Output of snapshot(). Defaults to the current metrics
+    """
+    stages_df, counters_df, histograms_df = summary_tables(metrics)
+
+    print("\n=== Profile: Stages ===")
+    if stages_df.empty:
+        print("No stages recorded.")
+    else:
+        print(tabulate(stages_df, headers='keys', tablefmt='grid', floatfmt='.3f', showindex=False))
+
+    if not counters_df.empty:
+        print("\n=== Profile: Counters ===")
+        print(tabulate(counters_df, headers='keys', tablefmt='grid', showindex=False))
+
+    if not histograms_df.empty:
+        print("\n=== Profile: Histograms ===")
+        print(tabulate(histograms_df, headers='keys', tablefmt='grid', floatfmt='.4f', showindex=False))
+
+
+def to_prometheus(metrics=None):
+    """
+    Format the recorded metrics in the Prometheus text exposition format.
+
+    Args:
+        metrics (dict, optional): Output of snapshot(). Defaults to the current metrics
+
+    Returns:
+        str: The metrics, one sample per line
+    """
+    metrics = metrics or snapshot()
+
+    def metric_name(name):
+        return f"{PROMETHEUS_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+    def label(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+    lines = []
+    for field, suffix, description in (('calls', 'calls_total', 'Number of calls of each stage'),
+                                       ('wall_seconds', 'wall_seconds_total', 'Wall time spent in each stage'),
+                                       ('cpu_seconds', 'cpu_seconds_total', 'Process CPU time spent in each stage')):
+        name = metric_name(f'stage_{suffix}')
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{stage="{label(stage_name)}"}} {record[field]}'
+                  for stage_name, record in metrics['stages'].items()]
+
+    for counter, value in metrics['counters'].items():
+        name = metric_name(f'{counter}_total')
+        lines += [f"# TYPE {name} counter", f"{name} {value}"]
+
+    for histogram_name, histogram in metrics['histograms'].items():
+        name = metric_name(histogram_name)
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip(histogram['buckets'] + ['+Inf'], histogram['counts']):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f"{name}_sum {histogram['sum']}", f"{name}_count {histogram['count']}"]
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(output_file, metrics=None):
+    """
+    Write the recorded metrics to a file.
+
+    Files ending in .prom are written in the Prometheus text format, others as JSON.
+
+    Args:
+        output_file (str): Path of the output file
+        metrics (dict, optional): Output of snapshot(). Defaults to the current metrics
+    """
+    metrics = metrics or snapshot()
+    with open(output_file, 'w', encoding='utf-8') as f:
+        if output_file.endswith('.prom'):
+            f.write(to_prometheus(metrics))
+        else:
+            json.dump(metrics, f, indent=2)
+
+
+def add_profile_arguments(parser):
+    """
+    Add the instrumentation options to a command-line parser.
+
+    Args:
+        parser (ArgumentParser): The parser
+    """
+    parser.add_argument('--profile', action='store_true', help='Print the time spent in each stage and the counters')
+    parser.add_argument('--metrics-out', help='Save the metrics to a JSON file, or Prometheus text format for .prom')
+    parser.add_argument('--cprofile-stage', help='Profile every call of this stage with cProfile')
+    parser.add_argument('--cprofile-out', help='cProfile stats file (default: {stage}.prof)')
+
+
+def start_profiling(args):
+    """
+    Set up instrumentation from the parsed command-line options.
+
+    Args:
+        args (Namespace): Parsed arguments (see add_profile_arguments)
+    """
+    if args.cprofile_stage:
+        profile_stage(args.cprofile_stage, args.cprofile_out)
+
+
+def report_profiling(args):
+    """
+    Report the recorded metrics as requested by the parsed command-line options.
+
+    Args:
+        args (Namespace): Parsed arguments (see add_profile_arguments)
+    """
+    if args.profile:
+        print_summary()
+    if args.metrics_out:
+        write_metrics(args.metrics_out)
+        print(f"Saved metrics to {args.metrics_out}")
+    profile_file = dump_profile()
+    if profile_file:
+        print(f"Saved cProfile stats of stage '{args.cprofile_stage}' to {profile_file}")
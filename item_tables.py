@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Item Tables
+
+Normalized form of the case contents dataset, where every row of
+case_contents_dataset.csv repeats the attributes and price of its item:
+- items.csv: one row per item, with an integer item_id, its attributes and
+  its price. An item is a market listing: the same steam_market_hash_name,
+  exterior and StatTrak variant in every case that contains it.
+- case_items.csv: one row per (case, item) membership, with the item_id, the
+  odds and the roll tickets of the item in that case.
+
+ItemCatalog keeps the EV and risk metrics of every case and a reverse index
+from each item to the cases that contain it, so a batch of price updates only
+recomputes the metrics of the cases containing the changed items.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from case_simulator import calculate_ev_metrics, calculate_risk_metrics, compute_case_metrics, load_cases
+from case_store import CASE_CONTENTS_CSV, CASES_CSV
+from create_case_contents_csv import COLUMNS
+
+# Default locations of the tables
+ITEMS_CSV = 'data/items.csv'
+CASE_ITEMS_CSV = 'data/case_items.csv'
+
+# Columns identifying an item
+ITEM_KEY = ['steam_market_hash_name', 'sub_steam_exterior', 'sub_is_stattrak']
+
+# Columns of the membership table taken from the case contents
+MEMBERSHIP_COLUMNS = ['case_name', 'is_sub_item', 'min', 'max', 'odds']
+
+
+def build_item_tables(case_contents_df):
+    """
+    Split the case contents into an item table and a membership table.
+
+    An item listed at different prices in different cases gets its median price.
+
+    Args:
+        case_contents_df (DataFrame): DataFrame containing case contents data
+
+    Returns:
+        tuple: (items_df, case_items_df, conflicts) - The item table, the membership table and the
+            number of items listed at more than one price
+    """
+    item_ids = case_contents_df.groupby(ITEM_KEY, sort=False, dropna=False).ngroup().to_numpy()
+
+    attributes = [column for column in case_contents_df.columns
+                  if column not in MEMBERSHIP_COLUMNS and column != 'sub_steam_price_en']
+    items = case_contents_df[attributes].groupby(item_ids).first()
+    prices = case_contents_df['sub_steam_price_en'].groupby(item_ids)
+    conflicts = int((prices.nunique() > 1).sum())
+
+    items_df = items.assign(price=prices.median())
+    items_df.insert(0, 'item_id', items_df.index)
+    case_items_df = case_contents_df[MEMBERSHIP_COLUMNS].assign(item_id=item_ids)
+
+    return items_df.reset_index(drop=True), case_items_df, conflicts
+
+
+def csr_take(offsets, keys):
+    """
+    Get the positions of the rows of several keys of a table sorted by key.
+
+    Args:
+        offsets (ndarray): Index of the first row of each key, followed by the number of rows
+        keys (ndarray): Keys to take
+
+    Returns:
+        ndarray: Positions of the rows of the keys, in the order of the keys
+    """
+    starts = offsets[keys]
+    lengths = offsets[keys + 1] - starts
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class ItemCatalog:
+    """
+    Case metrics over the normalized item tables, recomputed incrementally on price updates.
+
+    Args:
+        cases_df (DataFrame): DataFrame containing case data
+        items_df (DataFrame): Item table (see build_item_tables)
+        case_items_df (DataFrame): Membership table (see build_item_tables)
+    """
+
+    def __init__(self, cases_df, items_df, case_items_df):
+        self.cases_df = cases_df
+        self.items_df = items_df.set_index('item_id', drop=False)
+        self.prices = np.full(int(items_df['item_id'].max()) + 1 if len(items_df) else 0, np.nan)
+        self.prices[items_df['item_id'].to_numpy()] = items_df['price'].to_numpy()
+
+        # Memberships sorted by case, with the first row of each case
+        case_codes, self.case_names = pd.factorize(case_items_df['case_name'])
+        order = np.argsort(case_codes, kind='stable')
+        self.case_codes = case_codes[order]
+        self.item_ids = case_items_df['item_id'].to_numpy()[order]
+        self.odds = case_items_df['odds'].to_numpy(dtype=np.float64)[order]
+        self.case_offsets = np.searchsorted(self.case_codes, np.arange(len(self.case_names) + 1))
+
+        # Reverse index: cases containing each item
+        by_item = np.argsort(self.item_ids, kind='stable')
+        self.item_cases = self.case_codes[by_item]
+        self.item_offsets = np.searchsorted(self.item_ids[by_item], np.arange(len(self.prices) + 1))
+
+        self.metrics_df = self._compute(np.arange(len(self.case_names)))
+
+    def _compute(self, case_codes):
+        # compute_case_metrics only needs the case name, odds and price of each row
+        rows = csr_take(self.case_offsets, case_codes)
+        contents = pd.DataFrame({
+            'case_name': np.asarray(self.case_names)[self.case_codes[rows]],
+            'odds': self.odds[rows],
+            'sub_steam_price_en': self.prices[self.item_ids[rows]]
+        })
+        return compute_case_metrics(self.cases_df, contents)
+
+    def cases_containing(self, item_ids):
+        """
+        Get the cases containing any of the given items.
+
+        Args:
+            item_ids (array-like): Item IDs
+
+        Returns:
+            ndarray: Codes of the cases, sorted
+        """
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        return np.unique(self.item_cases[csr_take(self.item_offsets, item_ids)])
+
+    def apply_price_updates(self, updates):
+        """
+        Update item prices and recompute the metrics of the cases containing them.
+
+        Args:
+            updates (dict): New price of each updated item, keyed by item ID
+
+        Returns:
+            list: Names of the recomputed cases
+        """
+        item_ids = np.fromiter(updates.keys(), dtype=np.int64, count=len(updates))
+        if not len(item_ids):
+            return []
+        self.prices[item_ids] = np.fromiter(updates.values(), dtype=np.float64, count=len(updates))
+        self.items_df.loc[item_ids, 'price'] = self.prices[item_ids]
+
+        case_codes = self.cases_containing(item_ids)
+        if len(case_codes):
+            updated = self._compute(case_codes)
+            self.metrics_df.loc[updated.index] = updated
+
+        return list(np.asarray(self.case_names)[case_codes])
+
+    def ev_metrics(self):
+        """
+        Get the expected value metrics of every case.
+
+        Returns:
+            DataFrame: Same table as calculate_ev_metrics
+        """
+        return calculate_ev_metrics(self.cases_df, pd.DataFrame(columns=COLUMNS), self.metrics_df)
+
+    def risk_metrics(self):
+        """
+        Get the risk metrics of every case.
+
+        Returns:
+            DataFrame: Same table as calculate_risk_metrics
+        """
+        return calculate_risk_metrics(self.cases_df, pd.DataFrame(columns=COLUMNS), metrics_df=self.metrics_df)
+
+
+def save_item_tables(items_df, case_items_df, items_csv=ITEMS_CSV, case_items_csv=CASE_ITEMS_CSV):
+    """
+    Save the item tables.
+
+    Args:
+        items_df (DataFrame): Item table
+        case_items_df (DataFrame): Membership table
+        items_csv (str): Path of the item table
+        case_items_csv (str): Path of the membership table
+    """
+    items_df.to_csv(items_csv, index=False)
+    case_items_df.to_csv(case_items_csv, index=False)
+
+
+def load_item_catalog(cases_csv=CASES_CSV, items_csv=ITEMS_CSV, case_items_csv=CASE_ITEMS_CSV):
+    """
+    Load the item tables and compute the metrics of every case.
+
+    Args:
+        cases_csv (str): Path of the cases CSV
+        items_csv (str): Path of the item table
+        case_items_csv (str): Path of the membership table
+
+    Returns:
+        ItemCatalog: The catalog, or None if a file is missing
+    """
+    cases_df = load_cases(cases_csv)
+    if cases_df is None:
+        return None
+    if not os.path.exists(items_csv) or not os.path.exists(case_items_csv):
+        print(f"Error: {items_csv} or {case_items_csv} not found. Please run item_tables.py build first.")
+        return None
+
+    return ItemCatalog(cases_df, pd.read_csv(items_csv), pd.read_csv(case_items_csv))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the normalized item tables or apply price updates')
+    subparsers = parser.add_subparsers(dest='command', help='Command to execute')
+
+    build_parser = subparsers.add_parser('build', help='Build the item tables from the case contents CSV')
+    build_parser.add_argument('--input', default=CASE_CONTENTS_CSV, help='Case contents CSV')
+
+    update_parser = subparsers.add_parser('update', help='Apply price updates and show the affected cases')
+    update_parser.add_argument('prices_csv', help='CSV of price updates, with item_id and price columns')
+    update_parser.add_argument('--top', type=int, default=20, help='Number of affected cases to display')
+    update_parser.add_argument('--save', action='store_true', help='Save the new prices to the item table')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not os.path.exists(args.input):
+            print(f"Error: {args.input} not found. Please run create_case_contents_csv.py first.")
+        else:
+            items_df, case_items_df, conflicts = build_item_tables(pd.read_csv(args.input))
+            save_item_tables(items_df, case_items_df)
+            print(f"Saved {len(items_df)} items to {ITEMS_CSV} and {len(case_items_df)} memberships to {CASE_ITEMS_CSV}")
+            if conflicts:
+                print(f"Warning: {conflicts} items are listed at different prices in different cases; "
+                      f"their median price is used.")
+
+    elif args.command == 'update':
+        catalog = load_item_catalog()
+        if catalog is not None:
+            updates_df = pd.read_csv(args.prices_csv)
+            unknown = ~updates_df['item_id'].isin(catalog.items_df['item_id'])
+            if unknown.any():
+                print(f"Warning: ignoring {int(unknown.sum())} unknown item IDs.")
+                updates_df = updates_df[~unknown]
+
+            before = catalog.ev_metrics().set_index('Case Name')['EV Ratio']
+            updated_cases = catalog.apply_price_updates(dict(zip(updates_df['item_id'], updates_df['price'])))
+            after = catalog.ev_metrics().set_index('Case Name')['EV Ratio']
+
+            print(f"Updated {len(updates_df)} items; recomputed {len(updated_cases)} of "
+                  f"{len(catalog.case_names)} cases.")
+            changes_df = pd.DataFrame({
+                'Case Name': updated_cases,
+                'Old EV Ratio': before.reindex(updated_cases).to_numpy(),
+                'New EV Ratio': after.reindex(updated_cases).to_numpy()
+            })
+            changes_df['Change'] = changes_df['New EV Ratio'] - changes_df['Old EV Ratio']
+            changes_df = changes_df.reindex(changes_df['Change'].abs().sort_values(ascending=False).index)
+            print(tabulate(changes_df.head(args.top), headers='keys', tablefmt='grid', floatfmt='.4f', showindex=False))
+
+            if args.save:
+                catalog.items_df.to_csv(ITEMS_CSV, index=False)
+                print(f"Saved the new prices to {ITEMS_CSV}")
+
+    else:
+        parser.print_help()
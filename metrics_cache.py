@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Metrics Cache
+
+Persistent cache of the metric tables computed from data/cases.csv and
+data/case_contents_dataset.csv (EV and risk tables, recommendation lists).
+Entries are keyed on a content hash of both CSVs, so they are reused for as
+long as the data is unchanged and ignored as soon as it changes.
+
+The cache keeps the tables of the most recently used dataset versions and
+evicts the least recently used ones beyond that. Hits and misses are counted
+across runs so the hit rate can be reported.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+import pandas as pd
+
+from case_store import CASE_CONTENTS_CSV, CASES_CSV, source_fingerprints
+
+# Default location of the cache
+CACHE_DIR = 'data/metrics_cache'
+
+# Default number of dataset versions kept in the cache
+DEFAULT_MAX_ENTRIES = 4
+
+# Bump when the cached tables change, so old entries are not reused
+CACHE_VERSION = 1
+
+
+class MetricsCache:
+    """
+    Cache of metric tables for one version of the dataset.
+
+    Args:
+        sources (list): Paths of the source CSVs
+        cache_dir (str): Directory of the cache
+        max_entries (int): Number of dataset versions kept
+    """
+
+    def __init__(self, sources, cache_dir=CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.index = self._read_index()
+        self.hits = 0
+        self.misses = 0
+
+        # Only files whose size or modification time changed are hashed again
+        fingerprints = source_fingerprints(sources, self.index['sources'])
+        self.index['sources'] = fingerprints
+        digest = hashlib.sha256(str(CACHE_VERSION).encode())
+        for path in sources:
+            digest.update(fingerprints[path]['sha256'].encode())
+        self.key = digest.hexdigest()[:16]
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == CACHE_VERSION:
+                return index
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return {'version': CACHE_VERSION, 'sources': {}, 'entries': {}, 'hits': 0, 'misses': 0}
+
+    def _write_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def get(self, name, compute):
+        """
+        Get a table from the cache, computing and storing it on a miss.
+
+        Args:
+            name (str): Name of the table
+            compute (callable): Function computing the table
+
+        Returns:
+            object: The table
+        """
+        entry_dir = os.path.join(self.cache_dir, self.key)
+        path = os.path.join(entry_dir, f'{name}.pkl')
+
+        try:
+            value = pd.read_pickle(path)
+            self.hits += 1
+            self.index['hits'] += 1
+        # A damaged or outdated pickle can fail in any of these ways; it is recomputed like a missing one
+        except (FileNotFoundError, EOFError, ValueError, pickle.UnpicklingError, AttributeError, ImportError,
+                IndexError, TypeError):
+            value = compute()
+            self.misses += 1
+            self.index['misses'] += 1
+            os.makedirs(entry_dir, exist_ok=True)
+            # Write to a temporary file first so an interrupted write is never read back
+            pd.to_pickle(value, path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+        self.index['entries'][self.key] = {'last_used': time.time()}
+        self._evict()
+        self._write_index()
+
+        return value
+
+    def _evict(self):
+        # Drop the least recently used dataset versions beyond max_entries
+        entries = sorted(self.index['entries'], key=lambda key: self.index['entries'][key]['last_used'], reverse=True)
+        for key in entries[self.max_entries:]:
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            del self.index['entries'][key]
+
+    def stats(self):
+        """
+        Get the hit and miss statistics of the cache.
+
+        Returns:
+            dict: Hits, misses and hit rates of this run and of all runs, number of
+                cached dataset versions and size of the cache on disk
+        """
+        def hit_rate(hits, misses):
+            return hits / (hits + misses) * 100 if hits + misses else None
+
+        size = 0
+        for root, _, files in os.walk(self.cache_dir):
+            size += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+
+        return {
+            'Hits': self.hits,
+            'Misses': self.misses,
+            'Hit Rate (%)': hit_rate(self.hits, self.misses),
+            'Total Hits': self.index['hits'],
+            'Total Misses': self.index['misses'],
+            'Total Hit Rate (%)': hit_rate(self.index['hits'], self.index['misses']),
+            'Dataset Versions': len(self.index['entries']),
+            'Size (bytes)': size
+        }
+
+    def clear(self):
+        """Remove every cached table and reset the statistics."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        sources = self.index['sources']
+        self.index = self._read_index()
+        self.index['sources'] = sources
+        self.hits = 0
+        self.misses = 0
+
+
+def open_metrics_cache(cases_csv=CASES_CSV, case_contents_csv=CASE_CONTENTS_CSV, cache_dir=CACHE_DIR,
+                       max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Open the metrics cache for the current version of the dataset.
+
+    Args:
+        cases_csv (str): Path of the cases CSV
+        case_contents_csv (str): Path of the case contents CSV
+        cache_dir (str): Directory of the cache
+        max_entries (int): Number of dataset versions kept
+
+    Returns:
+        MetricsCache: The cache, or None if the source CSVs are missing
+    """
+    sources = [cases_csv, case_contents_csv]
+    if not all(os.path.exists(path) for path in sources):
+        return None
+    return MetricsCache(sources, cache_dir, max_entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect or clear the metrics cache')
+    parser.add_argument('--clear', action='store_true', help='Remove every cached table')
+    args = parser.parse_args()
+
+    cache = open_metrics_cache()
+    if cache is None:
+        print("Error: data/cases.csv or data/case_contents_dataset.csv not found.")
+    elif args.clear:
+        cache.clear()
+        print(f"Cleared {CACHE_DIR}")
+    else:
+        for name, value in cache.stats().items():
+            print(f"{name}: {'-' if value is None else f'{value:.2f}' if isinstance(value, float) else value}")
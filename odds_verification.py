@@ -0,0 +1,525 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Odds Verification
+
+Checks observed drop logs against the odds published by the case contents.
+Drop logs are CSV or JSON Lines files (optionally gzipped) with one row per
+opening, giving the case and the Steam market name of the item dropped
+(e.g. 'StatTrak™ AK-47 | Redline (Field-Tested)').
+
+Logs are read in chunks and each chunk is matched to the items of
+case_contents_dataset.csv through a hashed (case, market name) index, then
+added to per-item drop counts. Memory is bounded by the size of the catalog,
+whatever the size of the logs.
+
+For every case the counts are then tested against the published odds:
+- chi-square goodness of fit over all the items of the case, pooling items
+  expected less than MIN_EXPECTED times into one cell
+- binomial tail test of the drops worth more than the case, which are fewer
+  than published if the lower tail probability is small
+- two-sided binomial test of every item, reporting the most extreme item
+  with a Bonferroni correction for the number of items
+P-values are computed from the regularized incomplete gamma and beta
+functions, with the standard library only.
+"""
+
+import argparse
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from case_simulator import load_data
+
+# Default number of drop log rows read at a time
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Items expected fewer times than this are pooled into one chi-square cell
+MIN_EXPECTED = 5.0
+
+# Default significance level used to flag cases
+DEFAULT_ALPHA = 0.01
+
+# Market name prefixes of StatTrak and Souvenir items
+STATTRAK_PREFIX = 'StatTrak™ '
+SOUVENIR_PREFIX = 'Souvenir '
+
+# Maximum number of terms of the series and continued fractions
+MAX_TERMS = 100_000
+
+# Relative precision of the series and continued fractions
+EPSILON = 1e-15
+
+# Smallest magnitude kept by the continued fractions (modified Lentz method)
+TINY = 1e-300
+
+
+def regularized_gamma_q(a, x):
+    """
+    Compute the regularized upper incomplete gamma function Q(a, x).
+
+    Args:
+        a (float): Shape, positive
+        x (float): Lower bound of the integral, non-negative
+
+    Returns:
+        float: Q(a, x), the survival function of a Gamma(a) variable at x
+    """
+    if x <= 0:
+        return 1.0
+    log_prefix = -x + a * math.log(x) - math.lgamma(a)
+
+    if x < a + 1:
+        # Series of the lower function P(a, x)
+        term = total = 1.0 / a
+        for n in range(1, MAX_TERMS):
+            term *= x / (a + n)
+            total += term
+            if abs(term) < abs(total) * EPSILON:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+
+    # Continued fraction of Q(a, x)
+    b = x + 1 - a
+    c = 1 / TINY
+    d = 1 / b
+    result = d
+    for n in range(1, MAX_TERMS):
+        an = -n * (n - a)
+        b += 2
+        d = an * d + b
+        d = TINY if abs(d) < TINY else d
+        c = b + an / c
+        c = TINY if abs(c) < TINY else c
+        d = 1 / d
+        delta = d * c
+        result *= delta
+        if abs(delta - 1) < EPSILON:
+            break
+    return min(1.0, result * math.exp(log_prefix))
+
+
+def chi_square_sf(statistic, df):
+    """
+    Compute the p-value of a chi-square statistic.
+
+    Args:
+        statistic (float): Chi-square statistic
+        df (int): Degrees of freedom
+
+    Returns:
+        float: Probability of a statistic at least this large
+    """
+    return regularized_gamma_q(df / 2, statistic / 2)
+
+
+def _beta_fraction(a, b, x):
+    # Continued fraction of the incomplete beta function (modified Lentz method)
+    c = 1.0
+    d = 1 - (a + b) * x / (a + 1)
+    d = 1 / (TINY if abs(d) < TINY else d)
+    result = d
+    for m in range(1, MAX_TERMS):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / (TINY if abs(d) < TINY else d)
+            c = 1 + numerator / c
+            c = TINY if abs(c) < TINY else c
+            result *= d * c
+        if abs(d * c - 1) < EPSILON:
+            break
+    return result
+
+
+def regularized_beta(x, a, b):
+    """
+    Compute the regularized incomplete beta function I_x(a, b).
+
+    Args:
+        x (float): Upper bound of the integral, between 0 and 1
+        a (float): First shape, positive
+        b (float): Second shape, positive
+
+    Returns:
+        float: I_x(a, b), the distribution function of a Beta(a, b) variable at x
+    """
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    log_prefix = (math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                  + a * math.log(x) + b * math.log1p(-x))
+
+    # The continued fraction converges quickly below the mean, use the symmetry above it
+    if x < (a + 1) / (a + b + 2):
+        return min(1.0, math.exp(log_prefix) * _beta_fraction(a, b, x) / a)
+    return max(0.0, 1.0 - math.exp(log_prefix) * _beta_fraction(b, a, 1 - x) / b)
+
+
+def binomial_cdf(k, n, p):
+    """
+    Compute P(X <= k) for X ~ Binomial(n, p).
+
+    Args:
+        k (int): Number of successes
+        n (int): Number of trials
+        p (float): Probability of success
+
+    Returns:
+        float: Lower tail probability
+    """
+    if k < 0:
+        return 0.0
+    if k >= n:
+        return 1.0
+    return 1.0 - regularized_beta(p, k + 1, n - k)
+
+
+def binomial_sf(k, n, p):
+    """
+    Compute P(X >= k) for X ~ Binomial(n, p).
+
+    Args:
+        k (int): Number of successes
+        n (int): Number of trials
+        p (float): Probability of success
+
+    Returns:
+        float: Upper tail probability
+    """
+    if k <= 0:
+        return 1.0
+    if k > n:
+        return 0.0
+    return regularized_beta(p, k, n - k + 1)
+
+
+def binomial_two_sided(k, n, p):
+    """
+    Compute the two-sided binomial test p-value of k successes, doubling the smaller tail.
+
+    Args:
+        k (int): Number of successes
+        n (int): Number of trials
+        p (float): Probability of success
+
+    Returns:
+        float: P-value
+    """
+    return min(1.0, 2 * min(binomial_cdf(k, n, p), binomial_sf(k, n, p)))
+
+
+def market_names(case_contents_df):
+    """
+    Build the Steam market name of every item of the case contents.
+
+    Args:
+        case_contents_df (DataFrame): DataFrame containing case contents data
+
+    Returns:
+        Series: Market name of each row, e.g. 'StatTrak™ AK-47 | Redline (Field-Tested)'
+    """
+    names = case_contents_df['steam_market_hash_name'].fillna(case_contents_df['item_name']).astype(str)
+    exteriors = case_contents_df['sub_steam_exterior']
+    names = names.where(exteriors.isna() | (exteriors.astype(str) == ''), names + ' (' + exteriors.astype(str) + ')')
+    names = names.where(~case_contents_df['sub_is_stattrak'].eq(True), STATTRAK_PREFIX + names)
+    return names.where(~case_contents_df['steam_is_souvenir'].eq(True), SOUVENIR_PREFIX + names)
+
+
+def build_item_index(cases_df, case_contents_df):
+    """
+    Build the lookup index of the items of every case with their published probabilities.
+
+    Rows of a case sharing a market name are merged, adding their odds.
+
+    Args:
+        cases_df (DataFrame): DataFrame containing case data
+        case_contents_df (DataFrame): DataFrame containing case contents data
+
+    Returns:
+        dict: Hashed (case, market name) index, case code of each item, case names and prices,
+            and the published probability (normalized within each case) and price of each item
+    """
+    valid = case_contents_df[case_contents_df['odds'].notna()]
+    items = valid.assign(market_name=market_names(valid)).groupby(['case_name', 'market_name'], sort=False).agg(
+        odds=('odds', 'sum'), price=('sub_steam_price_en', 'first'))
+
+    case_codes, case_names = pd.factorize(items.index.get_level_values('case_name'))
+    odds = items['odds'].to_numpy(dtype=np.float64)
+    case_totals = np.bincount(case_codes, weights=odds, minlength=len(case_names))
+    case_prices = cases_df.drop_duplicates('name').set_index('name')['price'].reindex(case_names)
+
+    return {
+        'index': items.index,
+        'case_index': pd.Index(case_names),
+        'case_codes': case_codes,
+        'case_prices': case_prices.to_numpy(dtype=np.float64),
+        'probabilities': np.divide(odds, case_totals[case_codes], out=np.zeros_like(odds),
+                                   where=case_totals[case_codes] > 0),
+        'prices': items['price'].to_numpy(dtype=np.float64)
+    }
+
+
+def read_drop_log(path, chunk_size=DEFAULT_CHUNK_SIZE, columns=None):
+    """
+    Read a drop log in chunks.
+
+    Files ending in .jsonl, .ndjson or .json (optionally followed by .gz) are read
+    as JSON Lines, anything else as CSV.
+
+    Args:
+        path (str): Path of the drop log
+        chunk_size (int): Number of rows per chunk
+        columns (list, optional): Columns to keep
+
+    Yields:
+        DataFrame: The next chunk of rows
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        with pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False) as reader:
+            for chunk in reader:
+                yield chunk if columns is None else chunk.reindex(columns=columns)
+    else:
+        with pd.read_csv(path, chunksize=chunk_size, usecols=columns, dtype=str) as reader:
+            yield from reader
+
+
+class DropCounter:
+    """
+    Accumulate the drop counts of each item from chunks of drop logs.
+
+    Args:
+        item_index (dict): Output of build_item_index
+    """
+
+    def __init__(self, item_index):
+        self.item_index = item_index
+        self.counts = np.zeros(len(item_index['index']), dtype=np.int64)
+        self.unknown_case = 0
+        self.unknown_item = 0
+
+    @property
+    def total(self):
+        """int: Number of drops seen, matched or not."""
+        return int(self.counts.sum()) + self.unknown_case + self.unknown_item
+
+    def update(self, case_names, item_names):
+        """
+        Count a chunk of drops.
+
+        Args:
+            case_names (array-like): Case of each drop
+            item_names (array-like): Market name of the item of each drop
+        """
+        keys = pd.MultiIndex.from_arrays([np.asarray(case_names, dtype=object), np.asarray(item_names, dtype=object)])
+        positions = self.item_index['index'].get_indexer(keys)
+        matched = positions >= 0
+        self.counts += np.bincount(positions[matched], minlength=len(self.counts))
+
+        # Tell drops of unknown cases from unknown items of known cases
+        known_case = self.item_index['case_index'].get_indexer(keys.get_level_values(0)[~matched]) >= 0
+        self.unknown_item += int(known_case.sum())
+        self.unknown_case += int((~known_case).sum())
+
+
+def count_drops(paths, item_index, case_column='case_name', item_column='market_hash_name',
+                chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream drop logs and count the drops of each item.
+
+    Args:
+        paths (list): Paths of the drop logs
+        item_index (dict): Output of build_item_index
+        case_column (str): Column with the case of each drop
+        item_column (str): Column with the market name of the item of each drop
+        chunk_size (int): Number of rows read at a time
+
+    Returns:
+        DropCounter: The accumulated counts
+    """
+    counter = DropCounter(item_index)
+    for path in paths:
+        for chunk in read_drop_log(path, chunk_size, [case_column, item_column]):
+            counter.update(chunk[case_column].to_numpy(), chunk[item_column].to_numpy())
+    return counter
+
+
+def case_tests(probabilities, counts, prices, case_price):
+    """
+    Test the drop counts of a case against its published probabilities.
+
+    Args:
+        probabilities (ndarray): Published probability of each item
+        counts (ndarray): Number of drops of each item
+        prices (ndarray): Price of each item
+        case_price (float): Price of the case
+
+    Returns:
+        dict: Chi-square statistic and p-value, observed and published share of drops
+            worth more than the case with the lower tail p-value, and the item test p-values
+    """
+    drops = int(counts.sum())
+    expected = probabilities * drops
+
+    # Pool the rarely expected items so the chi-square approximation holds
+    rare = expected < MIN_EXPECTED
+    observed_cells = np.append(counts[~rare], counts[rare].sum())
+    expected_cells = np.append(expected[~rare], expected[rare].sum())
+    used = expected_cells > 0
+    cells = int(used.sum())
+    statistic = float((((observed_cells - expected_cells)**2)[used] / expected_cells[used]).sum())
+    chi_square_p = chi_square_sf(statistic, cells - 1) if drops and cells > 1 else float('nan')
+
+    profitable = prices > case_price
+    profit_probability = float(probabilities[profitable].sum())
+    profit_drops = int(counts[profitable].sum())
+    profit_p = binomial_cdf(profit_drops, drops, profit_probability) if drops and 0 < profit_probability < 1 \
+        else float('nan')
+
+    item_p = np.array([binomial_two_sided(int(count), drops, float(probability)) if drops and 0 < probability < 1
+                       else float('nan') for count, probability in zip(counts, probabilities)])
+
+    return {
+        'drops': drops,
+        'chi_square': statistic,
+        'df': cells - 1,
+        'chi_square_p': chi_square_p,
+        'profit_observed': profit_drops / drops * 100 if drops else float('nan'),
+        'profit_published': profit_probability * 100,
+        'profit_p': profit_p,
+        'item_p': item_p
+    }
+
+
+def verify_odds(item_index, counter, alpha=DEFAULT_ALPHA):
+    """
+    Test the observed drops of every case against its published odds.
+
+    Args:
+        item_index (dict): Output of build_item_index
+        counter (DropCounter): Accumulated drop counts
+        alpha (float): Significance level used to flag cases
+
+    Returns:
+        DataFrame: Tests of each case with drops, sorted by chi-square p-value
+    """
+    order = np.argsort(item_index['case_codes'], kind='stable')
+    offsets = np.searchsorted(item_index['case_codes'][order], np.arange(len(item_index['case_index']) + 1))
+    item_names = item_index['index'].get_level_values('market_name')
+
+    summary = []
+    for code, case_name in enumerate(item_index['case_index']):
+        rows = order[offsets[code]:offsets[code + 1]]
+        counts = counter.counts[rows]
+        if not counts.sum():
+            continue
+        tests = case_tests(item_index['probabilities'][rows], counts, item_index['prices'][rows],
+                           item_index['case_prices'][code])
+
+        worst = np.nanargmin(tests['item_p']) if np.isfinite(tests['item_p']).any() else None
+        worst_p = min(1.0, tests['item_p'][worst] * len(rows)) if worst is not None else float('nan')
+        # Tests that cannot be run give NaN, which must not hide the others
+        p_values = np.array([tests['chi_square_p'], tests['profit_p'], worst_p], dtype=np.float64)
+        summary.append({
+            'Case Name': case_name,
+            'Drops': tests['drops'],
+            'Chi-Square': tests['chi_square'],
+            'DF': tests['df'],
+            'Chi-Square p': tests['chi_square_p'],
+            'Profit Drops (%)': tests['profit_observed'],
+            'Published (%)': tests['profit_published'],
+            'Profit Drops p': tests['profit_p'],
+            'Most Extreme Item': item_names[rows[worst]] if worst is not None else None,
+            'Item p (Bonferroni)': worst_p,
+            'Flagged': bool(np.isfinite(p_values).any() and np.nanmin(p_values) < alpha)
+        })
+
+    if not summary:
+        return pd.DataFrame()
+    return pd.DataFrame(summary).sort_values('Chi-Square p', na_position='last')
+
+
+def item_table(item_index, counter, case_name):
+    """
+    Compare the observed and published drop rates of every item of a case.
+
+    Args:
+        item_index (dict): Output of build_item_index
+        counter (DropCounter): Accumulated drop counts
+        case_name (str): Name of the case
+
+    Returns:
+        DataFrame: Published and observed probability, drops, expected drops and two-sided
+            binomial p-value of each item, or None if the case is not in the catalog
+    """
+    code = item_index['case_index'].get_indexer([case_name])[0]
+    if code < 0:
+        return None
+    rows = np.flatnonzero(item_index['case_codes'] == code)
+    counts = counter.counts[rows]
+    probabilities = item_index['probabilities'][rows]
+    tests = case_tests(probabilities, counts, item_index['prices'][rows], item_index['case_prices'][code])
+    drops = tests['drops']
+
+    return pd.DataFrame({
+        'Item': item_index['index'].get_level_values('market_name')[rows],
+        'Price': item_index['prices'][rows],
+        'Published (%)': probabilities * 100,
+        'Observed (%)': counts / drops * 100 if drops else np.nan,
+        'Drops': counts,
+        'Expected': probabilities * drops,
+        'p-value': tests['item_p']
+    }).sort_values('p-value', na_position='last')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check observed drop logs against the published case odds')
+    parser.add_argument('logs', nargs='+', help='Drop logs (CSV or JSON Lines, optionally gzipped)')
+    parser.add_argument('--case-column', default='case_name', help='Column with the case of each drop')
+    parser.add_argument('--item-column', default='market_hash_name',
+                        help='Column with the Steam market name of the item of each drop')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Number of rows read at a time')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA, help='Significance level used to flag cases')
+    parser.add_argument('--case', help='Show the test of every item of this case')
+    parser.add_argument('--top', type=int, default=20, help='Number of cases to display')
+    parser.add_argument('--output', help='Save the tests of every case to a CSV file')
+    args = parser.parse_args()
+
+    missing = [path for path in args.logs if not os.path.exists(path)]
+    cases_df, case_contents_df = load_data()
+    if missing:
+        print(f"Error: {', '.join(missing)} not found.")
+    elif cases_df is not None and case_contents_df is not None:
+        item_index = build_item_index(cases_df, case_contents_df)
+        counter = count_drops(args.logs, item_index, args.case_column, args.item_column, args.chunk_size)
+
+        matched = int(counter.counts.sum())
+        print(f"Read {counter.total} drops: {matched} matched, {counter.unknown_item} of unknown items, "
+              f"{counter.unknown_case} of unknown cases.")
+        summary_df = verify_odds(item_index, counter, args.alpha)
+        if summary_df.empty:
+            print("No drop matched the catalog.")
+        else:
+            flagged = int(summary_df['Flagged'].sum())
+            print(f"\n=== Odds Verification ({len(summary_df)} cases, {flagged} flagged at alpha={args.alpha}) ===")
+            print(tabulate(summary_df.head(args.top), headers='keys', tablefmt='grid', showindex=False,
+                           floatfmt=['', 'g', '.2f', 'g', '.3g', '.2f', '.2f', '.3g', '', '.3g', '']))
+
+            if args.output:
+                summary_df.to_csv(args.output, index=False)
+                print(f"Saved results to {args.output}")
+
+        if args.case:
+            items_df = item_table(item_index, counter, args.case)
+            if items_df is None:
+                print(f"Error: Case '{args.case}' not found in the dataset.")
+            else:
+                print(f"\n=== Items of {args.case} ===")
+                print(tabulate(items_df, headers='keys', tablefmt='grid', showindex=False,
+                               floatfmt=['', '.2f', '.4f', '.4f', 'g', '.1f', '.3g']))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+N-Opening Payout Distribution
+
+Exact distribution of the total value of N openings of a case. The payout
+distribution of a single opening is discretized on a regular value grid and
+convolved with itself N times by FFT, using repeated squaring so that only
+O(log N) convolutions are needed. Probabilities of profit, value at risk and
+conditional value at risk after N openings then follow directly from the
+resulting probability mass function, without any simulation.
+"""
+
+import numpy as np
+
+# Default maximum number of grid points of the N-opening distribution
+DEFAULT_MAX_BINS = 1 << 18
+
+# Smallest grid step, in dollars
+MIN_STEP = 0.01
+
+
+def discretize_distribution(distribution, step):
+    """
+    Discretize the payout distribution of a single opening on a value grid.
+
+    The probability of each item is split between the two grid points around its
+    price, in proportion to the distance to each, so the mean is preserved exactly.
+
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        step (float): Grid step, in dollars
+
+    Returns:
+        ndarray: Probability mass at values 0, step, 2 * step, ...
+    """
+    positions = distribution['prices'] / step
+    lower = np.floor(positions).astype(np.int64)
+    upper_weight = positions - lower
+    odds = distribution['odds']
+
+    size = int(lower.max()) + 2 if len(lower) else 1
+    pmf = np.bincount(lower, weights=odds * (1 - upper_weight), minlength=size)
+    pmf += np.bincount(lower + 1, weights=odds * upper_weight, minlength=size)
+
+    return pmf
+
+
+def convolve_pmf(a, b):
+    """
+    Convolve two probability mass functions with a real FFT.
+
+    Args:
+        a (ndarray): First probability mass function
+        b (ndarray): Second probability mass function
+
+    Returns:
+        ndarray: Probability mass function of the sum
+    """
+    size = len(a) + len(b) - 1
+    fft_size = 1 << (size - 1).bit_length()
+    result = np.fft.irfft(np.fft.rfft(a, fft_size) * np.fft.rfft(b, fft_size), fft_size)[:size]
+
+    # Remove the floating-point noise of the FFT
+    np.clip(result, 0, None, out=result)
+    return result / result.sum()
+
+
+def n_opening_distribution(distribution, num_openings, max_bins=DEFAULT_MAX_BINS, step=None):
+    """
+    Compute the distribution of the total value of N openings of a case.
+
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        num_openings (int): Number of openings
+        max_bins (int): Maximum number of grid points of the result, used to choose the grid step
+        step (float, optional): Grid step, in dollars. Overrides max_bins
+
+    Returns:
+        dict: Grid step, number of openings and probability mass of the total value
+            at 0, step, 2 * step, ...
+
+    Raises:
+        ValueError: If the number of openings is negative
+    """
+    if num_openings < 0:
+        raise ValueError(f"The number of openings must be non-negative, got {num_openings}")
+    if step is None:
+        max_total = num_openings * float(distribution['prices'].max())
+        step = max(MIN_STEP, max_total / max_bins)
+
+    base = discretize_distribution(distribution, step)
+
+    # Repeated squaring: combine the 2^k-opening distributions matching the bits of N
+    result = np.ones(1)
+    remaining = num_openings
+    while remaining:
+        if remaining & 1:
+            result = convolve_pmf(result, base)
+        remaining >>= 1
+        if remaining:
+            base = convolve_pmf(base, base)
+
+    return {
+        'num_openings': num_openings,
+        'step': step,
+        'pmf': result
+    }
+
+
+def n_opening_risk(distribution, num_openings, alpha=0.05, max_bins=DEFAULT_MAX_BINS):
+    """
+    Calculate risk metrics of the total profit after N openings of a case.
+
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        num_openings (int): Number of openings
+        alpha (float): Tail probability of the value at risk (0.05 for 95% VaR)
+        max_bins (int): Maximum number of grid points of the distribution
+
+    Returns:
+        dict: Expected profit, standard deviation, probability of profit, value at
+            risk and conditional value at risk (both as positive losses) and profit percentiles
+
+    Raises:
+        ValueError: If the number of openings is negative
+    """
+    if num_openings < 0:
+        raise ValueError(f"The number of openings must be non-negative, got {num_openings}")
+    total = n_opening_distribution(distribution, num_openings, max_bins)
+    pmf = total['pmf']
+    total_cost = distribution['case_price'] * num_openings
+    profits = np.arange(len(pmf)) * total['step'] - total_cost
+
+    expected_profit = float(pmf @ profits)
+    std_dev = float(np.sqrt(max(pmf @ (profits - expected_profit)**2, 0)))
+    # Ignore grid points that only differ from break-even by rounding
+    prob_profit = float(pmf[profits > total['step'] * 1e-9].sum())
+
+    cdf = np.cumsum(pmf)
+
+    def quantile(q):
+        return float(profits[min(np.searchsorted(cdf, q), len(profits) - 1)])
+
+    # Conditional value at risk: mean profit of the worst alpha share of outcomes,
+    # counting only part of the grid point where the tail ends
+    var_index = min(np.searchsorted(cdf, alpha), len(profits) - 1)
+    tail_mass = cdf[var_index - 1] if var_index else 0.0
+    tail_sum = float(pmf[:var_index] @ profits[:var_index]) + (alpha - tail_mass) * profits[var_index]
+
+    return {
+        'Openings': num_openings,
+        'Total Cost': total_cost,
+        'Expected Profit': expected_profit,
+        'Standard Deviation': std_dev,
+        'Probability of Profit (%)': prob_profit * 100,
+        f'VaR {1 - alpha:.0%}': float(-profits[var_index]),
+        f'CVaR {1 - alpha:.0%}': -tail_sum / alpha,
+        'Profit P5': quantile(0.05),
+        'Profit Median': quantile(0.5),
+        'Profit P95': quantile(0.95)
+    }
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+End-to-End Refresh Pipeline
+
+Runs the whole refresh - main page, case contents, flattening and metrics -
+as concurrent stages connected by bounded queues, instead of four scripts
+that each wait for the previous one to finish:
+
+    main page -> [case names] -> fetcher threads -> [case contents] -> processor
+
+- The main page is fetched first and saved to data/cases.csv; its case names
+  are fed to the fetchers right away.
+- A pool of fetcher threads fetches the case contents, sharing a keep-alive
+  session and a token bucket rate limiter (see fetch_case_contents.py).
+- The processor takes the cases as soon as they arrive: it records them in
+  the journal, flattens them, appends their rows to the case contents CSV and
+  computes their EV and risk metrics. When several cases are waiting, they
+  are processed together, so the fixed cost of computing the metrics is
+  shared instead of letting the processor fall further behind.
+
+The queues are bounded, so a slow stage holds back the ones before it
+instead of letting memory grow. Since processing a case is much faster than
+fetching it, the refresh takes about as long as the fetching alone.
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import pandas as pd
+import requests
+from tabulate import tabulate
+
+from case_simulator import calculate_ev_metrics, calculate_risk_metrics, compute_case_metrics
+from case_store import CASE_CONTENTS_CSV, CASES_CSV
+from create_case_contents_csv import COLUMNS, flatten_case
+from fetch_case_contents import (API_BASE_URL, JOURNAL_FILE, TokenBucket, create_session, fetch_case,
+                                 open_journal, read_journal, write_combined_json)
+from hellcase_api import fetch_cases, write_cases_csv
+from http_cache import add_cache_arguments, open_http_cache
+from instrumentation import add_profile_arguments, increment, report_profiling, stage, start_profiling
+from snapshot_store import add_snapshot_arguments, open_snapshot_store
+
+# Default location of the combined case contents JSON
+CASE_CONTENTS_JSON = 'data/case_contents.json'
+
+# Default maximum number of items waiting in each queue
+DEFAULT_QUEUE_SIZE = 64
+
+# Number of rows written to the case contents CSV at a time, small enough for the
+# writing to overlap with the fetching
+DEFAULT_CHUNK_SIZE = 5000
+
+# Columns of the case contents that hold numbers, parsed as they would be when reading the CSV
+NUMERIC_COLUMNS = ['min', 'max', 'odds', 'sub_steam_price_en']
+
+
+def fetch_worker(names, contents, session, rate_limiter, base_url, max_retries):
+    """
+    Fetch the contents of the cases taken from a queue. Used as a fetcher thread.
+
+    Args:
+        names (Queue): Case names to fetch, ended by None
+        contents (Queue): Receives (case_name, data, error) for every case
+        session (Session): Session shared by the fetchers
+        rate_limiter (TokenBucket): Rate limiter shared by the fetchers
+        base_url (str): Base URL of the API
+        max_retries (int): Maximum number of retries for rate-limited and server errors
+    """
+    while True:
+        case_name = names.get()
+        if case_name is None:
+            return
+        try:
+            contents.put((case_name, fetch_case(session, case_name, rate_limiter, base_url, max_retries), None))
+        except Exception as e:
+            contents.put((case_name, None, e))
+
+
+class CaseProcessor:
+    """
+    Journal, flatten and compute the metrics of the cases as they arrive.
+
+    Rows are written to the case contents CSV in chunks, as in
+    create_case_contents_csv.py, but smaller ones.
+
+    Args:
+        cases_df (DataFrame): Cases of the main page, as read from the cases CSV
+        journal (file): Journal opened for appending
+        csv_file (file): Case contents CSV opened for writing
+        chunk_size (int): Number of rows written to the CSV at a time
+    """
+
+    def __init__(self, cases_df, journal, csv_file, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.cases_df = cases_df
+        self.journal = journal
+        self.csv_file = csv_file
+        self.chunk_size = chunk_size
+        self.chunk = []
+        self.total_rows = 0
+        self.case_metrics = []
+
+    def process(self, batch):
+        """
+        Process a batch of cases.
+
+        Args:
+            batch (list): (case_name, data) of each case, data being the content of the case from the API
+        """
+        # Record the cases in the journal right away
+        with stage('write_json'):
+            for case_name, data in batch:
+                self.journal.write(json.dumps({'case_name': case_name, 'data': data}) + '\n')
+            self.journal.flush()
+
+        with stage('flatten'):
+            rows = [row for case_name, data in batch for row in flatten_case(case_name, data)]
+        if not rows:
+            return
+
+        case_contents_df = pd.DataFrame.from_records(rows, columns=COLUMNS)
+        for column in NUMERIC_COLUMNS:
+            case_contents_df[column] = pd.to_numeric(case_contents_df[column])
+        self.case_metrics.append(compute_case_metrics(self.cases_df, case_contents_df))
+
+        self.chunk.extend(rows)
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending rows to the CSV, with the header if nothing was written yet."""
+        if not self.chunk and self.total_rows:
+            return
+        with stage('write_csv'):
+            pd.DataFrame.from_records(self.chunk, columns=COLUMNS).to_csv(self.csv_file, header=self.total_rows == 0,
+                                                                          index=False)
+        increment('rows_written', len(self.chunk))
+        self.total_rows += len(self.chunk)
+        self.chunk = []
+
+    def metrics(self):
+        """
+        Get the metrics of the processed cases.
+
+        Returns:
+            DataFrame: Output of compute_case_metrics for every case, in order of arrival
+        """
+        if not self.case_metrics:
+            return compute_case_metrics(self.cases_df, pd.DataFrame(columns=COLUMNS))
+        return pd.concat(self.case_metrics)
+
+
+def run_pipeline(base_url=API_BASE_URL, concurrency=4, rate=2.0, burst=1, max_retries=5,
+                 queue_size=DEFAULT_QUEUE_SIZE, cases_csv=CASES_CSV, case_contents_json=CASE_CONTENTS_JSON,
+                 case_contents_csv=CASE_CONTENTS_CSV, journal_file=JOURNAL_FILE, cache=None, snapshots=None):
+    """
+    Refresh the cases, their contents and their metrics in one streaming pass.
+
+    The CSV files are written next to their final path and only replace the
+    previous ones once every case has been processed.
+
+    Args:
+        base_url (str): Base URL of the API
+        concurrency (int): Number of fetcher threads
+        rate (float): Maximum number of requests per second
+        burst (int): Maximum number of requests sent in a burst
+        max_retries (int): Maximum number of retries for rate-limited and server errors
+        queue_size (int): Maximum number of items waiting in each queue
+        cases_csv (str): Path of the cases CSV
+        case_contents_json (str): Path of the combined case contents JSON
+        case_contents_csv (str): Path of the case contents CSV
+        journal_file (str): Path of the journal
+        cache (HTTPCache, optional): Response cache answering the requests it holds
+        snapshots (SnapshotStore, optional): Snapshot store recording the main page and case contents
+
+    Returns:
+        tuple: (ev_df, risk_df) - EV and risk metrics of every case, or (None, None) if an error occurred
+    """
+    start = time.perf_counter()
+
+    rate_limiter = TokenBucket(rate, burst)
+    session = create_session(concurrency, cache, rate_limiter)
+    if cache is not None:
+        # The cache paces the requests that reach the API; cached responses are not rate limited
+        rate_limiter = None
+
+    try:
+        cases = fetch_cases(base_url, session)
+    except requests.exceptions.RequestException as e:
+        print(f"Error making API request: {e}")
+        return None, None
+    except json.JSONDecodeError as e:
+        print(f"Error parsing JSON response: {e}")
+        return None, None
+    if not cases:
+        print("No case data found in the API response.")
+        return None, None
+
+    for path in (cases_csv, case_contents_json, case_contents_csv, journal_file):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    # Read the cases back so their values are parsed as when loading the CSV
+    write_cases_csv(cases, f'{cases_csv}.tmp')
+    cases_df = pd.read_csv(f'{cases_csv}.tmp')
+    case_names = cases_df['name'].drop_duplicates().tolist()
+    print(f"Found {len(case_names)} cases on the main page.")
+
+    names = queue.Queue(queue_size)
+    contents = queue.Queue(queue_size)
+    fetchers = [threading.Thread(target=fetch_worker, daemon=True,
+                                 args=(names, contents, session, rate_limiter, base_url, max_retries))
+                for _ in range(concurrency)]
+    for fetcher in fetchers:
+        fetcher.start()
+
+    def feed():
+        for case_name in case_names:
+            names.put(case_name)
+        for _ in fetchers:
+            names.put(None)
+
+    threading.Thread(target=feed, daemon=True).start()
+
+    # Process the cases on this thread as they arrive, together with any others already waiting
+    successful = 0
+    failed = 0
+    remaining = len(case_names)
+    with open_journal(journal_file) as journal, \
+            open(f'{case_contents_csv}.tmp', 'w', encoding='utf-8', newline='') as csv_file:
+        processor = CaseProcessor(cases_df, journal, csv_file)
+        while remaining:
+            arrived = [contents.get()]
+            while len(arrived) < remaining and not contents.empty():
+                arrived.append(contents.get())
+            remaining -= len(arrived)
+
+            batch = []
+            for case_name, data, error in arrived:
+                if error is None:
+                    batch.append((case_name, data))
+                else:
+                    print(f"  Error fetching {case_name}: {error}")
+                    failed += 1
+            try:
+                processor.process(batch)
+            except Exception as e:
+                print(f"  An unexpected error occurred for {', '.join(name for name, _ in batch)}: {e}")
+                failed += len(batch)
+                continue
+            increment('cases_fetched', len(batch))
+            successful += len(batch)
+        processor.flush()
+
+    for fetcher in fetchers:
+        fetcher.join()
+
+    total = write_combined_json(journal_file, case_contents_json)
+    os.replace(f'{cases_csv}.tmp', cases_csv)
+    os.replace(f'{case_contents_csv}.tmp', case_contents_csv)
+
+    metrics_df = processor.metrics()
+    ev_df = calculate_ev_metrics(cases_df, pd.DataFrame(columns=COLUMNS), metrics_df)
+    risk_df = calculate_risk_metrics(cases_df, pd.DataFrame(columns=COLUMNS), metrics_df=metrics_df)
+
+    print(f"\nCompleted processing {len(case_names)} cases in {time.perf_counter() - start:.1f}s:")
+    print(f"  Successful: {successful}")
+    print(f"  Failed: {failed}")
+    print(f"Saved {len(cases_df)} cases to {cases_csv}")
+    print(f"Saved all {total} case contents to {case_contents_json}")
+    print(f"Saved {processor.total_rows} items to {case_contents_csv}")
+
+    if snapshots is not None:
+        for manifest in (snapshots.record_mainpage(cases), snapshots.record_contents(read_journal(journal_file))):
+            print(f"Recorded snapshot {manifest['id']} ({manifest['new_blobs']} new blobs)")
+
+    return ev_df, risk_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Refresh the cases, their contents and their metrics in one pass')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of requests in flight at the same time')
+    parser.add_argument('--rate', type=float, default=2.0, help='Maximum number of requests per second')
+    parser.add_argument('--burst', type=int, default=1, help='Maximum number of requests sent in a burst')
+    parser.add_argument('--retries', type=int, default=5, help='Maximum number of retries for 429 and 5xx responses')
+    parser.add_argument('--base-url', default=API_BASE_URL, help='Base URL of the API (e.g. a local stub server)')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='Maximum number of items waiting between two stages')
+    parser.add_argument('--top', type=int, default=10, help='Number of top cases to display')
+    add_cache_arguments(parser)
+    add_snapshot_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    start_profiling(args)
+    cache = open_http_cache(args)
+    ev_df, risk_df = run_pipeline(args.base_url, args.concurrency, args.rate, args.burst, args.retries,
+                                  args.queue_size, cache=cache, snapshots=open_snapshot_store(args))
+    if ev_df is not None:
+        print(f"\n=== Top {args.top} Cases by EV Ratio ===")
+        print(tabulate(ev_df.head(args.top)[['Case Name', 'Expected Value', 'Case Price', 'EV Ratio']],
+                       headers='keys', tablefmt='grid', floatfmt='.2f'))
+    if cache is not None:
+        cache.print_stats()
+    report_profiling(args)
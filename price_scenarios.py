@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Price Scenarios
+
+Measures how robust the EV Ratio ranking is to item price moves, by
+re-pricing the whole catalog under thousands of scenarios at once.
+
+Every scenario is a row of a (scenarios x items) matrix of price multipliers,
+where an item is the same skin, exterior and StatTrak variant in every case
+that contains it. Scenario kinds can be combined (their multipliers are
+multiplied together):
+- noise: independent log-normal noise on every item, with mean 1
+- rarity: one log-normal shock per rarity level, shared by all its items
+- bootstrap: multipliers resampled from the observed price changes of the
+  items between a reference snapshot of the dataset and the current one
+
+The expected value of every case under every scenario is the sum of its
+odds times its re-priced items. The rows of the catalog are sorted by case,
+so a block of scenarios is scored with one gather of the multipliers and one
+np.add.reduceat over the case boundaries. Scenarios are computed in float32,
+whose rounding is negligible next to the price moves, and in blocks sized to
+keep memory bounded whatever the number of scenarios.
+
+From the EV Ratios of all scenarios, each case gets a confidence interval of
+its EV Ratio, the spread of its rank and how often it stays in the top k
+(the Profit-Focused recommendations are the top 5 by EV Ratio).
+"""
+
+import numpy as np
+import pandas as pd
+
+from upgrade_analysis import item_labels
+
+# Scenario kinds
+SCENARIO_KINDS = ('noise', 'rarity', 'bootstrap')
+
+# Default number of scenarios
+DEFAULT_NUM_SCENARIOS = 1000
+
+# Default standard deviation of the log of the per-item and per-rarity multipliers
+DEFAULT_NOISE_SIGMA = 0.1
+DEFAULT_RARITY_SIGMA = 0.2
+
+# Default size of the top list whose stability is measured
+DEFAULT_TOP_K = 5
+
+# Maximum number of (scenario, row) values held at a time
+BLOCK_ELEMENTS = 1 << 24
+
+
+def build_scenario_inputs(cases_df, case_contents_df):
+    """
+    Prepare the catalog for scoring scenarios.
+
+    Args:
+        cases_df (DataFrame): DataFrame containing case data
+        case_contents_df (DataFrame): DataFrame containing case contents data
+
+    Returns:
+        dict: Catalog arrays:
+            - case_names, case_prices: cases that have items and a non-zero price
+            - weights: odds * price of each row, rows sorted by case
+            - row_items: item index of each row
+            - case_starts: index of the first row of each case
+            - item_labels, item_rarities: label and rarity code of each item
+            - rarities: rarity levels
+    """
+    case_prices = cases_df.drop_duplicates('name').set_index('name')['price']
+    contents = case_contents_df[case_contents_df['case_name'].isin(case_prices.index[case_prices.fillna(0) != 0])]
+
+    case_codes, case_names = pd.factorize(contents['case_name'])
+    order = np.argsort(case_codes, kind='stable')
+    contents = contents.iloc[order]
+    case_codes = case_codes[order]
+
+    # Rows without odds or price add nothing to the expected value
+    weights = (contents['odds'] * contents['sub_steam_price_en']).fillna(0).to_numpy(dtype=np.float64)
+
+    row_items, labels = pd.factorize(item_labels(contents))
+    rarity = contents['rarity'].where(contents['rarity'].notna(), contents['sub_rarity']).fillna('')
+    rarity_codes, rarities = pd.factorize(rarity.astype(str))
+    item_rarities = np.zeros(len(labels), dtype=np.int64)
+    item_rarities[row_items] = rarity_codes
+
+    return {
+        'case_names': np.asarray(case_names),
+        'case_prices': case_prices.reindex(case_names).to_numpy(dtype=np.float64),
+        'weights': weights,
+        'row_items': row_items,
+        'case_starts': np.searchsorted(case_codes, np.arange(len(case_names))),
+        'item_labels': np.asarray(labels),
+        'item_rarities': item_rarities,
+        'rarities': np.asarray(rarities)
+    }
+
+
+def bootstrap_price_changes(case_contents_df, reference_df):
+    """
+    Get the observed relative price changes of the items between two snapshots.
+
+    Args:
+        case_contents_df (DataFrame): Current case contents
+        reference_df (DataFrame): Case contents of an earlier snapshot
+
+    Returns:
+        ndarray: Current price / reference price of every item priced in both snapshots
+    """
+    def item_prices(df):
+        priced = df[df['sub_steam_price_en'] > 0]
+        return priced['sub_steam_price_en'].groupby(item_labels(priced)).median()
+
+    current, reference = item_prices(case_contents_df).align(item_prices(reference_df), join='inner')
+    return (current / reference).to_numpy(dtype=np.float64)
+
+
+def draw_multipliers(inputs, kinds, num_scenarios, rngs, noise_sigma=DEFAULT_NOISE_SIGMA,
+                     rarity_sigma=DEFAULT_RARITY_SIGMA, price_changes=None):
+    """
+    Draw the price multipliers of a block of scenarios.
+
+    Args:
+        inputs (dict): Output of build_scenario_inputs
+        kinds (list): Scenario kinds to combine (see SCENARIO_KINDS)
+        num_scenarios (int): Number of scenarios of the block
+        rngs (dict): Random generator of each kind, so each kind draws the same stream whatever the block size
+        noise_sigma (float): Standard deviation of the log of the per-item multipliers
+        rarity_sigma (float): Standard deviation of the log of the per-rarity multipliers
+        price_changes (ndarray, optional): Observed price changes, required for bootstrap scenarios
+
+    Returns:
+        ndarray: (num_scenarios, items) multipliers, in float32
+    """
+    num_items = len(inputs['item_labels'])
+
+    if 'noise' in kinds:
+        # Mean-preserving log-normal noise, computed in place
+        multipliers = rngs['noise'].standard_normal((num_scenarios, num_items), dtype=np.float32)
+        multipliers *= noise_sigma
+        multipliers -= noise_sigma**2 / 2
+        np.exp(multipliers, out=multipliers)
+    else:
+        multipliers = np.ones((num_scenarios, num_items), dtype=np.float32)
+
+    if 'rarity' in kinds:
+        shocks = rngs['rarity'].standard_normal((num_scenarios, len(inputs['rarities'])))
+        shocks = np.exp(shocks * rarity_sigma - rarity_sigma**2 / 2).astype(np.float32)
+        multipliers *= np.take(shocks, inputs['item_rarities'], axis=1)
+
+    if 'bootstrap' in kinds:
+        draws = rngs['bootstrap'].integers(len(price_changes), size=(num_scenarios, num_items))
+        multipliers *= np.take(price_changes.astype(np.float32), draws)
+
+    return multipliers
+
+
+def scenario_ev_ratios(inputs, kinds=('noise',), num_scenarios=DEFAULT_NUM_SCENARIOS, seed=None,
+                       noise_sigma=DEFAULT_NOISE_SIGMA, rarity_sigma=DEFAULT_RARITY_SIGMA, price_changes=None):
+    """
+    Compute the EV Ratio of every case under every scenario.
+
+    Args:
+        inputs (dict): Output of build_scenario_inputs
+        kinds (list): Scenario kinds to combine (see SCENARIO_KINDS)
+        num_scenarios (int): Number of scenarios
+        seed (int, optional): Seed for the random number generator
+        noise_sigma (float): Standard deviation of the log of the per-item multipliers
+        rarity_sigma (float): Standard deviation of the log of the per-rarity multipliers
+        price_changes (ndarray, optional): Observed price changes, required for bootstrap scenarios
+
+    Returns:
+        ndarray: (num_scenarios, cases) EV Ratios
+
+    Raises:
+        ValueError: If the number of scenarios is not positive
+    """
+    if num_scenarios <= 0:
+        raise ValueError(f"The number of scenarios must be positive, got {num_scenarios}")
+    rngs = dict(zip(SCENARIO_KINDS, (np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3))))
+    weights = inputs['weights'].astype(np.float32)
+    row_items = inputs['row_items']
+    starts = inputs['case_starts']
+
+    ratios = np.empty((num_scenarios, len(starts)))
+    block = max(1, min(num_scenarios, BLOCK_ELEMENTS // max(len(weights), len(inputs['item_labels']), 1)))
+    for start in range(0, num_scenarios, block):
+        size = min(block, num_scenarios - start)
+        multipliers = draw_multipliers(inputs, kinds, size, rngs, noise_sigma, rarity_sigma, price_changes)
+        values = np.take(multipliers, row_items, axis=1)
+        values *= weights
+        expected_values = np.add.reduceat(values, starts, axis=1) if len(starts) else values[:, :0]
+        ratios[start:start + size] = expected_values / inputs['case_prices']
+
+    return ratios
+
+
+def summarize_scenarios(inputs, ratios, confidence=0.95, top_k=DEFAULT_TOP_K):
+    """
+    Summarize the EV Ratios of the scenarios for each case.
+
+    Args:
+        inputs (dict): Output of build_scenario_inputs
+        ratios (ndarray): Output of scenario_ev_ratios
+        confidence (float): Confidence level of the intervals
+        top_k (int): Size of the top list whose stability is measured
+
+    Returns:
+        tuple: (summary_df, top_overlap) - One row per case sorted by base EV Ratio, and the
+            average share of the base top k found in the top k of a scenario
+    """
+    base_ev = np.add.reduceat(inputs['weights'], inputs['case_starts']) if len(inputs['case_starts']) else np.array([])
+    base_ratios = base_ev / inputs['case_prices']
+
+    # Rank 1 is the highest EV Ratio
+    base_ranks = np.empty(len(base_ratios), dtype=np.int64)
+    base_ranks[np.argsort(-base_ratios, kind='stable')] = np.arange(1, len(base_ratios) + 1)
+    ranks = np.empty(ratios.shape, dtype=np.int64)
+    np.put_along_axis(ranks, np.argsort(-ratios, axis=1, kind='stable'), np.arange(1, ratios.shape[1] + 1)[None, :],
+                      axis=1)
+
+    in_top = ranks <= top_k
+    base_top = base_ranks <= top_k
+    top_overlap = float((in_top & base_top).sum(axis=1).mean() / max(base_top.sum(), 1)) if len(ratios) else 0.0
+
+    tail = (1 - confidence) / 2 * 100
+    ratio_low, ratio_high = np.percentile(ratios, [tail, 100 - tail], axis=0)
+    rank_low, rank_high = np.percentile(ranks, [tail, 100 - tail], axis=0)
+
+    summary_df = pd.DataFrame({
+        'Case Name': inputs['case_names'],
+        'EV Ratio': base_ratios,
+        'Mean EV Ratio': ratios.mean(axis=0),
+        'EV Ratio CI Low': ratio_low,
+        'EV Ratio CI High': ratio_high,
+        'Rank': base_ranks,
+        'Median Rank': np.median(ranks, axis=0),
+        'Rank CI Low': rank_low,
+        'Rank CI High': rank_high,
+        f'Top {top_k} (%)': in_top.mean(axis=0) * 100
+    }).sort_values('Rank', ignore_index=True)
+
+    return summary_df, top_overlap
@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Case Query Server
+
+Keeps the case data and metric tables in memory and answers the simulate,
+analyze, recommend and list queries of case_simulator.py over a local JSON
+API, so a query costs milliseconds instead of a Python startup and a reload
+of the data:
+
+    GET /list?filter=prisma
+    GET /analyze?sort=ev-ratio&top=10       GET /analyze?case=Prisma%20Case
+    GET /recommend?type=profit
+    GET /simulate?case=Prisma%20Case&num=1000&seed=42
+    GET /stats
+
+It listens on a TCP port or on a Unix socket. A background thread watches the
+data files and, when they change, loads the new data next to the current one
+and swaps it in once ready, so queries are never blocked by a reload.
+Answers are kept in an LRU cache until the data changes; simulations without
+a seed are random and are never cached.
+"""
+
+import argparse
+import json
+import os
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+
+from case_sampling import build_case_distribution
+from case_simulator import (RECOMMENDATION_TYPES, calculate_ev_metrics, calculate_risk_metrics, compute_case_metrics,
+                            get_recommendations, load_data, simulate_distribution)
+from case_store import CASE_CONTENTS_CSV, CASES_CSV
+
+# Default address of the server
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Default number of seconds between two checks of the data files
+DEFAULT_RELOAD_INTERVAL = 2.0
+
+# Default maximum number of answers kept in the cache
+DEFAULT_CACHE_SIZE = 1024
+
+# Default maximum number of openings of a simulate query
+DEFAULT_MAX_OPENINGS = 10_000_000
+
+# Sort metrics of the analyze query: (table, column, ascending)
+SORT_COLUMNS = {
+    'ev': ('ev', 'Expected Value', False),
+    'ev-ratio': ('ev', 'EV Ratio', False),
+    'profit-prob': ('risk', 'Probability of Profit (%)', False),
+    'max-profit': ('risk', 'Max Potential Profit', False),
+    'price': ('cases', 'price', True)
+}
+
+
+class QueryError(Exception):
+    """A query that cannot be answered, with the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def records(df):
+    """
+    Convert a DataFrame to JSON-ready records, with missing and infinite values as None.
+
+    Args:
+        df (DataFrame): The table
+
+    Returns:
+        list: One dict per row
+    """
+    return json.loads(df.to_json(orient='records'))
+
+
+def finite(value):
+    """
+    Convert a number to a JSON-ready float, with missing and infinite values as None.
+
+    Args:
+        value (float): The number
+
+    Returns:
+        float: The number, or None
+    """
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def data_fingerprint(paths):
+    """
+    Get a cheap fingerprint of data files, changing whenever one of them is rewritten.
+
+    Args:
+        paths (list): Paths of the files
+
+    Returns:
+        tuple: Modification time and size of each file, None for missing files
+    """
+    fingerprint = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+            fingerprint.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+
+class QueryService:
+    """
+    Case data and metric tables held in memory, with an answer cache.
+
+    Args:
+        cases_csv (str): Path of the cases CSV
+        case_contents_csv (str): Path of the case contents CSV
+        cache_size (int): Maximum number of answers kept in the cache
+        max_openings (int): Maximum number of openings of a simulate query
+    """
+
+    def __init__(self, cases_csv=CASES_CSV, case_contents_csv=CASE_CONTENTS_CSV, cache_size=DEFAULT_CACHE_SIZE,
+                 max_openings=DEFAULT_MAX_OPENINGS):
+        self.paths = (cases_csv, case_contents_csv)
+        self.cache_size = cache_size
+        self.max_openings = max_openings
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.counts = {'queries': 0, 'hits': 0, 'misses': 0, 'reloads': 0}
+        self.state = None
+        self.reload()
+
+    def load(self):
+        """
+        Load the data files and compute the metric tables.
+
+        Returns:
+            dict: Data and tables of one version of the data files, or None if they are missing
+        """
+        fingerprint = data_fingerprint(self.paths)
+        cases_df, case_contents_df = load_data(*self.paths)
+        if cases_df is None or case_contents_df is None:
+            return None
+
+        metrics_df = compute_case_metrics(cases_df, case_contents_df)
+        ev_df = calculate_ev_metrics(cases_df, case_contents_df, metrics_df)
+        risk_df = calculate_risk_metrics(cases_df, case_contents_df, ev_df['Case Name'].tolist(), metrics_df)
+
+        return {
+            'fingerprint': fingerprint,
+            'loaded_at': time.time(),
+            'cases_df': cases_df,
+            'case_contents_df': case_contents_df,
+            'case_rows': case_contents_df.groupby('case_name', sort=False).indices,
+            'ev_df': ev_df,
+            'risk_df': risk_df,
+            'recommendations': get_recommendations(ev_df, risk_df, cases_df, 'all'),
+            'distributions': {}
+        }
+
+    def reload(self, force=False):
+        """
+        Reload the data if the files changed since they were loaded.
+
+        The current data keeps answering queries until the new data is ready.
+
+        Args:
+            force (bool): Reload even if the files did not change
+
+        Returns:
+            bool: Whether new data was loaded
+        """
+        if not force and self.state is not None and data_fingerprint(self.paths) == self.state['fingerprint']:
+            return False
+        state = self.load()
+        if state is None:
+            return False
+        with self.lock:
+            self.state = state
+            self.cache.clear()
+            self.counts['reloads'] += 1
+        return True
+
+    def watch(self, interval=DEFAULT_RELOAD_INTERVAL, stop=None):
+        """
+        Reload the data whenever the files change, until stopped. Used as a background thread.
+
+        Args:
+            interval (float): Number of seconds between two checks of the files
+            stop (Event, optional): Stops the watching when set
+        """
+        stop = stop or threading.Event()
+        while not stop.wait(interval):
+            try:
+                if self.reload():
+                    print(f"Reloaded the data ({len(self.state['cases_df'])} cases)")
+            except Exception as e:
+                print(f"Error reloading the data: {e}")
+
+    def query(self, command, params):
+        """
+        Answer a query, from the cache when the same query was already answered.
+
+        Args:
+            command (str): simulate, analyze, recommend, list or stats
+            params (dict): Parameters of the query
+
+        Returns:
+            dict: The answer
+
+        Raises:
+            QueryError: If the query is invalid or refers to an unknown case
+        """
+        state = self.state
+        if state is None:
+            raise QueryError(503, 'No data loaded')
+
+        with self.lock:
+            self.counts['queries'] += 1
+        if command == 'stats':
+            return self.stats()
+
+        cacheable = command != 'simulate' or 'seed' in params
+        key = (command, tuple(sorted(params.items())))
+        if cacheable:
+            with self.lock:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    self.counts['hits'] += 1
+                    return self.cache[key]
+                self.counts['misses'] += 1
+
+        answer = self.answer(state, command, params)
+
+        if cacheable:
+            with self.lock:
+                # Answers computed from data replaced in the meantime are not kept
+                if self.state is state:
+                    self.cache[key] = answer
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+        return answer
+
+    def answer(self, state, command, params):
+        """
+        Compute the answer of a query.
+
+        Args:
+            state (dict): Data to answer from (see load)
+            command (str): simulate, analyze, recommend or list
+            params (dict): Parameters of the query
+
+        Returns:
+            dict: The answer
+        """
+        if command == 'list':
+            cases_df = state['cases_df'][['name', 'price']]
+            if params.get('filter'):
+                cases_df = cases_df[cases_df['name'].str.contains(params['filter'], case=False, regex=False)]
+            return {'cases': records(cases_df.sort_values('name'))}
+
+        if command == 'analyze':
+            if params.get('case'):
+                case_name = params['case']
+                ev_df = state['ev_df'][state['ev_df']['Case Name'] == case_name]
+                if ev_df.empty:
+                    raise QueryError(404, f"Case '{case_name}' not found in the dataset")
+                risk_df = state['risk_df'][state['risk_df']['Case Name'] == case_name]
+                return {'ev': records(ev_df)[0], 'risk': records(risk_df)[0] if not risk_df.empty else None}
+
+            sort = params.get('sort', 'ev-ratio')
+            if sort not in SORT_COLUMNS:
+                raise QueryError(400, f"Unknown sort '{sort}', expected one of {', '.join(SORT_COLUMNS)}")
+            table, column, ascending = SORT_COLUMNS[sort]
+            df = state[f'{table}_df'].sort_values(column, ascending=ascending)
+            return {'sort': sort, 'cases': records(df.head(int_param(params, 'top', 10)))}
+
+        if command == 'recommend':
+            player_type = params.get('type', 'all')
+            if player_type == 'all':
+                return {name: records(df) for name, df in state['recommendations'].items()}
+            if player_type not in RECOMMENDATION_TYPES:
+                raise QueryError(400, f"Unknown type '{player_type}', expected all or one of "
+                                      f"{', '.join(RECOMMENDATION_TYPES)}")
+            name = RECOMMENDATION_TYPES[player_type]
+            return {name: records(state['recommendations'][name])}
+
+        if command == 'simulate':
+            return self.simulate(state, params)
+
+        raise QueryError(404, f"Unknown query '{command}'")
+
+    def simulate(self, state, params):
+        """
+        Answer a simulate query.
+
+        Args:
+            state (dict): Data to answer from (see load)
+            params (dict): case, and optionally num and seed
+
+        Returns:
+            dict: Results of the simulation
+        """
+        case_name = params.get('case')
+        num_openings = int_param(params, 'num', 1)
+        seed = int_param(params, 'seed', None)
+        if not case_name:
+            raise QueryError(400, "Missing parameter 'case'")
+        if not 0 < num_openings <= self.max_openings:
+            raise QueryError(400, f"num must be between 1 and {self.max_openings}")
+
+        distribution = state['distributions'].get(case_name)
+        if distribution is None:
+            rows = state['case_rows'].get(case_name)
+            if rows is not None:
+                distribution = build_case_distribution(case_name, state['cases_df'],
+                                                       state['case_contents_df'].iloc[rows])
+            if distribution is None or not distribution['items']:
+                raise QueryError(404, f"Case '{case_name}' not found in the dataset")
+            state['distributions'][case_name] = distribution
+
+        results = simulate_distribution(distribution, num_openings, seed, summary_only=num_openings > 10)
+        answer = {key: finite(results[key]) for key in ('case_price', 'total_cost', 'total_value', 'total_profit',
+                                                        'profit_percentage', 'roi', 'mean_profit', 'std_profit',
+                                                        'max_drawdown')}
+        answer.update({
+            'case_name': case_name,
+            'num_openings': num_openings,
+            'profit_quantiles': {name: finite(value) for name, value in results['profit_quantiles'].items()}
+        })
+
+        # Drops with the same display name are counted together
+        counts_by_name = {}
+        for item_name, count in zip(distribution['items'], results['item_counts']):
+            if count:
+                counts_by_name[item_name] = counts_by_name.get(item_name, 0) + int(count)
+        answer['item_counts'] = dict(sorted(counts_by_name.items(), key=lambda x: x[1], reverse=True))
+        if results['item_indices'] is not None:
+            answer['items_received'] = [{'item': distribution['items'][index], 'value': finite(value)}
+                                        for index, value in zip(results['item_indices'], results['values'])]
+        return answer
+
+    def stats(self):
+        """
+        Get the state of the server.
+
+        Returns:
+            dict: Loaded data, query counts and cache hit rate
+        """
+        with self.lock:
+            counts = dict(self.counts)
+            cached = len(self.cache)
+        lookups = counts['hits'] + counts['misses']
+        return {
+            'cases': len(self.state['cases_df']),
+            'loaded_at': self.state['loaded_at'],
+            'cached_answers': cached,
+            'hit_rate': counts['hits'] / lookups if lookups else None,
+            **counts
+        }
+
+
+def int_param(params, name, default):
+    """
+    Get an integer parameter of a query.
+
+    Args:
+        params (dict): Parameters of the query
+        name (str): Name of the parameter
+        default (int): Value if the parameter is missing
+
+    Returns:
+        int: The value
+    """
+    if name not in params:
+        return default
+    try:
+        return int(params[name])
+    except ValueError:
+        raise QueryError(400, f"Parameter '{name}' must be an integer")
+
+
+def make_handler(service):
+    """
+    Create a request handler class answering queries from a service.
+
+    Args:
+        service (QueryService): The service answering the queries
+
+    Returns:
+        type: The request handler class
+    """
+    class QueryHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Buffer the headers and body into one write, so small answers are not held back by the
+        # delayed acknowledgements of the client
+        wbufsize = -1
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                self.send_json(200, service.query(url.path.strip('/'), dict(parse_qsl(url.query))))
+            except QueryError as e:
+                self.send_json(e.status, {'error': str(e)})
+            except Exception as e:
+                self.send_json(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return QueryHandler
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server on a Unix socket, handling each connection on its own thread."""
+
+    daemon_threads = True
+
+
+def start_query_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """
+    Start the query server on a background thread.
+
+    Args:
+        service (QueryService): The service answering the queries
+        host (str): Address to listen on
+        port (int): Port to listen on (0 picks a free port)
+        socket_path (str, optional): Listen on this Unix socket instead of a TCP port
+
+    Returns:
+        tuple: (server, address) - The running server and its base URL or socket path
+    """
+    handler = make_handler(service)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, handler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        address = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, address
+
+
+def add_serve_arguments(parser):
+    """
+    Add the query server options to a command-line parser.
+
+    Args:
+        parser (ArgumentParser): The parser
+    """
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--socket', help='Listen on this Unix socket instead of a TCP port')
+    parser.add_argument('--reload-interval', type=float, default=DEFAULT_RELOAD_INTERVAL,
+                        help='Seconds between two checks of the data files for changes')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help='Maximum number of cached answers')
+    parser.add_argument('--max-openings', type=int, default=DEFAULT_MAX_OPENINGS,
+                        help='Maximum number of openings of a simulate query')
+
+
+def serve(args):
+    """
+    Load the data and answer queries until interrupted.
+
+    Args:
+        args (Namespace): Parsed arguments (see add_serve_arguments)
+    """
+    service = QueryService(cache_size=args.cache_size, max_openings=args.max_openings)
+    if service.state is None:
+        return
+
+    stop = threading.Event()
+    threading.Thread(target=service.watch, args=(args.reload_interval, stop), daemon=True).start()
+    server, address = start_query_server(service, args.host, args.port, args.socket)
+    print(f"Serving {len(service.state['cases_df'])} cases on {address}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop.set()
+        server.shutdown()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Answer case simulator queries over a local JSON API')
+    add_serve_arguments(parser)
+    serve(parser.parse_args())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Simulation Plot Data
+
+Builds the data behind the simulation plots without holding per-opening
+Python objects, so plots stay cheap for any number of openings:
+- The profit histogram is binned from the drop count of each item, which is
+  accumulated while simulating. A KDE is then computed on the bins instead of
+  on every opening.
+- The cumulative profit curve is accumulated batch by batch, keeping only the
+  lowest and highest point of each small bucket of openings, and downsampled
+  to a few thousand points with Largest-Triangle-Three-Buckets (LTTB), which
+  preserves the visual shape of the curve.
+"""
+
+import math
+
+import numpy as np
+
+# Default number of histogram bins
+DEFAULT_HISTOGRAM_BINS = 100
+
+# Default number of points of the KDE curve
+DEFAULT_KDE_POINTS = 512
+
+# Default number of points of the downsampled cumulative profit curve
+DEFAULT_CURVE_POINTS = 2000
+
+# Number of buckets kept per output point before LTTB
+CURVE_OVERSAMPLING = 4
+
+
+def profit_histogram(item_profits, item_counts, bins=DEFAULT_HISTOGRAM_BINS):
+    """
+    Bin the profit of every opening from the drop count of each item.
+
+    Args:
+        item_profits (ndarray): Profit of one opening for each item
+        item_counts (ndarray): Number of drops of each item
+        bins (int): Number of bins
+
+    Returns:
+        tuple: (counts, bin_edges) - Number of openings in each bin and the bin edges
+    """
+    counts, edges = np.histogram(item_profits, bins=bins, weights=item_counts)
+    return counts, edges
+
+
+def binned_kde(counts, edges, num_points=DEFAULT_KDE_POINTS):
+    """
+    Compute a Gaussian kernel density estimate from a histogram.
+
+    The kernels are placed on the bin centers and weighted by the bin counts.
+    The bandwidth follows Silverman's rule, but is never narrower than a bin.
+
+    Args:
+        counts (ndarray): Number of openings in each bin
+        edges (ndarray): Bin edges
+        num_points (int): Number of points of the estimate
+
+    Returns:
+        tuple: (x, y) - Evaluation points and estimated number of openings per bin width
+    """
+    centers = (edges[:-1] + edges[1:]) / 2
+    bin_width = float(edges[1] - edges[0])
+    total = float(counts.sum())
+
+    mean = counts @ centers / total
+    std = math.sqrt(counts @ (centers - mean)**2 / total)
+    bandwidth = max(1.06 * std * total**(-1 / 5), bin_width)
+
+    x = np.linspace(edges[0], edges[-1], num_points)
+    kernels = np.exp(-0.5 * ((x[:, None] - centers[None, :]) / bandwidth)**2) / (bandwidth * math.sqrt(2 * math.pi))
+
+    return x, kernels @ counts * bin_width
+
+
+def lttb(x, y, num_points):
+    """
+    Downsample a curve with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept. The points in between are split into
+    buckets and, in each bucket, the point forming the largest triangle with
+    the previously kept point and the average of the next bucket is kept.
+
+    Args:
+        x (ndarray): X coordinates, in increasing order
+        y (ndarray): Y coordinates
+        num_points (int): Number of points to keep
+
+    Returns:
+        tuple: (x, y) - Coordinates of the kept points
+    """
+    n = len(x)
+    if num_points >= n or num_points < 3:
+        return x, y
+
+    every = (n - 2) / (num_points - 2)
+    selected = np.empty(num_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(num_points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+
+        # Average of the next bucket (the last point for the last bucket)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return x[selected], y[selected]
+
+
+class CumulativeCurve:
+    """
+    Downsampled cumulative profit curve, accumulated one batch of openings at a time.
+
+    Args:
+        num_openings (int): Total number of openings that will be added
+        max_points (int): Number of points of the final curve
+    """
+
+    def __init__(self, num_openings, max_points=DEFAULT_CURVE_POINTS):
+        self.max_points = max_points
+        self.bucket_size = max(1, math.ceil(num_openings / (max_points * CURVE_OVERSAMPLING)))
+        self.count = 0
+        self.total = 0.0
+        self.xs = []
+        self.ys = []
+
+    def update(self, profits):
+        """
+        Add a batch of openings.
+
+        Args:
+            profits (ndarray): Profit of each opening of the batch, in order
+        """
+        if not len(profits):
+            return
+
+        cumulative = self.total + np.cumsum(profits)
+        positions = np.arange(self.count + 1, self.count + len(profits) + 1)
+
+        # Keep the lowest and highest point of each bucket, in order
+        full = len(cumulative) // self.bucket_size * self.bucket_size
+        buckets = cumulative[:full].reshape(-1, self.bucket_size)
+        starts = np.arange(0, full, self.bucket_size)
+        keep = [starts + buckets.argmin(axis=1), starts + buckets.argmax(axis=1)]
+        if full < len(cumulative):
+            # Last partial bucket of the batch
+            keep.append([full + np.argmin(cumulative[full:]), full + np.argmax(cumulative[full:])])
+        keep = np.unique(np.concatenate(keep))
+
+        self.xs.append(positions[keep])
+        self.ys.append(cumulative[keep])
+        self.count += len(profits)
+        self.total = float(cumulative[-1])
+
+    def points(self):
+        """
+        Get the downsampled curve.
+
+        Returns:
+            tuple: (x, y) - Number of openings and cumulative profit of each point
+        """
+        x = np.concatenate([[0]] + self.xs)
+        y = np.concatenate([[0.0]] + self.ys)
+        return lttb(x, y, self.max_points)
@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Snapshot Store
+
+History of the fetched data, recorded fetch after fetch without keeping a
+full copy of everything each time:
+- blobs/: the main page entry and the content of each case, as gzipped JSON
+  named after the SHA-256 of their canonical JSON. A case unchanged since an
+  earlier fetch points to the blob already stored, so it costs no space.
+- snapshots/{snapshot_id}.json: the manifest of a fetch, mapping every case
+  to its blob.
+- history/: a columnar price history with one row per case and fetch (time,
+  case, case price from main page fetches, expected value from case content
+  fetches), each column an append-only binary file. The EV and price series
+  of a case are read from these columns, without opening any blob.
+
+Fetches are recorded with --snapshot on hellcase_api.py, fetch_case_contents.py
+and pipeline.py, and earlier timestamped files can be imported.
+"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from create_case_contents_csv import SUB_ITEM_FIELDS
+
+# Default location of the store
+SNAPSHOT_DIR = 'data/snapshots'
+
+# Columns of the price history: name -> dtype
+HISTORY_COLUMNS = {
+    'time': np.float64,           # Unix time of the fetch
+    'case': np.int32,             # Index of the case in case_names.json
+    'price': np.float64,          # Case price (NaN for case content fetches)
+    'expected_value': np.float64  # Expected value (NaN for main page fetches)
+}
+
+# Snapshot kinds
+SNAPSHOT_KINDS = ('mainpage', 'contents')
+
+# Timestamp in the names of the files written by earlier fetches
+TIMESTAMP_PATTERN = re.compile(r'(\d{8}_\d{6})')
+
+
+def canonical_json(data):
+    """
+    Serialize data so that equal content always gives the same bytes.
+
+    Args:
+        data: JSON-serializable data
+
+    Returns:
+        bytes: Canonical JSON
+    """
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def case_expected_value(case_data):
+    """
+    Compute the expected value of a case from its content, as compute_case_metrics does from its rows.
+
+    Args:
+        case_data (dict): Content of the case from the API
+
+    Returns:
+        float: Sum of odds * price over the sub-items of the case
+    """
+    odds_key, odds_default = SUB_ITEM_FIELDS['odds']
+    price_key, price_default = SUB_ITEM_FIELDS['sub_steam_price_en']
+    sub_items = [sub_item for parent_item in case_data.get('itemlist', []) for sub_item in parent_item.get('items') or []]
+    odds = pd.to_numeric(pd.Series([sub_item.get(odds_key, odds_default) for sub_item in sub_items], dtype=object),
+                         errors='coerce')
+    prices = pd.to_numeric(pd.Series([sub_item.get(price_key, price_default) for sub_item in sub_items],
+                                     dtype=object), errors='coerce')
+    return float((odds * prices).sum())
+
+
+class SnapshotStore:
+    """
+    Content-addressed store of fetched data with a columnar price history.
+
+    Args:
+        root (str): Directory of the store
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        for directory in ('blobs', 'snapshots', 'history'):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+        self.case_names_path = os.path.join(root, 'history', 'case_names.json')
+        self.case_names = []
+        if os.path.exists(self.case_names_path):
+            with open(self.case_names_path, 'r', encoding='utf-8') as f:
+                self.case_names = json.load(f)
+        self.case_codes = {name: code for code, name in enumerate(self.case_names)}
+
+    def blob_path(self, digest):
+        """
+        Get the path of a blob.
+
+        Args:
+            digest (str): SHA-256 of the data
+
+        Returns:
+            str: Path of the blob
+        """
+        return os.path.join(self.root, 'blobs', digest[:2], f'{digest}.json.gz')
+
+    def put_blob(self, data):
+        """
+        Store data unless the same content is already stored.
+
+        Args:
+            data: JSON-serializable data
+
+        Returns:
+            tuple: (digest, stored) - SHA-256 of the canonical JSON and whether a new blob was written
+        """
+        content = canonical_json(data)
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return digest, False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(gzip.compress(content, mtime=0))
+        os.replace(f'{path}.tmp', path)
+        return digest, True
+
+    def get_blob(self, digest):
+        """
+        Read stored data.
+
+        Args:
+            digest (str): SHA-256 of the data
+
+        Returns:
+            The data
+        """
+        with open(self.blob_path(digest), 'rb') as f:
+            return json.loads(gzip.decompress(f.read()))
+
+    def record(self, kind, entries, taken_at=None):
+        """
+        Record a fetch.
+
+        Args:
+            kind (str): mainpage or contents (see SNAPSHOT_KINDS)
+            entries (iterable): (case_name, data) of every fetched case
+            taken_at (float, optional): Unix time of the fetch. Defaults to now
+
+        Returns:
+            dict: Manifest of the snapshot
+        """
+        taken_at = time.time() if taken_at is None else taken_at
+        snapshot_id = f"{datetime.fromtimestamp(taken_at).strftime('%Y%m%d_%H%M%S')}_{kind}"
+        # Fetches of the same kind recorded within the same second get numbered
+        base_id, number = snapshot_id, 1
+        while os.path.exists(os.path.join(self.root, 'snapshots', f'{snapshot_id}.json')):
+            number += 1
+            snapshot_id = f'{base_id}_{number}'
+
+        cases = {}
+        new_blobs = 0
+        values = {}
+        for case_name, data in entries:
+            digest, stored = self.put_blob(data)
+            cases[case_name] = digest
+            new_blobs += stored
+            if kind == 'mainpage':
+                try:
+                    values[case_name] = (float(data.get('price')), np.nan)
+                except (TypeError, ValueError):
+                    values[case_name] = (np.nan, np.nan)
+            else:
+                values[case_name] = (np.nan, case_expected_value(data))
+
+        manifest = {'id': snapshot_id, 'kind': kind, 'taken_at': taken_at, 'new_blobs': new_blobs, 'cases': cases}
+        path = os.path.join(self.root, 'snapshots', f'{snapshot_id}.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(f'{path}.tmp', path)
+
+        self.append_history(taken_at, values)
+        return manifest
+
+    def record_mainpage(self, cases, taken_at=None):
+        """
+        Record a main page fetch.
+
+        Args:
+            cases (list): Case dictionaries, as returned by hellcase_api.fetch_cases
+            taken_at (float, optional): Unix time of the fetch. Defaults to now
+
+        Returns:
+            dict: Manifest of the snapshot
+        """
+        return self.record('mainpage', ((case['name'], case) for case in cases), taken_at)
+
+    def record_contents(self, contents, taken_at=None):
+        """
+        Record a case contents fetch.
+
+        Args:
+            contents (iterable): (case_name, data) of every case, data being the content of the case from the API
+            taken_at (float, optional): Unix time of the fetch. Defaults to now
+
+        Returns:
+            dict: Manifest of the snapshot
+        """
+        return self.record('contents', contents, taken_at)
+
+    def append_history(self, taken_at, values):
+        """
+        Append rows to the price history.
+
+        Args:
+            taken_at (float): Unix time of the fetch
+            values (dict): (price, expected_value) of each case
+        """
+        with self.lock:
+            new_names = [name for name in values if name not in self.case_codes]
+            if new_names:
+                for name in new_names:
+                    self.case_codes[name] = len(self.case_names)
+                    self.case_names.append(name)
+                with open(f'{self.case_names_path}.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(self.case_names, f)
+                os.replace(f'{self.case_names_path}.tmp', self.case_names_path)
+
+            # Drop the rows a torn append left in some of the columns, so they do not
+            # shift the rows appended now
+            paths = {name: os.path.join(self.root, 'history', f'{name}.bin') for name in HISTORY_COLUMNS}
+            sizes = {name: os.path.getsize(path) if os.path.exists(path) else 0 for name, path in paths.items()}
+            rows = min(sizes[name] // np.dtype(dtype).itemsize for name, dtype in HISTORY_COLUMNS.items())
+            for name, dtype in HISTORY_COLUMNS.items():
+                if sizes[name] > rows * np.dtype(dtype).itemsize:
+                    os.truncate(paths[name], rows * np.dtype(dtype).itemsize)
+
+            columns = {
+                'time': np.full(len(values), taken_at),
+                'case': [self.case_codes[name] for name in values],
+                'price': [price for price, _ in values.values()],
+                'expected_value': [expected_value for _, expected_value in values.values()]
+            }
+            for name, dtype in HISTORY_COLUMNS.items():
+                with open(paths[name], 'ab') as f:
+                    np.asarray(columns[name], dtype=dtype).tofile(f)
+
+    def read_history(self):
+        """
+        Read the price history columns.
+
+        Rows only partly appended (e.g. after a crash) are ignored, and dropped
+        from the files by the next append_history.
+
+        Returns:
+            dict: Array of each column
+        """
+        columns = {}
+        for name, dtype in HISTORY_COLUMNS.items():
+            path = os.path.join(self.root, 'history', f'{name}.bin')
+            columns[name] = np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.zeros(0, dtype=dtype)
+        rows = min(len(column) for column in columns.values())
+        return {name: column[:rows] for name, column in columns.items()}
+
+    def history(self, case_names=None, since=None):
+        """
+        Get the price, expected value and EV ratio series of cases.
+
+        Each row carries the latest case price and expected value known at its time.
+
+        Args:
+            case_names (list, optional): Cases to get. Defaults to every case
+            since (float, optional): Only keep rows from this Unix time on
+
+        Returns:
+            DataFrame: time, case_name, price, expected_value and ev_ratio, sorted by case and time
+        """
+        columns = self.read_history()
+        keep = np.ones(len(columns['time']), dtype=bool)
+        if case_names is not None:
+            codes = [self.case_codes[name] for name in case_names if name in self.case_codes]
+            keep &= np.isin(columns['case'], codes)
+
+        history_df = pd.DataFrame({name: column[keep] for name, column in columns.items()})
+        history_df = history_df.sort_values(['case', 'time'], kind='stable')
+        history_df[['price', 'expected_value']] = history_df.groupby('case')[['price', 'expected_value']].ffill()
+        if since is not None:
+            history_df = history_df[history_df['time'] >= since]
+
+        history_df.insert(0, 'case_name', np.asarray(self.case_names, dtype=object)[history_df['case'].to_numpy()]
+                          if len(history_df) else [])
+        history_df['time'] = pd.to_datetime(history_df['time'], unit='s').dt.floor('s')
+        history_df['ev_ratio'] = history_df['expected_value'] / history_df['price'].where(history_df['price'] != 0)
+        return history_df.drop(columns='case').reset_index(drop=True)
+
+    def snapshots(self):
+        """
+        List the recorded snapshots.
+
+        Returns:
+            DataFrame: id, kind, time, number of cases and number of new blobs of each snapshot
+        """
+        manifests = []
+        for path in sorted(glob.glob(os.path.join(self.root, 'snapshots', '*.json'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            manifests.append({'id': manifest['id'], 'kind': manifest['kind'],
+                              'time': pd.to_datetime(manifest['taken_at'], unit='s').floor('s'),
+                              'cases': len(manifest['cases']), 'new_blobs': manifest['new_blobs']})
+        return pd.DataFrame(manifests, columns=['id', 'kind', 'time', 'cases', 'new_blobs']).sort_values(
+            'time', kind='stable', ignore_index=True)
+
+    def load_snapshot(self, snapshot_id):
+        """
+        Load the data of a snapshot.
+
+        Args:
+            snapshot_id (str): ID of the snapshot
+
+        Returns:
+            dict: Data of each case of the snapshot, or None if the snapshot does not exist
+        """
+        path = os.path.join(self.root, 'snapshots', f'{snapshot_id}.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return {case_name: self.get_blob(digest) for case_name, digest in manifest['cases'].items()}
+
+    def stats(self):
+        """
+        Get the size of the store and how much the deduplication saves.
+
+        Returns:
+            dict: Number of snapshots, case entries, distinct blobs and their size on disk
+        """
+        snapshots_df = self.snapshots()
+        blobs = glob.glob(os.path.join(self.root, 'blobs', '*', '*.json.gz'))
+        entries = int(snapshots_df['cases'].sum()) if len(snapshots_df) else 0
+        return {
+            'snapshots': len(snapshots_df),
+            'case_entries': entries,
+            'blobs': len(blobs),
+            'dedup_ratio': entries / len(blobs) if blobs else None,
+            'blob_bytes': sum(os.path.getsize(path) for path in blobs),
+            'history_rows': len(self.read_history()['time'])
+        }
+
+
+def add_snapshot_arguments(parser):
+    """
+    Add the snapshot store options to a command-line parser.
+
+    Args:
+        parser (ArgumentParser): The parser
+    """
+    parser.add_argument('--snapshot', action='store_true', help='Also record the fetched data in the snapshot store')
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR, help='Directory of the snapshot store')
+
+
+def open_snapshot_store(args):
+    """
+    Open the snapshot store as requested by the parsed command-line options.
+
+    Args:
+        args (Namespace): Parsed arguments (see add_snapshot_arguments)
+
+    Returns:
+        SnapshotStore: The store, or None if fetches are not recorded
+    """
+    return SnapshotStore(args.snapshot_dir) if args.snapshot else None
+
+
+def file_time(path):
+    """
+    Get the time of an earlier fetch from the timestamp in its file name.
+
+    Args:
+        path (str): Path of the file (e.g. hellcase_cases_20240101_120000.csv)
+
+    Returns:
+        float: Unix time, or the modification time of the file if its name has no timestamp
+    """
+    match = TIMESTAMP_PATTERN.search(os.path.basename(path))
+    if match:
+        return datetime.strptime(match.group(1), '%Y%m%d_%H%M%S').timestamp()
+    return os.path.getmtime(path)
+
+
+def import_files(store, cases_files=(), contents_files=()):
+    """
+    Record earlier timestamped main page CSVs and case contents JSONs in the store, oldest first.
+
+    Args:
+        store (SnapshotStore): The store
+        cases_files (list): Main page CSVs written by hellcase_api.py
+        contents_files (list): Combined case contents JSONs written by fetch_case_contents.py
+
+    Returns:
+        list: Manifests of the recorded snapshots
+    """
+    files = [(file_time(path), 'mainpage', path) for path in cases_files]
+    files += [(file_time(path), 'contents', path) for path in contents_files]
+
+    manifests = []
+    for taken_at, kind, path in sorted(files):
+        if kind == 'mainpage':
+            cases = pd.read_csv(path, dtype=str, keep_default_na=False).to_dict('records')
+            manifests.append(store.record_mainpage(cases, taken_at))
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifests.append(store.record_contents(json.load(f).items(), taken_at))
+        print(f"Imported {path}: {len(manifests[-1]['cases'])} cases, {manifests[-1]['new_blobs']} new blobs")
+    return manifests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query and maintain the snapshot store of fetched data')
+    parser.add_argument('--dir', default=SNAPSHOT_DIR, help='Directory of the store')
+    subparsers = parser.add_subparsers(dest='command', help='Command to execute')
+
+    import_parser = subparsers.add_parser('import', help='Import earlier timestamped fetches')
+    import_parser.add_argument('--cases', default='hellcase_cases_*.csv', help='Glob of the main page CSVs')
+    import_parser.add_argument('--contents', default='data/case_contents_*.json',
+                               help='Glob of the case contents JSONs')
+
+    subparsers.add_parser('list', help='List the snapshots')
+    subparsers.add_parser('stats', help='Show the size of the store')
+
+    history_parser = subparsers.add_parser('history', help='Show the price and EV series of cases')
+    history_parser.add_argument('case_names', nargs='+', help='Names of the cases')
+    history_parser.add_argument('--days', type=float, help='Only show the last N days')
+    history_parser.add_argument('--output', help='Save the series to a CSV file')
+
+    args = parser.parse_args()
+    store = SnapshotStore(args.dir)
+
+    if args.command == 'import':
+        # Only files named after the time of their fetch can be placed in the history
+        contents_files = [path for path in sorted(glob.glob(args.contents)) if TIMESTAMP_PATTERN.search(path)]
+        manifests = import_files(store, sorted(glob.glob(args.cases)), contents_files)
+        print(f"Imported {len(manifests)} snapshots into {args.dir}")
+
+    elif args.command == 'list':
+        print(tabulate(store.snapshots(), headers='keys', tablefmt='grid', showindex=False))
+
+    elif args.command == 'stats':
+        print(tabulate([[name, '-' if value is None else f"{value:.2f}" if isinstance(value, float) else value]
+                        for name, value in store.stats().items()], tablefmt='grid', disable_numparse=True))
+
+    elif args.command == 'history':
+        since = time.time() - args.days * 86400 if args.days else None
+        history_df = store.history(args.case_names, since)
+        if history_df.empty:
+            print("No history recorded for these cases.")
+        else:
+            print(tabulate(history_df, headers='keys', tablefmt='grid', floatfmt='.2f', showindex=False))
+            if args.output:
+                history_df.to_csv(args.output, index=False)
+                print(f"Saved the series to {args.output}")
+
+    else:
+        parser.print_help()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming Simulation Statistics
+
+Running statistics of the profit of a sequence of openings, updated one batch
+at a time so that memory does not depend on the number of openings:
+- Mean and variance, merged batch by batch with Welford's (Chan's) update.
+- Maximum drawdown of the cumulative profit, carrying the running peak over
+  from one batch to the next.
+
+Quantiles need no estimator: an opening can only yield one of the items of
+the case, so they are computed exactly from the per-item drop counts.
+"""
+
+import numpy as np
+
+
+class RunningStats:
+    """Running mean, variance and maximum drawdown of a sequence of profits."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total = 0.0
+        self.peak = 0.0
+        self.max_drawdown = 0.0
+
+    def update(self, profits):
+        """
+        Add a batch of openings.
+
+        Args:
+            profits (ndarray): Profit of each opening of the batch, in order
+        """
+        if not len(profits):
+            return
+
+        # Merge the batch mean and sum of squared deviations into the running ones
+        batch_count = len(profits)
+        batch_mean = float(profits.mean())
+        batch_m2 = float(((profits - batch_mean)**2).sum())
+        count = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_count / count
+        self.m2 += batch_m2 + delta**2 * self.count * batch_count / count
+        self.count = count
+
+        # Largest fall of the cumulative profit from its highest point so far
+        cumulative = self.total + np.cumsum(profits)
+        peaks = np.maximum(np.maximum.accumulate(cumulative), self.peak)
+        self.max_drawdown = max(self.max_drawdown, float((peaks - cumulative).max()))
+        self.peak = float(peaks[-1])
+        self.total = float(cumulative[-1])
+
+    @property
+    def variance(self):
+        """Sample variance of the profits seen so far."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+def quantiles_from_counts(values, counts, quantiles):
+    """
+    Compute exact quantiles of a sample given as distinct values and their counts.
+
+    Args:
+        values (ndarray): Distinct values
+        counts (ndarray): Number of occurrences of each value
+        quantiles (list): Quantiles to compute, between 0 and 1
+
+    Returns:
+        ndarray: The smallest value whose cumulative share reaches each quantile
+    """
+    seen = counts > 0
+    values = values[seen]
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(counts[seen][order])
+    positions = np.searchsorted(cumulative, np.asarray(quantiles) * cumulative[-1], side='left')
+    return values[order][np.minimum(positions, len(values) - 1)]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stub Hellcase API Server
+
+A local HTTP server mimicking the Hellcase endpoints used by this project
+(/mainpage and /open/{case_name}), for exercising the fetchers without
+hitting the real API. It can add latency, enforce a rate limit with 429
+responses and Retry-After headers, and fail a share of requests with 503.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+
+def make_handler(case_contents, latency=0.0, rate_limit=None, error_rate=0.0):
+    """
+    Create a request handler class serving the given case contents.
+
+    Args:
+        case_contents (dict): Content returned by /open/{case_name}, keyed by case name
+        latency (float): Average latency added to every response, in seconds
+        rate_limit (float, optional): Maximum number of requests per second before answering 429
+        error_rate (float): Share of requests answered with 503
+
+    Returns:
+        type: The request handler class
+    """
+    lock = threading.Lock()
+    window = {'start': time.monotonic(), 'count': 0}
+    stats = {'requests': 0, 'rate_limited': 0, 'errors': 0}
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with lock:
+                stats['requests'] += 1
+
+                # Fixed one-second windows are enough to emulate a rate limit
+                now = time.monotonic()
+                if now - window['start'] >= 1:
+                    window['start'], window['count'] = now, 0
+                window['count'] += 1
+                limited = rate_limit is not None and window['count'] > rate_limit
+                retry_after = max(0.0, 1 - (now - window['start']))
+                if limited:
+                    stats['rate_limited'] += 1
+
+            if latency:
+                time.sleep(random.uniform(0.5, 1.5) * latency)
+
+            if limited:
+                self.send_json(429, {'error': 'Too Many Requests'}, {'Retry-After': f"{retry_after:.2f}"})
+                return
+
+            if random.random() < error_rate:
+                with lock:
+                    stats['errors'] += 1
+                self.send_json(503, {'error': 'Service Unavailable'})
+                return
+
+            path = urlparse(self.path).path
+            if path == '/mainpage':
+                cases = [{'name': name, 'price': content.get('price', 1.0)} for name, content in case_contents.items()]
+                self.send_json(200, {'main_page': [{'cases_to_show': cases}]})
+            elif path.startswith('/open/'):
+                case_name = unquote(path[len('/open/'):])
+                if case_name in case_contents:
+                    self.send_json(200, case_contents[case_name])
+                else:
+                    self.send_json(404, {'error': 'Not Found'})
+            else:
+                self.send_json(404, {'error': 'Not Found'})
+
+        def log_message(self, format, *args):
+            pass
+
+    StubHandler.stats = stats
+    return StubHandler
+
+
+def start_stub_server(case_contents, port=0, latency=0.0, rate_limit=None, error_rate=0.0):
+    """
+    Start the stub server on a background thread.
+
+    Args:
+        case_contents (dict): Content returned by /open/{case_name}, keyed by case name
+        port (int): Port to listen on (0 picks a free port)
+        latency (float): Average latency added to every response, in seconds
+        rate_limit (float, optional): Maximum number of requests per second before answering 429
+        error_rate (float): Share of requests answered with 503
+
+    Returns:
+        tuple: (server, base_url) - The running server and its base URL
+    """
+    handler = make_handler(case_contents, latency, rate_limit, error_rate)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stub Hellcase API server')
+    parser.add_argument('--data', default='data/case_contents.json', help='Combined case contents JSON to serve')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Average response latency in seconds')
+    parser.add_argument('--rate-limit', type=float, help='Maximum number of requests per second before answering 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    args = parser.parse_args()
+
+    with open(args.data, 'r', encoding='utf-8') as f:
+        contents = json.load(f)
+
+    server, base_url = start_stub_server(contents, args.port, args.latency, args.rate_limit, args.error_rate)
+    print(f"Serving {len(contents)} cases on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic Dataset Generator
+
+Generates a Hellcase-like dataset with the same schemas as the real one, so
+the pipeline can be tested and benchmarked at any scale without
+redistributing scraped data:
+- cases.csv, with the columns written by hellcase_api.py
+- case_contents.json, the combined case contents as returned by the API
+- case_contents_dataset.csv, flattened by create_case_contents_csv.py
+
+The shape of the data follows the real dataset: about 30 items per case with
+up to five exteriors and StatTrak variants (~140 rows per case), odds summing
+to 100 per case over roll tickets 1-100000, log-normal case and item prices,
+and rarer items being more expensive. Generation is seeded, and cases are
+written one at a time so memory stays flat from 100 to 100k cases.
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+
+import numpy as np
+
+from create_case_contents_csv import create_case_contents_csv
+
+# Default number of cases
+DEFAULT_NUM_CASES = 1000
+
+# Number of roll tickets of a case
+NUM_TICKETS = 100000
+
+# Weapons: (weapon name, item type, steam type suffix)
+WEAPONS = [
+    ('AK-47', 'Rifle', 'rifle'),
+    ('M4A4', 'Rifle', 'rifle'),
+    ('M4A1-S', 'Rifle', 'rifle'),
+    ('AWP', 'Sniper Rifle', 'sniper_rifle'),
+    ('Desert Eagle', 'Pistol', 'pistol'),
+    ('Glock-18', 'Pistol', 'pistol'),
+    ('USP-S', 'Pistol', 'pistol'),
+    ('P90', 'SMG', 'smg'),
+    ('MAC-10', 'SMG', 'smg'),
+    ('Nova', 'Shotgun', 'shotgun'),
+    ('★ Karambit', 'Knife', 'knife'),
+    ('★ Butterfly Knife', 'Knife', 'knife')
+]
+
+RARITIES = ['consumer', 'industrial', 'milspec', 'restricted', 'classified', 'covert']
+
+# Exteriors: (name, short name, price multiplier)
+EXTERIORS = [
+    ('Factory New', 'FN', 1.6),
+    ('Minimal Wear', 'MW', 1.2),
+    ('Field-Tested', 'FT', 1.0),
+    ('Well-Worn', 'WW', 0.85),
+    ('Battle-Scarred', 'BS', 0.75)
+]
+
+SORT_CATEGORIES = ['discounts', 'new', 'popular', 'premium', 'collections']
+
+# Columns of cases.csv, in the sorted order written by hellcase_api.py
+CASE_COLUMNS = sorted([
+    'animation', 'available', 'case_price', 'casebattle_only', 'contains_shards', 'crowdfunding_amount',
+    'enabled', 'enabled_influencer', 'event', 'game', 'id', 'image', 'image_thumb', 'is_limited_count',
+    'is_limited_expire', 'is_new', 'is_top', 'limited_count', 'limited_count_max', 'limited_expire_date',
+    'locale_name', 'name', 'on_fire', 'price', 'price_old', 'sort_category', 'subscription',
+    'subscription_access', 'type', 'url', 'user_level_access', 'wallet_only', 'weapon_animation',
+    'weapon_image', 'weapon_thumb_image'
+])
+
+
+def generate_case(rng, case_index):
+    """
+    Generate one case.
+
+    Args:
+        rng (Generator): NumPy random generator
+        case_index (int): Index of the case, used in its name
+
+    Returns:
+        tuple: (case_row, case_name, case_data) - Row of cases.csv, name of the case and
+            its contents in the API format ({'itemlist': [...]})
+    """
+    case_name = f'synthetic-case-{case_index}'
+    case_price = round(float(np.clip(rng.lognormal(np.log(7), 1.6), 0.06, 900)), 2)
+
+    case_row = {column: '' for column in CASE_COLUMNS}
+    case_row.update({
+        'available': 1,
+        'case_price': case_price,
+        'casebattle_only': bool(rng.random() < 0.05),
+        'contains_shards': bool(rng.random() < 0.15),
+        'crowdfunding_amount': 0.0,
+        'enabled': 1,
+        'enabled_influencer': False,
+        'game': 'csgo',
+        'id': case_index + 1,
+        'image': f'https://example.com/cases/{case_name}.png',
+        'image_thumb': f'https://example.com/cases/{case_name}_thumb.png',
+        'is_limited_count': 0,
+        'is_limited_expire': False,
+        'is_new': bool(rng.random() < 0.02),
+        'is_top': False,
+        'limited_count': 0,
+        'limited_count_max': 0,
+        'locale_name': f'Synthetic Case {case_index}',
+        'name': case_name,
+        'on_fire': bool(rng.random() < 0.04),
+        'price': case_price,
+        'price_old': case_price,
+        'sort_category': SORT_CATEGORIES[rng.integers(len(SORT_CATEGORIES))],
+        'type': 'simple',
+        'url': f'https://hellcase.com/open/{case_name}',
+        'wallet_only': False
+    })
+
+    # Item base prices around the case price, with a long right tail
+    num_items = int(rng.integers(10, 51))
+    base_prices = np.minimum(rng.lognormal(np.log(case_price * 2), 1.5, num_items), 10000)
+
+    # Sub-items: a random non-empty subset of exteriors per item, each with an optional StatTrak variant
+    has_exterior = rng.random((num_items, len(EXTERIORS))) < 0.55
+    has_exterior[np.arange(num_items), rng.integers(len(EXTERIORS), size=num_items)] = True
+    has_stattrak = has_exterior & (rng.random((num_items, len(EXTERIORS))) < 0.5)
+    variants = np.stack([has_exterior, has_stattrak], axis=2)
+    items, exteriors, stattraks = np.nonzero(variants)
+
+    multipliers = np.array([exterior[2] for exterior in EXTERIORS])
+    prices = base_prices[items] * multipliers[exteriors] * np.where(stattraks, 2, 1) * rng.uniform(0.8, 1.2, len(items))
+    prices = np.maximum(np.round(prices, 2), 0.03)
+
+    # Rarer sub-items are more expensive; odds sum to 100 and map to ticket ranges
+    weights = prices**-1.2 * rng.lognormal(0, 0.3, len(prices))
+    odds = np.maximum(np.round(weights / weights.sum() * 100, 3), 0.001)
+    ticket_ends = np.maximum(np.round(np.cumsum(odds) / odds.sum() * NUM_TICKETS).astype(np.int64),
+                             np.arange(1, len(odds) + 1))
+    ticket_ends[-1] = NUM_TICKETS
+    ticket_starts = np.concatenate([[1], ticket_ends[:-1] + 1])
+
+    weapons = rng.integers(len(WEAPONS), size=num_items).tolist()
+    rarities = np.minimum((np.log10(base_prices + 1) * 2).astype(int), len(RARITIES) - 1).tolist()
+
+    itemlist = []
+    for item in range(num_items):
+        weapon, item_type, steam_type = WEAPONS[weapons[item]]
+        rarity = RARITIES[rarities[item]]
+        skin = f'Synthetic {case_index}-{item}'
+        itemlist.append({
+            'item_name': f'{weapon} | {skin}',
+            'weapon_name': weapon,
+            'skin_name': skin,
+            'rarity': rarity,
+            'steam_type': f'{rarity}_{steam_type}',
+            'steam_itemtype': item_type,
+            'steam_exterior': '',
+            'steam_short_exterior': '',
+            'is_stattrak': False,
+            'steam_is_souvenir': False,
+            'steam_market_hash_name': f'{weapon} | {skin}',
+            'steam_image': f'https://example.com/items/{case_index}-{item}.png',
+            'is_shard': False,
+            'game': 'csgo',
+            'items': []
+        })
+
+    rows = zip(items.tolist(), exteriors.tolist(), stattraks.tolist(), prices.tolist(), odds.tolist(),
+               ticket_starts.tolist(), ticket_ends.tolist())
+    for item, exterior, stattrak, price, item_odds, ticket_start, ticket_end in rows:
+        parent = itemlist[item]
+        exterior_name, short_exterior, _ = EXTERIORS[exterior]
+        if not parent['items']:
+            parent['steam_exterior'] = exterior_name
+            parent['steam_short_exterior'] = short_exterior
+        parent['items'].append({
+            'min': ticket_start,
+            'max': ticket_end,
+            'odds': item_odds,
+            'steam_exterior': exterior_name,
+            'steam_short_exterior': short_exterior,
+            'is_stattrak': stattrak,
+            'rarity': parent['rarity'],
+            'steam_image': parent['steam_image'],
+            'game': 'csgo',
+            'steam_price_en': price
+        })
+
+    return case_row, case_name, {'itemlist': itemlist}
+
+
+def generate_dataset(num_cases=DEFAULT_NUM_CASES, output_dir='data/synthetic', seed=0, flatten=True):
+    """
+    Generate a synthetic dataset.
+
+    Args:
+        num_cases (int): Number of cases
+        output_dir (str): Directory of the generated files
+        seed (int): Seed for the random number generator
+        flatten (bool): Also create case_contents_dataset.csv with create_case_contents_csv
+
+    Returns:
+        dict: Paths of the generated files ('cases_csv', 'case_contents_json' and
+            'case_contents_csv' when flattened)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {
+        'cases_csv': os.path.join(output_dir, 'cases.csv'),
+        'case_contents_json': os.path.join(output_dir, 'case_contents.json')
+    }
+
+    rng = np.random.default_rng(seed)
+
+    # Write both files one case at a time
+    with open(paths['cases_csv'], 'w', newline='', encoding='utf-8') as cases_file, \
+            open(paths['case_contents_json'], 'w', encoding='utf-8') as contents_file:
+        writer = csv.DictWriter(cases_file, fieldnames=CASE_COLUMNS)
+        writer.writeheader()
+        contents_file.write('{')
+        for case_index in range(num_cases):
+            case_row, case_name, case_data = generate_case(rng, case_index)
+            writer.writerow(case_row)
+            if case_index:
+                contents_file.write(', ')
+            contents_file.write(f'{json.dumps(case_name)}: {json.dumps(case_data)}')
+        contents_file.write('}')
+
+    if flatten:
+        paths['case_contents_csv'] = os.path.join(output_dir, 'case_contents_dataset.csv')
+        # create_case_contents_csv reports every case; keep the output short
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            create_case_contents_csv(paths['case_contents_json'], paths['case_contents_csv'])
+
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic Hellcase dataset')
+    parser.add_argument('--cases', type=int, default=DEFAULT_NUM_CASES, help='Number of cases (e.g. 100 to 100000)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the random number generator')
+    parser.add_argument('--output-dir', default='data/synthetic', help='Directory of the generated files')
+    parser.add_argument('--no-csv', action='store_true', help='Do not create case_contents_dataset.csv')
+    args = parser.parse_args()
+
+    paths = generate_dataset(args.cases, args.output_dir, args.seed, not args.no_csv)
+    for path in paths.values():
+        print(f"Saved {path}")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Regression tests of the grouped case metrics.
+
+compute_case_metrics replaced per-case loops in calculate_ev_metrics and
+calculate_risk_metrics. The original loops are kept below as the reference,
+and both implementations must give the same tables on a synthetic dataset.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from case_simulator import calculate_ev_metrics, calculate_risk_metrics
+from synthetic_data import generate_dataset
+
+
+def reference_ev_metrics(cases_df, case_contents_df):
+    # Per-case loop of calculate_ev_metrics before the grouped pass
+    case_ev = []
+
+    for case_name in case_contents_df['case_name'].unique():
+        case_items = case_contents_df[case_contents_df['case_name'] == case_name]
+
+        ev = 0
+        if 'odds' in case_items.columns and 'sub_steam_price_en' in case_items.columns:
+            ev = (case_items['odds'] * case_items['sub_steam_price_en']).sum()
+
+        case_price = cases_df[cases_df['name'] == case_name]['price'].values[0] if case_name in cases_df['name'].values else None
+
+        case_ev.append({
+            'Case Name': case_name,
+            'Expected Value': ev,
+            'Case Price': case_price,
+            'EV Ratio': ev / case_price if case_price else None
+        })
+
+    ev_df = pd.DataFrame(case_ev)
+    ev_df = ev_df.dropna().sort_values('EV Ratio', ascending=False)
+
+    return ev_df
+
+
+def reference_risk_metrics(cases_df, case_contents_df, top_cases=None):
+    # Per-case loop of calculate_risk_metrics before the grouped pass
+    risk_metrics = []
+
+    if top_cases is None:
+        top_cases = case_contents_df['case_name'].unique()
+
+    for case_name in top_cases:
+        case_items = case_contents_df[case_contents_df['case_name'] == case_name]
+
+        if 'odds' in case_items.columns and 'sub_steam_price_en' in case_items.columns:
+            expected_value = (case_items['odds'] * case_items['sub_steam_price_en']).sum()
+            variance = (case_items['odds'] * (case_items['sub_steam_price_en'] - expected_value)**2).sum()
+            std_dev = np.sqrt(variance)
+
+            case_price = cases_df[cases_df['name'] == case_name]['price'].values[0] if case_name in cases_df['name'].values else 0
+
+            total_odds = case_items['odds'].sum()
+            if total_odds > 1:
+                normalized_odds = case_items['odds'] / total_odds
+                prob_profit = normalized_odds[case_items['sub_steam_price_en'] > case_price].sum() * 100
+            else:
+                prob_profit = case_items[case_items['sub_steam_price_en'] > case_price]['odds'].sum() * 100
+
+            max_item_value = case_items['sub_steam_price_en'].max()
+            max_profit = max_item_value - case_price
+
+            risk_metrics.append({
+                'Case Name': case_name,
+                'Expected Value': expected_value,
+                'Standard Deviation': std_dev,
+                'Coefficient of Variation': std_dev / expected_value if expected_value else float('inf'),
+                'Probability of Profit (%)': prob_profit,
+                'Max Potential Profit': max_profit
+            })
+
+    return pd.DataFrame(risk_metrics)
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    paths = generate_dataset(12, str(tmp_path_factory.mktemp('synthetic')), seed=3)
+    cases_df = pd.read_csv(paths['cases_csv'])
+    case_contents_df = pd.read_csv(paths['case_contents_csv'])
+    case_names = case_contents_df['case_name'].unique()
+
+    # A case missing from cases_df, a free case, and a case whose odds sum to less than 1
+    # (the published odds are percentages, so every other case sums to more than 1)
+    cases_df = cases_df[cases_df['name'] != case_names[0]].copy()
+    cases_df.loc[cases_df['name'] == case_names[1], 'price'] = 0
+    in_case = case_contents_df['case_name'] == case_names[2]
+    case_contents_df.loc[in_case, 'odds'] /= case_contents_df.loc[in_case, 'odds'].sum() * 2
+
+    return cases_df.reset_index(drop=True), case_contents_df, case_names
+
+
+def test_odds_cover_both_normalizations(dataset):
+    _, case_contents_df, _ = dataset
+    total_odds = case_contents_df.groupby('case_name')['odds'].sum()
+    assert (total_odds > 1).any() and (total_odds <= 1).any()
+
+
+def test_ev_metrics_match_reference(dataset):
+    cases_df, case_contents_df, case_names = dataset
+    expected = reference_ev_metrics(cases_df, case_contents_df)
+    result = calculate_ev_metrics(cases_df, case_contents_df)
+
+    # The missing and the free case have no EV Ratio and are left out
+    assert case_names[0] not in result['Case Name'].values
+    assert case_names[1] not in result['Case Name'].values
+    assert list(result.columns) == list(expected.columns)
+    assert list(result['Case Name']) == list(expected['Case Name'])
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+def test_risk_metrics_match_reference(dataset):
+    cases_df, case_contents_df, _ = dataset
+    expected = reference_risk_metrics(cases_df, case_contents_df)
+    result = calculate_risk_metrics(cases_df, case_contents_df)
+
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_risk_metrics_of_selected_cases_match_reference(dataset):
+    cases_df, case_contents_df, case_names = dataset
+    top_cases = [case_names[2], case_names[0], case_names[1], 'not-a-case']
+    expected = reference_risk_metrics(cases_df, case_contents_df, top_cases)
+    result = calculate_risk_metrics(cases_df, case_contents_df, top_cases)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
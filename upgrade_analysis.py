@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Upgrade Analysis
+
+Models the Hellcase upgrade contract (the /upgrade/make flow: chance,
+direction, old_items, new_items and an optional balance top-up) and evaluates
+its expected value and variance.
+
+Upgrade model:
+- The player stakes a source item worth S, picks a target item worth T and a
+  chance c (in %). The house keeps an edge h, so the stake needed for chance c
+  is R = c / 100 * T / (1 - h). The difference B = R - S is paid from the
+  balance; combinations where the source alone is worth more than R are not
+  offered (the site would give a higher chance instead).
+- A roll r in [0, 100) decides the outcome: "under" wins when r < c and "over"
+  wins when r >= 100 - c. With a uniform roll both directions win with
+  probability c / 100; a custom roll CDF can be given to model a biased roll.
+- On a win the player gets the target item, otherwise nothing.
+
+With a uniform roll, an upgrade returns p * T / R = 1 - h per dollar staked
+whatever the items and chance: every EV Ratio is 1 - h and the expected value
+is -h * R. The source item only decides how much of the stake is paid from
+the balance.
+
+evaluate_upgrades scores explicit (source, target) grids. The full sweep over
+every (source, target, chance, direction) combination does not build the grid:
+with items sorted by price, the feasible sources of a target are a prefix of
+the table, so the sweep runs in O(n log n) for n items.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Default share of the stake kept by the house (assumption, configurable)
+DEFAULT_HOUSE_EDGE = 0.1
+
+# Default chances (in %) evaluated by the sweep
+DEFAULT_CHANCES = (10, 25, 50, 75, 90)
+
+# Roll directions of the upgrade
+DIRECTIONS = ('under', 'over')
+
+# Rankings of the best upgrades: name -> (column, ascending). With a uniform roll the EV
+# Ratio of every upgrade is 1 - house edge, so it only ranks upgrades under a custom roll CDF
+UPGRADE_RANKINGS = {
+    'ev': ('Expected Value', False),
+    'ev-ratio': ('EV Ratio', False),
+    'std-dev': ('Standard Deviation', False),
+    'top-up': ('Balance Top-Up', True)
+}
+
+
+def item_labels(case_contents_df):
+    """
+    Label the items of the case contents, so the same item is recognized across cases.
+
+    Args:
+        case_contents_df (DataFrame): DataFrame containing case contents data
+
+    Returns:
+        Series: Label of each row, e.g. 'StatTrak™ AK-47 | Redline (Field-Tested)'
+    """
+    stattrak = np.where(case_contents_df['sub_is_stattrak'].astype(str) == 'True', 'StatTrak™ ', '')
+    return (stattrak + case_contents_df['weapon_name'].astype(str) + ' | ' + case_contents_df['skin_name'].astype(str)
+            + ' (' + case_contents_df['sub_steam_exterior'].astype(str) + ')')
+
+
+def build_item_price_table(case_contents_df):
+    """
+    Build the table of upgradeable items and their prices.
+
+    Args:
+        case_contents_df (DataFrame): DataFrame containing case contents data
+
+    Returns:
+        DataFrame: One row per item ('Item', 'Price'), sorted by price
+    """
+    items = case_contents_df[case_contents_df['sub_steam_price_en'] > 0]
+    labels = item_labels(items)
+
+    # The same item can appear in many cases; use its median listed price
+    price_table = items['sub_steam_price_en'].groupby(labels).median()
+
+    return pd.DataFrame({'Item': price_table.index, 'Price': price_table.to_numpy()}).sort_values('Price', ignore_index=True)
+
+
+def win_probability(chance, direction, roll_cdf=None):
+    """
+    Get the probability of winning an upgrade.
+
+    Args:
+        chance (float): Advertised chance, in %
+        direction (str): 'under' or 'over'
+        roll_cdf (callable, optional): CDF of the roll on [0, 100]. Defaults to a uniform roll
+
+    Returns:
+        float: Probability of winning
+    """
+    if roll_cdf is None:
+        return chance / 100
+    if direction == 'under':
+        return float(roll_cdf(chance))
+    return 1 - float(roll_cdf(100 - chance))
+
+
+def evaluate_upgrades(source_prices, target_prices, chance, direction='under', house_edge=DEFAULT_HOUSE_EDGE,
+                      roll_cdf=None):
+    """
+    Evaluate every (source, target) upgrade pair at a given chance and direction.
+
+    Args:
+        source_prices (ndarray): Prices of the source items
+        target_prices (ndarray): Prices of the target items
+        chance (float): Chance of the upgrade, in %
+        direction (str): 'under' or 'over'
+        house_edge (float): Share of the stake kept by the house
+        roll_cdf (callable, optional): CDF of the roll on [0, 100]
+
+    Returns:
+        dict: (sources x targets) arrays of feasibility, balance top-up, expected value,
+            variance and EV ratio (expected payout / stake)
+    """
+    p = win_probability(chance, direction, roll_cdf)
+    stake = chance / 100 * np.asarray(target_prices)[None, :] / (1 - house_edge)
+    sources = np.asarray(source_prices)[:, None]
+    targets = np.asarray(target_prices)[None, :]
+
+    return {
+        'feasible': (sources <= stake) & (targets > sources),
+        'balance': stake - sources,
+        'expected_value': np.broadcast_to(p * targets - stake, (len(source_prices), targets.shape[1])),
+        'variance': np.broadcast_to(p * (1 - p) * targets**2, (len(source_prices), targets.shape[1])),
+        'ev_ratio': np.broadcast_to(p * targets / stake, (len(source_prices), targets.shape[1]))
+    }
+
+
+def sweep_upgrades(price_table, chances=DEFAULT_CHANCES, directions=DIRECTIONS, house_edge=DEFAULT_HOUSE_EDGE,
+                   roll_cdf=None, top=20, rank='ev'):
+    """
+    Evaluate every (source item, target item, chance, direction) upgrade.
+
+    Args:
+        price_table (DataFrame): Output of build_item_price_table
+        chances (list): Chances to evaluate, in %
+        directions (list): Directions to evaluate
+        house_edge (float): Share of the stake kept by the house
+        roll_cdf (callable, optional): CDF of the roll on [0, 100]
+        top (int): Number of best combinations to keep
+        rank (str): Ranking of the best combinations (see UPGRADE_RANKINGS)
+
+    Returns:
+        tuple: (summary_df, top_df) - Statistics for each chance and direction, and the
+            best combinations by the ranking (ties broken by the smallest balance top-up). With
+            a uniform roll the directions are identical and reported once, as e.g. 'under/over'
+    """
+    prices = price_table['Price'].to_numpy(dtype=np.float64)
+    names = price_table['Item'].to_numpy()
+    rank_column, ascending = UPGRADE_RANKINGS[rank]
+
+    # (label, direction) of the evaluated directions
+    evaluated = [(direction, direction) for direction in directions]
+    if roll_cdf is None and len(directions) > 1:
+        evaluated = [('/'.join(directions), directions[0])]
+
+    summary = []
+    best = []
+    for chance in chances:
+        for label, direction in evaluated:
+            p = win_probability(chance, direction, roll_cdf)
+            stake = chance / 100 * prices / (1 - house_edge)
+
+            # Prices are sorted, so the feasible sources of each target (S <= stake and S < T)
+            # are a prefix of the table; the last one needs the smallest balance top-up
+            feasible_sources = np.minimum(np.searchsorted(prices, stake, side='right'),
+                                          np.searchsorted(prices, prices, side='left'))
+            best_source = np.maximum(feasible_sources - 1, 0)
+            best_balance = stake - prices[best_source]
+
+            # The expected value, variance and EV ratio of an upgrade only depend on its target
+            expected_value = p * prices - stake
+            variance = p * (1 - p) * prices**2
+            ev_ratio = np.divide(p * prices, stake, out=np.zeros_like(prices), where=stake > 0)
+            feasible_pairs = int(feasible_sources.sum())
+
+            summary.append({
+                'Chance (%)': chance,
+                'Direction': label,
+                'Win Probability (%)': p * 100,
+                'Feasible Pairs': feasible_pairs,
+                'Mean Expected Value': feasible_sources @ expected_value / feasible_pairs if feasible_pairs else None,
+                'Mean Standard Deviation': np.sqrt(feasible_sources @ variance / feasible_pairs) if feasible_pairs else None,
+                'Mean EV Ratio': feasible_sources @ ev_ratio / feasible_pairs if feasible_pairs else None
+            })
+
+            # Keep the best combinations for this chance and direction
+            candidates = np.flatnonzero(feasible_sources)
+            rank_values = {
+                'Expected Value': expected_value,
+                'EV Ratio': ev_ratio,
+                'Standard Deviation': variance,
+                'Balance Top-Up': best_balance
+            }[rank_column][candidates]
+            order = np.lexsort((best_balance[candidates], rank_values if ascending else -rank_values))[:top]
+            for target in candidates[order]:
+                source = best_source[target]
+                best.append({
+                    'Source Item': names[source],
+                    'Source Price': prices[source],
+                    'Target Item': names[target],
+                    'Target Price': prices[target],
+                    'Chance (%)': chance,
+                    'Direction': label,
+                    'Balance Top-Up': best_balance[target],
+                    'Expected Value': expected_value[target],
+                    'Standard Deviation': np.sqrt(variance[target]),
+                    'EV Ratio': ev_ratio[target]
+                })
+
+    top_df = pd.DataFrame(best)
+    if not top_df.empty:
+        top_df = top_df.sort_values([rank_column, 'Balance Top-Up'], ascending=[ascending, True]).head(top)
+
+    return pd.DataFrame(summary), top_df
+
+
+def chain_case_upgrade(distribution, price_table, chance, direction='under', house_edge=DEFAULT_HOUSE_EDGE,
+                       roll_cdf=None):
+    """
+    Evaluate opening a case and then upgrading the drop.
+
+    Each drop is upgraded to the cheapest item whose required stake at the given
+    chance covers the drop, so the balance top-up is as small as possible. Drops
+    with no such target are kept.
+
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        price_table (DataFrame): Output of build_item_price_table
+        chance (float): Chance of the upgrade, in %
+        direction (str): 'under' or 'over'
+        house_edge (float): Share of the stake kept by the house
+        roll_cdf (callable, optional): CDF of the roll on [0, 100]
+
+    Returns:
+        dict: Expected value, EV ratio, standard deviation and probability of profit of
+            the plain case and of the combined strategy
+    """
+    odds = distribution['odds']
+    values = distribution['prices']
+    case_price = distribution['case_price']
+    target_prices = price_table['Price'].to_numpy(dtype=np.float64)
+    p = win_probability(chance, direction, roll_cdf)
+
+    # Cheapest target whose stake covers the drop and is worth more than it
+    min_target = np.maximum(values * (1 - house_edge) * 100 / chance, np.nextafter(values, np.inf))
+    target_index = np.searchsorted(target_prices, min_target)
+    upgradable = target_index < len(target_prices)
+    targets = np.where(upgradable, target_prices[np.minimum(target_index, len(target_prices) - 1)], values)
+    balance = np.where(upgradable, chance / 100 * targets / (1 - house_edge) - values, 0.0)
+    win = np.where(upgradable, p, 1.0)
+
+    # Plain case
+    plain_ev = float(odds @ values)
+    plain_variance = float(odds @ values**2) - plain_ev**2
+
+    # Case then upgrade: pay the case and the top-up, get the target with probability win.
+    # The top-up depends on the drop, so the spread is that of win * target - top-up
+    cost = case_price + float(odds @ balance)
+    chained_ev = float(odds @ (win * targets))
+    chained_net = chained_ev - float(odds @ balance)
+    chained_variance = float(odds @ (win * (targets - balance)**2 + (1 - win) * balance**2)) - chained_net**2
+    chained_profitable = float(odds @ (win * (targets > case_price + balance)))
+
+    return {
+        'Case Name': distribution['case_name'],
+        'Case Price': case_price,
+        'Plain EV': plain_ev,
+        'Plain EV Ratio': plain_ev / case_price if case_price else None,
+        'Plain Std Dev': np.sqrt(max(plain_variance, 0)),
+        'Plain Profit Prob (%)': float(odds[values > case_price].sum()) * 100,
+        'Chained Cost': cost,
+        'Chained EV': chained_ev,
+        'Chained EV Ratio': chained_ev / cost if cost else None,
+        'Chained Std Dev': np.sqrt(max(chained_variance, 0)),
+        'Chained Profit Prob (%)': chained_profitable * 100
+    }
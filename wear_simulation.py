@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Wear (Float) Simulation
+
+Draws a float value for every simulated drop and prices it with an optional
+float-dependent price curve.
+
+The min and max columns of the case contents are the roll ticket range of
+each item (1 to 100000 over a case), not its wear range, so a drop's float is
+drawn uniformly within the standard range of its exterior: Factory New 0-0.07,
+Minimal Wear 0.07-0.15, Field-Tested 0.15-0.38, Well-Worn 0.38-0.45 and
+Battle-Scarred 0.45-1. The exterior is the one ending the item's display name
+(e.g. 'AK-47 | Redline (FT)'). Items without an exterior have no float and
+keep their price.
+
+Price curves multiply the price of a drop:
+- low-float: a premium for the best floats of each exterior,
+  1 + premium * (1 - position)^power, position going from 0 at the best
+  float of the exterior to 1 at the worst
+- points: a multiplier interpolated from (float, multiplier) points
+
+The floats of a batch of openings take one uniform draw and a few gathers
+and bincounts over the items already drawn, so they add little to the cost
+of the simulation.
+"""
+
+import numpy as np
+import pandas as pd
+
+from streaming_stats import RunningStats, quantiles_from_counts
+
+# Float range of each exterior (short name as in sub_steam_short_exterior)
+EXTERIOR_RANGES = {
+    'FN': (0.00, 0.07),
+    'MW': (0.07, 0.15),
+    'FT': (0.15, 0.38),
+    'WW': (0.38, 0.45),
+    'BS': (0.45, 1.00)
+}
+
+# Default exponent of the low-float premium: the premium fades quickly away from the best floats
+DEFAULT_PREMIUM_POWER = 4.0
+
+# Number of bins of the float histogram over 0-1
+FLOAT_BINS = 1000
+
+# Number of points used to average a price curve over an exterior range
+CURVE_GRID_POINTS = 10000
+
+
+def make_price_curve(premium=0.0, power=DEFAULT_PREMIUM_POWER, points=None):
+    """
+    Create a float-dependent price curve.
+
+    Args:
+        premium (float): Low-float premium at the best float of each exterior (0.5 = +50%)
+        power (float): Exponent of the low-float premium
+        points (DataFrame, optional): float and multiplier columns; replaces the low-float premium
+
+    Returns:
+        dict: The price curve
+    """
+    if points is not None:
+        points = points.sort_values('float')
+        return {'kind': 'points', 'floats': points['float'].to_numpy(dtype=np.float64),
+                'multipliers': points['multiplier'].to_numpy(dtype=np.float64)}
+    return {'kind': 'low-float', 'premium': float(premium), 'power': float(power)}
+
+
+def curve_multipliers(curve, floats, positions):
+    """
+    Get the price multipliers of drops.
+
+    Args:
+        curve (dict): Price curve (see make_price_curve)
+        floats (ndarray): Float of each drop
+        positions (ndarray): Position of each float within its exterior range, between 0 and 1
+
+    Returns:
+        ndarray: Price multiplier of each drop
+    """
+    if curve['kind'] == 'points':
+        return np.interp(floats, curve['floats'], curve['multipliers'])
+    if not curve['premium']:
+        return np.ones_like(floats)
+    return 1 + curve['premium'] * (1 - positions)**curve['power']
+
+
+def build_wear_model(distribution, curve=None):
+    """
+    Prepare the float range and expected price multiplier of every item of a distribution.
+
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        curve (dict, optional): Price curve (see make_price_curve). Defaults to no price change
+
+    Returns:
+        dict: Float range of each item (NaN without exterior), the curve and the expected
+            price multiplier of each item
+    """
+    curve = curve or make_price_curve()
+    exteriors = pd.Series([item.rsplit(' (', 1)[-1].rstrip(')') for item in distribution['items']], dtype=object)
+    low = exteriors.map(lambda exterior: EXTERIOR_RANGES.get(exterior, (np.nan, np.nan))[0]).to_numpy(dtype=np.float64)
+    high = exteriors.map(lambda exterior: EXTERIOR_RANGES.get(exterior, (np.nan, np.nan))[1]).to_numpy(dtype=np.float64)
+
+    # Average the curve over each exterior range on a midpoint grid
+    grid = (np.arange(CURVE_GRID_POINTS) + 0.5) / CURVE_GRID_POINTS
+    expected = {exterior: float(curve_multipliers(curve, lo + (hi - lo) * grid, grid).mean())
+                for exterior, (lo, hi) in EXTERIOR_RANGES.items()}
+    expected_multipliers = exteriors.map(expected).fillna(1.0).to_numpy(dtype=np.float64)
+
+    # Items without exterior get the code following the last exterior
+    exterior_codes = exteriors.map({exterior: code for code, exterior in enumerate(EXTERIOR_RANGES)})
+    exterior_codes = exterior_codes.fillna(len(EXTERIOR_RANGES)).to_numpy(dtype=np.int64)
+
+    return {
+        'curve': curve,
+        'low': np.nan_to_num(low),
+        'width': np.nan_to_num(high - low),
+        'has_float': ~np.isnan(low),
+        'exterior_codes': exterior_codes,
+        'expected_multipliers': expected_multipliers
+    }
+
+
+def float_adjusted_ev(distribution, wear_model):
+    """
+    Compute the exact expected value of a case with float-adjusted prices.
+
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        wear_model (dict): Output of build_wear_model
+
+    Returns:
+        float: Expected value of a drop
+    """
+    return float(distribution['odds'] @ (distribution['prices'] * wear_model['expected_multipliers']))
+
+
+class WearStats:
+    """
+    Draw the floats of batches of openings and keep running statistics of them.
+
+    Args:
+        distribution (dict): Distribution of the case (see case_sampling)
+        wear_model (dict): Output of build_wear_model
+    """
+
+    def __init__(self, distribution, wear_model):
+        self.distribution = distribution
+        self.model = wear_model
+        self.float_counts = np.zeros(FLOAT_BINS, dtype=np.int64)
+        self.exterior_counts = np.zeros(len(EXTERIOR_RANGES) + 1, dtype=np.int64)
+        self.exterior_sums = np.zeros(len(EXTERIOR_RANGES) + 1)
+        self.value_stats = RunningStats()
+
+    def update(self, item_indices, rng):
+        """
+        Draw the floats of a batch of openings.
+
+        Args:
+            item_indices (ndarray): Item drawn by each opening of the batch
+            rng (Generator): NumPy random generator
+        """
+        model = self.model
+        positions = rng.random(len(item_indices))
+        floats = model['low'][item_indices] + model['width'][item_indices] * positions
+        has_float = model['has_float'][item_indices]
+
+        values = self.distribution['prices'][item_indices] * np.where(
+            has_float, curve_multipliers(model['curve'], floats, positions), 1.0)
+        self.value_stats.update(values - self.distribution['case_price'])
+
+        bins = np.minimum((floats[has_float] * FLOAT_BINS).astype(np.int64), FLOAT_BINS - 1)
+        self.float_counts += np.bincount(bins, minlength=FLOAT_BINS)
+        exterior_codes = model['exterior_codes'][item_indices]
+        self.exterior_counts += np.bincount(exterior_codes, minlength=len(self.exterior_counts))
+        self.exterior_sums += np.bincount(exterior_codes, weights=floats, minlength=len(self.exterior_sums))
+
+    def summary(self):
+        """
+        Summarize the floats drawn so far.
+
+        Returns:
+            dict: Float quantiles, mean float and share of each exterior, and the simulated and
+                exact float-adjusted expected values
+        """
+        distribution = self.distribution
+        case_price = distribution['case_price']
+        with_float = int(self.float_counts.sum())
+        bin_centers = (np.arange(FLOAT_BINS) + 0.5) / FLOAT_BINS
+        quantiles = [np.nan] * 3
+        if with_float:
+            quantiles = quantiles_from_counts(bin_centers, self.float_counts, [0.05, 0.5, 0.95])
+
+        exterior_df = pd.DataFrame([{
+            'Exterior': exterior,
+            'Drops': count,
+            'Share (%)': count / with_float * 100 if with_float else 0.0,
+            'Mean Float': total / count if count else np.nan
+        } for exterior, count, total in zip(EXTERIOR_RANGES, self.exterior_counts, self.exterior_sums)])
+
+        mean_value = self.value_stats.mean + case_price
+        exact_ev = float_adjusted_ev(distribution, self.model)
+        return {
+            'drops_with_float': with_float,
+            'float_quantiles': dict(zip(['P5', 'Median', 'P95'], (float(q) for q in quantiles))),
+            'exteriors': exterior_df,
+            'float_histogram': (self.float_counts, np.linspace(0, 1, FLOAT_BINS + 1)),
+            'base_ev': float(distribution['odds'] @ distribution['prices']),
+            'float_adjusted_ev': exact_ev,
+            'simulated_mean_value': mean_value,
+            'std_value': float(np.sqrt(self.value_stats.variance)),
+            'float_adjusted_roi': (exact_ev - case_price) / case_price * 100 if case_price else 0.0,
+            'simulated_roi': (mean_value - case_price) / case_price * 100 if case_price else 0.0
+        }